@@ -3,40 +3,28 @@
 """
 from collections import Counter
 from datetime import datetime
-from typing import Iterable
+from typing import List, Tuple
 
 from fastapi import APIRouter, Depends
 
 from app.api.deps import get_current_active_user
+from app.core.config import settings
 from app.models.book import Book
 from app.models.interaction import Interaction, InteractionType
 from app.models.order import Order
 from app.models.user import User
 from app.schemas.analytics import UserBehaviorAnalytics
+from app.services.user_profiles import behavior_weight, load_profile_favorites
 
 router = APIRouter()
 
 
-def _extract_metadata_value(metadata, field: str, default=0):
-    """Безопасно извлекает значение из метаданных взаимодействия."""
-
-    if metadata is None:
-        return default
-    value = getattr(metadata, field, default)
-    if value is None and isinstance(metadata, dict):
-        return metadata.get(field, default)
-    return value or default
-
-
-@router.get("/user-behavior", response_model=UserBehaviorAnalytics)
-async def get_user_behavior_analytics(
-    current_user: User = Depends(get_current_active_user),
-):
-    """Возвращает агрегированную статистику поведения текущего пользователя."""
+async def _scan_favorites(user: User) -> Tuple[List[str], List[str]]:
+    """Любимые жанры и авторы по полной истории взаимодействий пользователя."""
 
     interactions = await Interaction.find(
         {
-            "user_id": current_user.id,
+            "user_id": user.id,
             "interaction_type": {
                 "$in": [
                     InteractionType.LIKE.value,
@@ -61,25 +49,27 @@ async def get_user_behavior_analytics(
         if not book:
             continue
 
-        weight = 1.0
-        if interaction.interaction_type == InteractionType.PURCHASE:
-            weight = max(_extract_metadata_value(interaction.metadata, "quantity", 1), 1)
-        elif interaction.interaction_type == InteractionType.LIKE:
-            weight = 1.5
-        elif interaction.interaction_type == InteractionType.ADD_TO_CART:
-            weight = _extract_metadata_value(interaction.metadata, "quantity", 1)
-        elif interaction.interaction_type == InteractionType.VIEW:
-            duration = _extract_metadata_value(interaction.metadata, "duration", 0)
-            weight = max(min(duration / 120.0, 1.0), 0.2)
-        elif interaction.interaction_type == InteractionType.REVIEW:
-            rating = _extract_metadata_value(interaction.metadata, "rating", 0)
-            weight = max(float(rating), 1.0)
-
+        weight = behavior_weight(interaction)
         genre_counter[book.genre] += weight
         author_counter[book.author] += weight
 
     favorite_genres = [genre for genre, _ in genre_counter.most_common(5)]
     favorite_authors = [author for author, _ in author_counter.most_common(5)]
+    return favorite_genres, favorite_authors
+
+
+@router.get("/user-behavior", response_model=UserBehaviorAnalytics)
+async def get_user_behavior_analytics(
+    current_user: User = Depends(get_current_active_user),
+):
+    """Возвращает агрегированную статистику поведения текущего пользователя."""
+
+    if settings.USER_PROFILES_MODE == "profiles":
+        favorite_genres, favorite_authors = await load_profile_favorites(
+            current_user.id, top_n=5, behavior=True
+        )
+    else:
+        favorite_genres, favorite_authors = await _scan_favorites(current_user)
 
     orders = await Order.find(Order.user_id == current_user.id).to_list()
     total_orders = len(orders)
@@ -3,7 +3,7 @@ API endpoints для работы с книгами: список, поиск, 
 """
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
 from beanie import PydanticObjectId
 
 from app.api.deps import get_current_admin_user, get_current_user
@@ -15,6 +15,10 @@ from app.schemas.book import (
     BookListResponse,
     BookUpdate,
 )
+from app.services import similar_books
+from app.services.catalog_top_lists import catalog_top_lists
+from app.services.content_index import content_index
+from app.services.trending_stream import trending_stream
 
 router = APIRouter()
 
@@ -105,6 +109,24 @@ def _compose_filter_query(conditions: List[Dict[str, Any]]) -> Dict[str, Any]:
     return {"$and": conditions}
 
 
+async def _refresh_content_index(book: Optional[Book] = None, book_id: Optional[str] = None):
+    """Применяет изменение каталога к in-memory индексам и trending-счётчикам."""
+
+    if book is not None:
+        trending_stream.set_rating(str(book.id), book.average_rating)
+        catalog_top_lists.upsert(book)
+    elif book_id is not None:
+        trending_stream.remove_book(book_id)
+        catalog_top_lists.remove(book_id)
+
+    if book is not None:
+        content_index.upsert(book)
+    elif book_id is not None:
+        content_index.remove(book_id)
+    # Переобучение словаря TF-IDF – в фоне, вне запроса
+    content_index.schedule_refit()
+
+
 # --------------------------------------------------------------------------- #
 #                                 ENDPOINTS                                   #
 # --------------------------------------------------------------------------- #
@@ -338,18 +360,25 @@ async def get_book(book_id: str):
 
 @router.post("/", response_model=BookSchema, status_code=status.HTTP_201_CREATED)
 async def create_book(
-    book_data: BookCreate, current_user=Depends(get_current_admin_user)
+    book_data: BookCreate,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_admin_user),
 ):
     """Создаёт новую книгу (только для администратора)."""
 
     book = Book(**book_data.model_dump())
     await book.insert()
+    await _refresh_content_index(book=book)
+    background_tasks.add_task(similar_books.refresh_book, str(book.id))
     return book
 
 
 @router.put("/{book_id}", response_model=BookSchema)
 async def update_book(
-    book_id: str, book_update: BookUpdate, current_user=Depends(get_current_admin_user)
+    book_id: str,
+    book_update: BookUpdate,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_admin_user),
 ):
     """Обновляет книгу (только для администратора)."""
 
@@ -365,11 +394,17 @@ async def update_book(
         setattr(book, field, value)
 
     await book.save()
+    await _refresh_content_index(book=book)
+    background_tasks.add_task(similar_books.refresh_book, book_id)
     return book
 
 
 @router.delete("/{book_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_book(book_id: str, current_user=Depends(get_current_admin_user)):
+async def delete_book(
+    book_id: str,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_admin_user),
+):
     """Удаляет книгу (только для администратора)."""
 
     book = await Book.get(book_id)
@@ -380,5 +415,7 @@ async def delete_book(book_id: str, current_user=Depends(get_current_admin_user)
         )
 
     await book.delete()
+    await _refresh_content_index(book_id=str(book.id))
+    background_tasks.add_task(similar_books.remove_book, str(book.id))
     return None
 
@@ -17,6 +17,7 @@ from app.schemas.cart import (
     CartUpdateRequest,
     CartItemResponse,
 )
+from app.services.interaction_events import on_interaction_created
 
 router = APIRouter()
 
@@ -82,6 +83,7 @@ async def _create_interaction(
         metadata=metadata,
     )
     await interaction.insert()
+    await on_interaction_created(interaction)
 
 
 @router.get("/", response_model=CartResponse)
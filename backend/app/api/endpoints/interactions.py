@@ -18,6 +18,13 @@ from app.api.deps import (
     get_current_active_user,
     get_current_admin_user,
 )
+from app.services.catalog_top_lists import catalog_top_lists
+from app.services.content_index import content_index
+from app.services.trending_stream import trending_stream
+from app.services.interaction_events import (
+    on_interaction_created,
+    on_interaction_deleted,
+)
 
 router = APIRouter()
 
@@ -74,6 +81,9 @@ async def create_interaction(
             ratings.append(rating)
             book.average_rating = sum(ratings) / len(ratings)
             await book.save()
+            content_index.set_rating(str(book.id), book.average_rating)
+            trending_stream.set_rating(str(book.id), book.average_rating)
+            catalog_top_lists.upsert(book)
     
     # Создаем взаимодействие
     interaction = Interaction(
@@ -84,6 +94,7 @@ async def create_interaction(
     )
     
     await interaction.insert()
+    await on_interaction_created(interaction)
     return interaction
 
 
@@ -242,6 +253,7 @@ async def toggle_like(
     if existing_like:
         # Удаляем лайк
         await existing_like.delete()
+        await on_interaction_deleted(existing_like)
         # Возвращаем пустой ответ с кодом 204 (No Content)
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
@@ -253,6 +265,7 @@ async def toggle_like(
             metadata={}
         )
         await interaction.insert()
+        await on_interaction_created(interaction)
         return interaction
 
 
@@ -20,6 +20,7 @@ from app.schemas.order import (
     ShippingAddressSchema,
     OrderStatusUpdateRequest,
 )
+from app.services.interaction_events import on_interaction_created
 
 router = APIRouter()
 
@@ -59,7 +60,7 @@ def _order_to_response(order: Order) -> OrderResponse:
 async def _log_purchase_interaction(user_id, item: OrderItem) -> None:
     """Фиксирует факт покупки в коллекции взаимодействий."""
 
-    await Interaction(
+    interaction = Interaction(
         user_id=user_id,
         book_id=item.book_id,
         interaction_type=InteractionType.PURCHASE,
@@ -67,7 +68,9 @@ async def _log_purchase_interaction(user_id, item: OrderItem) -> None:
             "quantity": item.quantity,
             "price_at_purchase": item.price_at_purchase,
         },
-    ).insert()
+    )
+    await interaction.insert()
+    await on_interaction_created(interaction)
 
 
 @router.post("/", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
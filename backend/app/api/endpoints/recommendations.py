@@ -1,17 +1,32 @@
 """
 API endpoints для получения рекомендаций.
 """
-from typing import List, Optional
+from typing import Dict, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from app.models.book import Book
 from app.models.user import User
 from app.models.interaction import Interaction, InteractionType
 from app.schemas.book import Book as BookSchema
-from app.api.deps import get_current_user, get_current_active_user
+from app.schemas.recommendation import BatchRecommendationItem, BatchRecommendationRequest
+from app.api.deps import get_current_user, get_current_active_user, get_current_admin_user
+from app.services.catalog_top_lists import catalog_top_lists
+from app.services.content_index import content_index
+from app.services.interaction_model import interaction_model
+from app.services.preference_writer import preference_writer
+from app.services.recommendation_cache import recommendation_cache
 from app.services.recommendation_engine import RecommendationEngine
+from app.services.trending_stream import trending_stream
 
 router = APIRouter()
-recommendation_engine = RecommendationEngine()
+recommendation_engine = RecommendationEngine(
+    interaction_model=interaction_model,
+    content_index=content_index,
+    trending_stream=trending_stream,
+    recommendation_cache=recommendation_cache,
+    catalog_top_lists=catalog_top_lists,
+    preference_writer=preference_writer,
+)
 
 
 @router.get("/for-you", response_model=List[BookSchema])
@@ -131,3 +146,35 @@ async def get_new_books(
     new_books = await recommendation_engine.get_new_books(limit=limit, user=user)
     return new_books
 
+
+
+@router.get("/admin/cache-stats", response_model=Dict[str, int])
+async def get_recommendation_cache_stats(
+    current_user: User = Depends(get_current_admin_user),
+):
+    """
+    Возвращает счётчики кэша персональных рекомендаций (только для админа).
+    """
+
+    return recommendation_cache.stats()
+
+
+@router.post("/admin/batch")
+async def get_batch_recommendations(
+    payload: BatchRecommendationRequest,
+    current_user: User = Depends(get_current_admin_user),
+):
+    """
+    Персональные рекомендации для списка пользователей (только для админа).
+
+    Ответ – NDJSON: по строке `BatchRecommendationItem` на пользователя в порядке
+    запроса. Строки отправляются по мере расчёта блоков пользователей.
+    """
+
+    async def lines():
+        async for user_id, book_ids in recommendation_engine.iter_batch_recommendations(
+            payload.user_ids, limit=payload.limit
+        ):
+            yield BatchRecommendationItem(user_id=user_id, book_ids=book_ids).model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
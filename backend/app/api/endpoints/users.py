@@ -8,6 +8,8 @@ from app.models.interaction import Interaction
 from app.schemas.user import User as UserSchema, UserUpdate, UserPreferences, UserListResponse
 from app.schemas.interaction import Interaction as InteractionSchema
 from app.api.deps import get_current_user, get_current_active_user, get_current_admin_user
+from app.services.preference_writer import preference_writer
+from app.services.recommendation_cache import recommendation_cache
 
 router = APIRouter()
 
@@ -76,6 +78,10 @@ async def update_user(
         setattr(user, field, value)
     
     await user.save()
+    # Заданные пользователем предпочтения важнее выведенных из взаимодействий
+    preference_writer.discard(str(user.id))
+    # Профиль влияет на персональные рекомендации
+    await recommendation_cache.invalidate_user(str(user.id))
     return user
 
 
@@ -156,6 +162,10 @@ async def update_user_preferences(
     user.favorite_authors = preferences.favorite_authors
     
     await user.save()
+    # Заданные пользователем предпочтения важнее выведенных из взаимодействий
+    preference_writer.discard(str(user.id))
+    # Профиль влияет на персональные рекомендации
+    await recommendation_cache.invalidate_user(str(user.id))
     return user
 
 
@@ -245,6 +255,10 @@ async def admin_update_user(
         setattr(user, field, value)
 
     await user.save()
+    # Заданные пользователем предпочтения важнее выведенных из взаимодействий
+    preference_writer.discard(str(user.id))
+    # Профиль влияет на персональные рекомендации
+    await recommendation_cache.invalidate_user(str(user.id))
     return user
 
 
@@ -31,6 +31,88 @@ class Settings(BaseSettings):
     )
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Recommendations
+    # Режим collaborative filtering: "user" (user-based), "item" (item-based)
+    # или "als" (матричная факторизация)
+    RECOMMENDATION_CF_MODE: str = "user"
+    ITEM_NEIGHBORS_PATH: str = "data/item_neighbors.npz"
+    ITEM_NEIGHBORS_K: int = 50
+    # Implicit ALS: число факторов, итераций, регуляризация и масштаб уверенности
+    ALS_MODEL_PATH: str = "data/als_model.npz"
+    ALS_FACTORS: int = 32
+    ALS_ITERATIONS: int = 15
+    ALS_REGULARIZATION: float = 0.1
+    ALS_ALPHA: float = 10.0
+    # Поиск кандидатов для /for-you (ALS) и /similar: "exact" – полный перебор,
+    # "ivf" – приближённый индекс
+    ANN_MODE: str = "exact"
+    # Число списков IVF (0 – √n) и число просматриваемых списков: больше – выше
+    # полнота и дольше запрос
+    ANN_LISTS: int = 0
+    ANN_PROBES: int = 8
+    # Максимум соседей, загружаемых для user-based CF без in-memory модели
+    CF_MAX_NEIGHBOURS: int = 500
+    # Число похожих книг, хранимых в коллекции similar_books
+    SIMILAR_BOOKS_LIMIT: int = 50
+    # Число процессов для пакетного пересчёта (0 – по числу ядер)
+    SIMILAR_BOOKS_WORKERS: int = 0
+    # Число книг, хранимых в коллекции user_recommendations (с запасом на
+    # покупки после расчёта), и число блоков, считаемых параллельно (0 – по числу ядер)
+    USER_RECOMMENDATIONS_LIMIT: int = 60
+    USER_RECOMMENDATIONS_WORKERS: int = 0
+    # Старше этого возраста (часы) материализованные рекомендации не используются
+    USER_RECOMMENDATIONS_MAX_AGE_HOURS: int = 36
+    # Источник трендов: "scan" (сырые взаимодействия), "rollups" (buckets)
+    # или "stream" (затухающие счётчики в памяти)
+    TRENDING_MODE: str = "scan"
+    # Размер bucket'а агрегатов трендов в часах
+    TRENDING_BUCKET_HOURS: int = 1
+    # Период полураспада потокового trending-счётчика в часах
+    TRENDING_HALF_LIFE_HOURS: float = 24.0
+    # Интервал записи приращений потоковых счётчиков в MongoDB и чтения общих
+    # значений (секунды) – за это время записи воркера видят остальные воркеры
+    TRENDING_SNAPSHOT_SECONDS: int = 15
+    # Списки лучших книг в памяти: длина для жанров и всего каталога, для авторов
+    # и интервал полного перестроения (секунды)
+    CATALOG_TOP_LIST_SIZE: int = 150
+    CATALOG_TOP_AUTHOR_LIST_SIZE: int = 30
+    CATALOG_TOP_LISTS_REFRESH_SECONDS: int = 600
+    # Источник любимых жанров и авторов: "scan" (история взаимодействий) или
+    # "profiles" (счётчики user_profiles; перед включением –
+    # python -m app.services.user_profiles)
+    USER_PROFILES_MODE: str = "scan"
+    # Окно накопления отложенной записи выведенных предпочтений (секунды)
+    PREFERENCE_WRITE_INTERVAL_SECONDS: float = 1.0
+    # Кэш персональных рекомендаций: максимум записей и время жизни (секунды)
+    RECOMMENDATION_CACHE_SIZE: int = 10000
+    RECOMMENDATION_CACHE_TTL_SECONDS: int = 300
+    # Поколения записей кэша в MongoDB: запись пользователя сбрасывается во всех
+    # воркерах (ценой одного чтения по индексу на попадание); при одном воркере
+    # можно выключить
+    RECOMMENDATION_CACHE_SHARED_GENERATIONS: bool = True
+    # Исполнитель CPU-стадий: "thread", "process" или "inline"
+    RECOMMENDATION_EXECUTOR: str = "thread"
+    # Число потоков/процессов исполнителя (0 – по числу ядер)
+    RECOMMENDATION_EXECUTOR_WORKERS: int = 0
+    # Бюджет времени (сек) на каждый источник cold-start подборки
+    COLD_START_SOURCE_TIMEOUT_SECONDS: float = 0.5
+    # Пакетные рекомендации: пользователей в одном блоке матричного расчёта
+    # (пиковая память – блок × число книг float64)
+    RECOMMENDATION_BATCH_BLOCK_SIZE: int = 256
+
+    # Снимки моделей на диске (общие для воркеров через memmap); пустая строка – выключено
+    MODEL_SNAPSHOT_DIR: str = "data/models"
+    # Сколько версий снимка хранить
+    MODEL_SNAPSHOT_KEEP: int = 3
+    # Период проверки новой версии снимка (сек)
+    MODEL_SNAPSHOT_POLL_SECONDS: int = 30
+    # Размер пакета чтения из MongoDB при построении моделей
+    MODEL_BUILD_BATCH_SIZE: int = 5000
+    # Период дочитывания взаимодействий других воркеров в модель (сек) и
+    # перекрытие окна чтения на случай записей с запаздывающим timestamp
+    INTERACTION_SYNC_SECONDS: int = 10
+    INTERACTION_SYNC_OVERLAP_SECONDS: int = 60
     
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = Field(
@@ -9,7 +9,15 @@ from app.models.book import Book
 from app.models.interaction import Interaction, InteractionType
 from app.models.cart import Cart
 from app.models.order import Order
+from app.models.recommendation_generation import RecommendationGeneration
+from app.models.similar_books import SimilarBooks
+from app.models.trending_bucket import TrendingBucket
+from app.models.trending_score import TrendingScore
+from app.models.user_profile import UserProfile
+from app.models.user_recommendations import UserRecommendations
 from app.core.security import get_password_hash
+from app.services.trending_rollups import rebuild_trending_buckets
+from app.services.user_profiles import rebuild_user_profiles
 import random
 
 fake = Faker("ru_RU")
@@ -61,6 +69,32 @@ async def create_indexes():
 
     # Индексы для Cart
     await Cart.get_motor_collection().create_index("user_id", unique=True)
+
+    # Индексы для материализованных похожих книг
+    similar_collection = SimilarBooks.get_motor_collection()
+    await similar_collection.create_index("book_id", unique=True)
+    await similar_collection.create_index("neighbors.book_id")
+
+    # Индексы для агрегатов трендов
+    trending_collection = TrendingBucket.get_motor_collection()
+    await trending_collection.create_index([("book_id", 1), ("bucket", 1)], unique=True)
+    await trending_collection.create_index("bucket")
+
+    # Индексы для общих потоковых trending-счётчиков (документ на книгу и эпоху)
+    trending_scores = TrendingScore.get_motor_collection()
+    await trending_scores.create_index([("book_id", 1), ("epoch", 1)], unique=True)
+    await trending_scores.create_index("epoch")
+
+    # Индексы для материализованных персональных рекомендаций
+    user_recommendations_collection = UserRecommendations.get_motor_collection()
+    await user_recommendations_collection.create_index("user_id", unique=True)
+    await user_recommendations_collection.create_index("updated_at")
+
+    # Индексы для профилей предпочтений
+    await UserProfile.get_motor_collection().create_index("user_id", unique=True)
+
+    # Индекс для поколений кэша персональных рекомендаций
+    await RecommendationGeneration.get_motor_collection().create_index("user_id", unique=True)
     
     print("✅ Индексы созданы")
 
@@ -169,6 +203,12 @@ async def init_db():
     
     await Interaction.insert_many(interactions)
     print(f"✅ Создано {len(interactions)} взаимодействий")
+
+    # Тестовые взаимодействия вставлены напрямую, минуя обработчики событий
+    buckets = await rebuild_trending_buckets()
+    print(f"✅ Создано {buckets} агрегатов трендов")
+    profiles = await rebuild_user_profiles()
+    print(f"✅ Создано {profiles} профилей пользователей")
     
     print("\n🎉 База данных успешно инициализирована!")
     print(f"   Пользователей: {len(users)}")
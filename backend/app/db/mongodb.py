@@ -10,6 +10,12 @@ from app.models.book import Book
 from app.models.interaction import Interaction
 from app.models.cart import Cart
 from app.models.order import Order
+from app.models.recommendation_generation import RecommendationGeneration
+from app.models.similar_books import SimilarBooks
+from app.models.trending_bucket import TrendingBucket
+from app.models.trending_score import TrendingScore
+from app.models.user_profile import UserProfile
+from app.models.user_recommendations import UserRecommendations
 
 
 class MongoDB:
@@ -32,7 +38,19 @@ async def connect_to_mongo():
     # Инициализация Beanie с моделями
     await init_beanie(
         database=mongodb.database,
-        document_models=[User, Book, Interaction, Cart, Order]
+        document_models=[
+            User,
+            Book,
+            Interaction,
+            Cart,
+            Order,
+            SimilarBooks,
+            TrendingBucket,
+            TrendingScore,
+            UserRecommendations,
+            UserProfile,
+            RecommendationGeneration,
+        ]
     )
     print(f"✅ Подключено к MongoDB: {settings.DATABASE_NAME}")
 
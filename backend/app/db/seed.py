@@ -15,7 +15,10 @@ from app.models.book import Book
 from app.models.cart import Cart
 from app.models.interaction import Interaction, InteractionType
 from app.models.order import Order, OrderItem, OrderStatus, ShippingAddress
+from app.models.trending_score import TrendingScore
 from app.models.user import User
+from app.services.trending_rollups import rebuild_trending_buckets
+from app.services.user_profiles import rebuild_user_profiles
 
 fake = Faker()
 
@@ -54,6 +57,8 @@ async def wipe_collections():
     await Interaction.get_motor_collection().delete_many({})
     await Order.get_motor_collection().delete_many({})
     await Cart.get_motor_collection().delete_many({})
+    # Общие потоковые счётчики трендов заново строятся из новых взаимодействий
+    await TrendingScore.get_motor_collection().delete_many({})
 
 
 def generate_users(count: int) -> list[User]:
@@ -210,12 +215,23 @@ async def seed():
     users = generate_users(user_count)
     books = generate_books(book_count)
 
-    await User.insert_many(users)
-    await Book.insert_many(books)
+    user_result = await User.insert_many(users)
+    book_result = await Book.insert_many(books)
+    # insert_many не проставляет id объектам, а они нужны взаимодействиям и заказам
+    for user, user_id in zip(users, user_result.inserted_ids):
+        user.id = user_id
+    for book, book_id in zip(books, book_result.inserted_ids):
+        book.id = book_id
 
     await generate_interactions(users, books, interaction_count)
     await generate_orders(users, books)
 
+    # Взаимодействия вставлены напрямую, минуя обработчики событий
+    buckets = await rebuild_trending_buckets()
+    print(f"✅ Создано {buckets} агрегатов трендов")
+    profiles = await rebuild_user_profiles()
+    print(f"✅ Создано {profiles} профилей пользователей")
+
     print(
         f"🎉 Seed завершён: users={user_count}, books={book_count}, interactions={interaction_count}"
     )
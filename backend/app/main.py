@@ -1,8 +1,22 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.db.mongodb import connect_to_mongo, close_mongo_connection
+from app.models.interaction import Interaction
+from app.models.trending_bucket import TrendingBucket
+from app.models.user_profile import UserProfile
+from app.services.als_model import ALSModel, load_als_model
+from app.services.catalog_top_lists import catalog_top_lists
+from app.services.compute_pool import compute_pool
+from app.services.content_index import content_index
+from app.services.interaction_model import interaction_model
+from app.services.item_neighbors import ItemNeighborTable, load_item_neighbors
+from app.services.model_snapshot import ModelSnapshot, open_current, watch_snapshots
+from app.services.preference_writer import preference_writer
+from app.services.recommendation_cache import recommendation_cache
+from app.services.trending_stream import trending_stream
 from app.api.endpoints import (
     auth,
     users,
@@ -15,6 +29,44 @@ from app.api.endpoints import (
 )
 
 
+async def load_snapshot_models(snapshot: ModelSnapshot) -> None:
+    """Переключает модели воркера на версию снимка."""
+
+    await interaction_model.load_snapshot(snapshot)
+    content_index.load_snapshot(snapshot)
+    if settings.RECOMMENDATION_CF_MODE == "item":
+        recommendations.recommendation_engine.item_neighbors = (
+            ItemNeighborTable.from_snapshot(snapshot) or load_item_neighbors()
+        )
+    elif settings.RECOMMENDATION_CF_MODE == "als":
+        recommendations.recommendation_engine.als_model = (
+            ALSModel.from_snapshot(snapshot) or load_als_model()
+        )
+
+
+async def warn_unbuilt_aggregates() -> None:
+    """Предупреждает, если включённые агрегаты не построены по взаимодействиям.
+
+    Обработчики событий поддерживают агрегаты только для новых записей;
+    взаимодействия, загруженные в обход API, требуют полной пересборки.
+    """
+
+    if not await Interaction.get_motor_collection().find_one({}, {"_id": 1}):
+        return
+    if settings.TRENDING_MODE == "rollups":
+        if not await TrendingBucket.get_motor_collection().find_one({}, {"_id": 1}):
+            print(
+                "⚠️  TRENDING_MODE=rollups, но агрегаты трендов пусты – "
+                "выполните python -m app.services.trending_rollups"
+            )
+    if settings.USER_PROFILES_MODE == "profiles":
+        if not await UserProfile.get_motor_collection().find_one({}, {"_id": 1}):
+            print(
+                "⚠️  USER_PROFILES_MODE=profiles, но профили пользователей пусты – "
+                "выполните python -m app.services.user_profiles"
+            )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -23,8 +75,56 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     await connect_to_mongo()
+    await warn_unbuilt_aggregates()
+    # Пул для CPU-стадий рекомендаций (скоринг вне event loop)
+    compute_pool.start()
+    # Модель взаимодействий загружается один раз и далее обновляется дельтами.
+    # Если опубликован снимок (python -m app.services.build_models), матрицы
+    # отображаются из него в память и делятся всеми воркерами хоста
+    snapshot = open_current() if settings.MODEL_SNAPSHOT_DIR else None
+    if snapshot is not None:
+        await load_snapshot_models(snapshot)
+    else:
+        await interaction_model.load()
+        await content_index.load()
+        if settings.RECOMMENDATION_CF_MODE == "item":
+            # Таблица соседей строится офлайн: python -m app.services.item_neighbors
+            recommendations.recommendation_engine.item_neighbors = load_item_neighbors()
+        elif settings.RECOMMENDATION_CF_MODE == "als":
+            # Факторы обучаются офлайн: python -m app.services.als_model
+            recommendations.recommendation_engine.als_model = load_als_model()
+    # Записи других воркеров дочитываются в модель периодически
+    sync_task = asyncio.create_task(interaction_model.run_sync())
+    watch_task = None
+    if settings.MODEL_SNAPSHOT_DIR:
+        watch_task = asyncio.create_task(
+            watch_snapshots(load_snapshot_models, snapshot.version if snapshot else None)
+        )
+    # Списки лучших книг жанров и авторов для cold-start и жанровых подборок
+    await catalog_top_lists.load()
+    top_lists_task = asyncio.create_task(catalog_top_lists.run_refresh())
+    # Выведенные предпочтения пишутся в фоне, а не на пути GET-запросов
+    preference_writer.start()
+    snapshot_task = None
+    if settings.TRENDING_MODE == "stream":
+        await trending_stream.load()
+        snapshot_task = asyncio.create_task(trending_stream.run_snapshots())
     yield
     # Shutdown
+    sync_task.cancel()
+    if watch_task is not None:
+        watch_task.cancel()
+    top_lists_task.cancel()
+    await preference_writer.stop()
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+        await trending_stream.snapshot()
+        trending_stream.clear()
+    interaction_model.clear()
+    content_index.clear()
+    catalog_top_lists.clear()
+    recommendation_cache.clear()
+    compute_pool.shutdown()
     await close_mongo_connection()
 
 
@@ -59,5 +59,6 @@ class Interaction(Document):
             [("timestamp", -1)],
             [("user_id", 1), ("book_id", 1)],
             [("user_id", 1), ("book_id", 1), ("interaction_type", 1)],
+            [("book_id", 1), ("interaction_type", 1)],
         ]
 
@@ -0,0 +1,25 @@
+"""
+Модель поколения кэша персональных рекомендаций пользователя.
+"""
+from datetime import datetime
+
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import Field
+
+
+class RecommendationGeneration(Document):
+    """Счётчик инвалидаций кэша рекомендаций пользователя, общий для воркеров.
+
+    Любой воркер увеличивает `generation` через `$inc` при записи, влияющей на
+    рекомендации пользователя; запись кэша с другим поколением устарела.
+    """
+
+    user_id: Indexed(PydanticObjectId, unique=True)
+    generation: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "recommendation_generations"
+        indexes = [
+            [("user_id", 1)],
+        ]
@@ -0,0 +1,30 @@
+"""
+Модель материализованного списка похожих книг.
+"""
+from datetime import datetime
+from typing import List
+
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import BaseModel, Field
+
+
+class SimilarBookEntry(BaseModel):
+    """Похожая книга и её score."""
+
+    book_id: PydanticObjectId
+    score: float
+
+
+class SimilarBooks(Document):
+    """Top-N похожих книг для одной книги (отсортировано по убыванию score)."""
+
+    book_id: Indexed(PydanticObjectId, unique=True)
+    neighbors: List[SimilarBookEntry] = Field(default_factory=list)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "similar_books"
+        indexes = [
+            [("book_id", 1)],
+            [("neighbors.book_id", 1)],
+        ]
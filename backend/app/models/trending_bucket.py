@@ -0,0 +1,25 @@
+"""
+Модель агрегированной активности по книге за временной интервал (bucket).
+"""
+from datetime import datetime
+from typing import Dict
+
+from beanie import Document, PydanticObjectId
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class TrendingBucket(Document):
+    """Сумма весов и счётчики взаимодействий с книгой за один bucket."""
+
+    book_id: PydanticObjectId
+    bucket: datetime  # начало интервала (UTC)
+    score: float = 0.0  # сумма положительных базовых весов взаимодействий
+    counts: Dict[str, int] = Field(default_factory=dict)  # тип → количество
+
+    class Settings:
+        name = "trending_buckets"
+        indexes = [
+            IndexModel([("book_id", ASCENDING), ("bucket", ASCENDING)], unique=True),
+            [("bucket", 1)],
+        ]
@@ -0,0 +1,29 @@
+"""
+Модель общего потокового trending-счётчика книги.
+"""
+from datetime import datetime
+
+from beanie import Document, PydanticObjectId
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class TrendingScore(Document):
+    """Экспоненциально затухающий score книги в масштабе эпохи `epoch`.
+
+    Воркеры прибавляют к `score` свои приращения через `$inc`; значение на
+    момент t равно score · e^{−λ(t − epoch)}.
+    """
+
+    book_id: PydanticObjectId
+    epoch: datetime
+    score: float = 0.0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "trending_scores"
+        indexes = [
+            IndexModel([("book_id", ASCENDING), ("epoch", ASCENDING)], unique=True),
+            [("epoch", 1)],
+            [("updated_at", -1)],
+        ]
@@ -0,0 +1,31 @@
+"""
+Модель инкрементального профиля предпочтений пользователя.
+"""
+from datetime import datetime
+from typing import Dict
+
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import Field
+
+
+class UserProfile(Document):
+    """Взвешенные счётчики жанров и авторов по взаимодействиям пользователя.
+
+    Ключи – жанры и авторы, экранированные для имён полей MongoDB
+    (см. app.services.user_profiles).
+    """
+
+    user_id: Indexed(PydanticObjectId, unique=True)
+    # Веса движка рекомендаций (interaction_weight)
+    genres: Dict[str, float] = Field(default_factory=dict)
+    authors: Dict[str, float] = Field(default_factory=dict)
+    # Веса аналитики поведения (/analytics/user-behavior)
+    behavior_genres: Dict[str, float] = Field(default_factory=dict)
+    behavior_authors: Dict[str, float] = Field(default_factory=dict)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "user_profiles"
+        indexes = [
+            [("user_id", 1)],
+        ]
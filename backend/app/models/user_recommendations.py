@@ -0,0 +1,32 @@
+"""
+Модель материализованных персональных рекомендаций.
+"""
+from datetime import datetime
+from typing import List
+
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import BaseModel, Field
+
+
+class RecommendedBookEntry(BaseModel):
+    """Рекомендованная книга и её score."""
+
+    book_id: PydanticObjectId
+    score: float
+
+
+class UserRecommendations(Document):
+    """Top-N рекомендаций одного пользователя (отсортировано по убыванию score)."""
+
+    user_id: Indexed(PydanticObjectId, unique=True)
+    books: List[RecommendedBookEntry] = Field(default_factory=list)
+    # Рекомендации учитывают взаимодействия до этого момента
+    generated_at: datetime
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "user_recommendations"
+        indexes = [
+            [("user_id", 1)],
+            [("updated_at", 1)],
+        ]
@@ -0,0 +1,17 @@
+"""
+Схемы для пакетных рекомендаций.
+"""
+from typing import List
+from pydantic import BaseModel, Field
+
+
+class BatchRecommendationRequest(BaseModel):
+    """Запрос персональных рекомендаций для списка пользователей."""
+    user_ids: List[str] = Field(..., min_length=1)
+    limit: int = Field(10, ge=1, le=50)
+
+
+class BatchRecommendationItem(BaseModel):
+    """Рекомендации одного пользователя (строка NDJSON-ответа)."""
+    user_id: str
+    book_ids: List[str]
@@ -0,0 +1,354 @@
+"""
+Матричная факторизация (ALS) по неявной обратной связи.
+
+Модель обучается офлайн на весах взаимодействий (`interaction_weight`) по
+схеме Hu, Koren, Volinsky: предпочтение p = [w > 0], уверенность c = 1 + α·w.
+Факторы пользователей и книг хранятся в float32, поэтому score всех книг для
+пользователя – одно произведение item_factors @ u, т.е. O(k × книги) при
+небольшом k, независимо от числа пользователей.
+
+Пользователи, появившиеся после обучения (или с более свежими
+взаимодействиями), получают факторы через fold-in: один шаг ALS по их
+взаимодействиям при фиксированных факторах книг, без переобучения.
+При ANN_MODE="ivf" кандидаты ищутся по IVF-индексу факторов книг.
+
+Запуск офлайн-обучения (отдельный .npz-файл):
+    python -m app.services.als_model
+
+Вместе с остальными моделями факторы строятся в снимок:
+    python -m app.services.build_models
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+from app.core.config import settings
+from app.services.ann_index import IVFIndex
+from app.services.id_map import IdMap
+from app.services.model_snapshot import ModelSnapshot
+from app.services.ranking import top_indices
+
+
+class ALSModel:
+    """Факторы пользователей и книг implicit ALS.
+
+    ID пользователей и книг – IdMap матрицы взаимодействий. В снимке он общий
+    с моделью взаимодействий и может расти после обучения, поэтому номера за
+    пределами факторов при поиске считаются отсутствующими.
+    """
+
+    def __init__(
+        self,
+        user_ids: Union[IdMap, Sequence[str]],
+        book_ids: Union[IdMap, Sequence[str]],
+        user_factors: np.ndarray,
+        item_factors: np.ndarray,
+        popularity: np.ndarray,
+        regularization: float,
+        alpha: float,
+        trained_at: Optional[datetime] = None,
+    ) -> None:
+        self.user_index_map = IdMap.of(user_ids)
+        self.book_ids = IdMap.of(book_ids)
+        self.book_index_map = self.book_ids
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.popularity = popularity
+        self.regularization = regularization
+        self.alpha = alpha
+        # Взаимодействия позже этого момента в обучение не вошли
+        self.trained_at = trained_at
+        # Приближённый индекс по факторам книг (ANN_MODE="ivf")
+        self.ann: Optional[IVFIndex] = None
+        # YᵀY не зависит от пользователя – считается один раз для fold-in
+        item_factors64 = np.asarray(item_factors, dtype=np.float64)
+        self._gram = item_factors64.T @ item_factors64
+
+    @property
+    def factors(self) -> int:
+        return self.item_factors.shape[1]
+
+    @classmethod
+    def train(
+        cls,
+        matrix: sparse.csr_matrix,
+        user_ids: Union[IdMap, Sequence[str]],
+        book_ids: Union[IdMap, Sequence[str]],
+        factors: Optional[int] = None,
+        iterations: Optional[int] = None,
+        regularization: Optional[float] = None,
+        alpha: Optional[float] = None,
+        trained_at: Optional[datetime] = None,
+        seed: int = 0,
+    ) -> "ALSModel":
+        """Обучает модель по матрице весов пользователь-книга (users × books)."""
+
+        factors = factors or settings.ALS_FACTORS
+        iterations = iterations or settings.ALS_ITERATIONS
+        regularization = regularization if regularization is not None else settings.ALS_REGULARIZATION
+        alpha = alpha if alpha is not None else settings.ALS_ALPHA
+
+        matrix = matrix.tocsr().astype(np.float64)
+        matrix_t = matrix.T.tocsr()
+        rng = np.random.default_rng(seed)
+        user_factors = rng.normal(scale=0.01, size=(matrix.shape[0], factors))
+        item_factors = rng.normal(scale=0.01, size=(matrix.shape[1], factors))
+
+        for _ in range(iterations):
+            user_factors = _solve_rows(matrix, item_factors, regularization, alpha)
+            item_factors = _solve_rows(matrix_t, user_factors, regularization, alpha)
+
+        popularity = np.asarray(matrix.sum(axis=0), dtype=np.float32).ravel()
+        return cls(
+            user_ids,
+            book_ids,
+            user_factors.astype(np.float32),
+            item_factors.astype(np.float32),
+            popularity,
+            regularization,
+            alpha,
+            trained_at,
+        )
+
+    @property
+    def n_users(self) -> int:
+        return self.user_factors.shape[0]
+
+    @property
+    def n_books(self) -> int:
+        return self.item_factors.shape[0]
+
+    def user_vector(self, user_id: Any) -> Optional[np.ndarray]:
+        """Обученные факторы пользователя или None."""
+
+        index = self.user_index_map.get(user_id, limit=self.n_users)
+        if index is None:
+            return None
+        return self.user_factors[index]
+
+    def fold_in(self, history: Mapping[Any, float]) -> Optional[np.ndarray]:
+        """Факторы пользователя по его взаимодействиям (ID книги → вес).
+
+        Returns:
+            Вектор факторов или None, если ни одна книга не известна модели
+        """
+
+        indices: List[int] = []
+        weights: List[float] = []
+        for book_id, weight in history.items():
+            index = self.book_index_map.get(book_id, limit=self.n_books)
+            if index is not None and weight > 0:
+                indices.append(index)
+                weights.append(weight)
+        if not indices:
+            return None
+
+        vector = _solve_one(
+            self._gram,
+            np.asarray(self.item_factors[indices], dtype=np.float64),
+            np.asarray(weights, dtype=np.float64),
+            self.regularization,
+            self.alpha,
+        )
+        return vector.astype(np.float32)
+
+    def build_ann(self) -> Optional[IVFIndex]:
+        """Строит IVF-индекс по факторам книг (если книги есть)."""
+
+        if self.n_books:
+            self.ann = IVFIndex.build(np.asarray(self.item_factors))
+        return self.ann
+
+    def top_candidates(
+        self, user_vector: np.ndarray, excluded: Sequence[int], count: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """`count` книг с наибольшим положительным score (без `excluded`).
+
+        В режиме ANN_MODE="ivf" score считается только для книг из ближайших
+        списков индекса.
+
+        Returns:
+            Индексы книг в модели по убыванию score и их score
+        """
+
+        if self.ann is not None and settings.ANN_MODE == "ivf":
+            return self.ann.search(self.item_factors, user_vector, count, excluded=excluded)
+
+        scores = self.item_factors @ user_vector
+        if len(excluded):
+            scores[np.asarray(excluded, dtype=np.int64)] = 0
+        top = top_indices(scores, count)
+        return top, scores[top].astype(np.float64)
+
+    def top_candidates_block(
+        self, user_vectors: np.ndarray, excluded: Sequence[Sequence[int]], count: int
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """`top_candidates` для блока пользователей одним произведением матриц.
+
+        Args:
+            user_vectors: Факторы пользователей блока (блок × k)
+            excluded: Исключаемые книги каждого пользователя блока
+            count: Число кандидатов на пользователя
+        """
+
+        scores = np.asarray(user_vectors, dtype=np.float32) @ self.item_factors.T
+        results = []
+        for row, row_excluded in zip(scores, excluded):
+            if len(row_excluded):
+                row[np.asarray(row_excluded, dtype=np.int64)] = 0
+            top = top_indices(row, count)
+            results.append((top, row[top].astype(np.float64)))
+        return results
+
+    def snapshot_values(self) -> Dict[str, np.ndarray]:
+        """Массивы модели для снимка моделей.
+
+        ID пользователей, книг и популярность совпадают с матрицей
+        взаимодействий, по которой обучена модель.
+        """
+
+        values = {
+            "als_user_factors": self.user_factors,
+            "als_item_factors": self.item_factors,
+            "als_params": np.asarray([self.regularization, self.alpha], dtype=np.float64),
+        }
+        if self.ann is not None:
+            values.update(self.ann.snapshot_values("als_ann"))
+        return values
+
+    @classmethod
+    def from_snapshot(cls, snapshot: ModelSnapshot) -> Optional["ALSModel"]:
+        """Открывает модель из снимка (memmap) или None, если её там нет."""
+
+        if not snapshot.has("als_item_factors"):
+            return None
+        regularization, alpha = snapshot.array("als_params", mmap=False).tolist()
+        model = cls(
+            snapshot.id_map("interactions_user_ids"),
+            snapshot.id_map("interactions_book_ids"),
+            snapshot.array("als_user_factors"),
+            snapshot.array("als_item_factors"),
+            snapshot.array("interactions_popularity"),
+            regularization,
+            alpha,
+            snapshot.snapshot_time,
+        )
+        model.ann = IVFIndex.from_snapshot(snapshot, "als_ann")
+        return model
+
+    def save(self, path: str) -> None:
+        """Сохраняет модель в .npz файл (атомарно, через временный файл)."""
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            user_ids=self.user_index_map.raw[: self.n_users],
+            book_ids=self.book_ids.raw[: self.n_books],
+            user_factors=self.user_factors,
+            item_factors=self.item_factors,
+            popularity=self.popularity,
+            params=np.asarray([self.regularization, self.alpha], dtype=np.float64),
+            trained_at=np.asarray(self.trained_at.isoformat() if self.trained_at else ""),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ALSModel":
+        """Загружает модель из .npz файла."""
+
+        with np.load(path) as data:
+            regularization, alpha = data["params"].tolist()
+            trained_at = str(data["trained_at"])
+            return cls(
+                IdMap.from_array(data["user_ids"]),
+                IdMap.from_array(data["book_ids"]),
+                data["user_factors"],
+                data["item_factors"],
+                data["popularity"],
+                regularization,
+                alpha,
+                datetime.fromisoformat(trained_at) if trained_at else None,
+            )
+
+
+def _solve_one(
+    gram: np.ndarray,
+    factors: np.ndarray,
+    weights: np.ndarray,
+    regularization: float,
+    alpha: float,
+) -> np.ndarray:
+    """Решение для одной строки: (YᵀY + Yᵀ(C − I)Y + λI)·x = YᵀC·p."""
+
+    confidence = alpha * weights  # c − 1 для наблюдаемых книг
+    lhs = gram + (factors.T * confidence) @ factors
+    lhs[np.diag_indices_from(lhs)] += regularization
+    rhs = factors.T @ (1.0 + confidence)
+    return np.linalg.solve(lhs, rhs)
+
+
+def _solve_rows(
+    matrix: sparse.csr_matrix, fixed: np.ndarray, regularization: float, alpha: float
+) -> np.ndarray:
+    """Полушаг ALS: факторы всех строк `matrix` при фиксированных `fixed`."""
+
+    gram = fixed.T @ fixed
+    solved = np.zeros((matrix.shape[0], fixed.shape[1]), dtype=np.float64)
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        solved[row] = _solve_one(
+            gram,
+            fixed[matrix.indices[start:end]],
+            matrix.data[start:end],
+            regularization,
+            alpha,
+        )
+    return solved
+
+
+def load_als_model(path: Optional[str] = None) -> Optional[ALSModel]:
+    """Загружает модель, если офлайн-задача уже её обучила."""
+
+    path = path or settings.ALS_MODEL_PATH
+    if not os.path.exists(path):
+        return None
+    model = ALSModel.load(path)
+    if settings.ANN_MODE == "ivf":
+        model.build_ann()
+    return model
+
+
+async def main():
+    """Офлайн-обучение ALS по всем взаимодействиям."""
+
+    from app.db.mongodb import close_mongo_connection, connect_to_mongo
+    from app.services.interaction_model import InteractionModel
+
+    await connect_to_mongo()
+    try:
+        trained_at = datetime.utcnow()
+        model = InteractionModel()
+        await model.load(until=trained_at)
+        matrix = model.matrix
+        print(f"🔄 Матрица {matrix.shape}, ненулевых элементов: {matrix.nnz}")
+
+        als = ALSModel.train(
+            matrix, model.user_index_map, model.book_ids, trained_at=trained_at
+        )
+        als.save(settings.ALS_MODEL_PATH)
+        print(f"✅ Модель ALS (k={als.factors}) сохранена: {settings.ALS_MODEL_PATH}")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
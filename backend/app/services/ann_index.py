@@ -0,0 +1,188 @@
+"""
+Приближённый поиск ближайших соседей (IVF) на NumPy.
+
+Векторы разбиваются на списки по ближайшему центроиду сферического k-means
+(грубый квантователь). Запрос сравнивается только с центроидами, после чего
+точно пересчитываются векторы из `n_probe` ближайших списков. Число
+просматриваемых списков – ручка «полнота ↔ задержка»: n_probe = n_lists
+эквивалентно полному перебору.
+
+Индекс хранит только разбиение (центроиды и номера векторов), сами векторы
+остаются у владельца (факторы ALS, матрицы контентного индекса), поэтому
+векторы, добавленные после построения, просто досматриваются полным перебором.
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+from app.core.config import settings
+from app.services.model_snapshot import ModelSnapshot
+from app.services.ranking import top_indices
+
+Vectors = Union[np.ndarray, sparse.csr_matrix]
+
+# Итерации k-means при построении и размер обучающей выборки на один список
+KMEANS_ITERATIONS = 10
+TRAINING_POINTS_PER_LIST = 64
+
+
+def _normalize_rows(vectors: Vectors) -> Vectors:
+    if sparse.issparse(vectors):
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ vectors
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _dot(vectors: Vectors, centroids: np.ndarray) -> np.ndarray:
+    """vectors @ centroids.T (векторы – плотные или CSR) в виде плотного массива."""
+
+    product = vectors @ centroids.T
+    return np.asarray(product.toarray() if sparse.issparse(product) else product)
+
+
+class IVFIndex:
+    """Разбиение векторов на списки по центроидам."""
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, items: np.ndarray) -> None:
+        # Векторы списка l – items[offsets[l]:offsets[l + 1]]
+        self.centroids = centroids
+        self.offsets = offsets
+        self.items = items
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def size(self) -> int:
+        """Число проиндексированных векторов (векторы с большим номером досматриваются)."""
+
+        return self.items.shape[0]
+
+    @classmethod
+    def build(
+        cls,
+        vectors: Vectors,
+        n_lists: Optional[int] = None,
+        iterations: int = KMEANS_ITERATIONS,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Строит разбиение сферическим k-means по выборке векторов."""
+
+        n_vectors, dim = vectors.shape
+        n_lists = n_lists or settings.ANN_LISTS or max(1, int(math.sqrt(n_vectors)))
+        n_lists = max(1, min(n_lists, n_vectors))
+        normalized = _normalize_rows(vectors)
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(n_vectors, n_lists * TRAINING_POINTS_PER_LIST)
+        sample = normalized[np.sort(rng.choice(n_vectors, sample_size, replace=False))]
+        centroids = _as_dense(sample[rng.choice(sample_size, n_lists, replace=False)])
+
+        for _ in range(iterations):
+            assignment = np.argmax(_dot(sample, centroids), axis=1)
+            members = sparse.csr_matrix(
+                (np.ones(sample_size), (assignment, np.arange(sample_size))),
+                shape=(n_lists, sample_size),
+            )
+            updated = _as_dense(members @ sample)
+            empty = np.asarray(members.sum(axis=1)).ravel() == 0
+            # Пустой список сохраняет прежний центроид
+            updated[empty] = centroids[empty]
+            centroids = _normalize_rows(updated)
+
+        assignment = np.empty(n_vectors, dtype=np.int64)
+        for start in range(0, n_vectors, 4096):
+            block = normalized[start:start + 4096]
+            assignment[start:start + 4096] = np.argmax(_dot(block, centroids), axis=1)
+
+        items = np.argsort(assignment, kind="stable").astype(np.int32)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=n_lists))
+        return cls(centroids.astype(np.float32), offsets, items)
+
+    def probe(
+        self, query: Vectors, n_probe: Optional[int] = None, total: Optional[int] = None
+    ) -> np.ndarray:
+        """Номера векторов-кандидатов из `n_probe` ближайших к запросу списков.
+
+        Args:
+            query: Вектор запроса (плотный 1-D или CSR-строка)
+            n_probe: Число просматриваемых списков
+            total: Текущее число векторов; векторы после `size` добавляются всегда
+        """
+
+        if sparse.issparse(query):
+            centroid_scores = _dot(query, self.centroids)[0]
+        else:
+            centroid_scores = self.centroids @ np.asarray(query, dtype=np.float32)
+        return self.probe_scores(centroid_scores, n_probe, total)
+
+    def probe_scores(
+        self, centroid_scores: np.ndarray, n_probe: Optional[int] = None, total: Optional[int] = None
+    ) -> np.ndarray:
+        """Как `probe`, но по уже посчитанному сходству запроса с центроидами."""
+
+        n_probe = max(1, min(n_probe or settings.ANN_PROBES, self.n_lists))
+        if n_probe < self.n_lists:
+            lists = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        else:
+            lists = np.arange(self.n_lists)
+
+        parts = [self.items[self.offsets[l]:self.offsets[l + 1]] for l in lists]
+        if total is not None and total > self.size:
+            parts.append(np.arange(self.size, total, dtype=np.int32))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32)
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        query: np.ndarray,
+        limit: int,
+        n_probe: Optional[int] = None,
+        excluded: Sequence[int] = (),
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-`limit` векторов по скалярному произведению среди кандидатов.
+
+        Returns:
+            Индексы векторов по убыванию score и их score (только положительные)
+        """
+
+        candidates = self.probe(query, n_probe, total=vectors.shape[0])
+        scores = vectors[candidates] @ query
+        if len(excluded):
+            scores[np.isin(candidates, np.asarray(excluded))] = 0
+        top = top_indices(scores, limit)
+        return candidates[top], scores[top].astype(np.float64)
+
+    def snapshot_values(self, prefix: str) -> Dict[str, np.ndarray]:
+        """Массивы индекса для снимка моделей под именами `<prefix>_*`."""
+
+        return {
+            f"{prefix}_centroids": self.centroids,
+            f"{prefix}_offsets": self.offsets,
+            f"{prefix}_items": self.items,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: ModelSnapshot, prefix: str) -> Optional["IVFIndex"]:
+        """Открывает индекс из снимка (memmap) или None, если его там нет."""
+
+        if not snapshot.has(f"{prefix}_centroids"):
+            return None
+        return cls(
+            snapshot.array(f"{prefix}_centroids"),
+            snapshot.array(f"{prefix}_offsets"),
+            snapshot.array(f"{prefix}_items"),
+        )
+
+
+def _as_dense(vectors: Vectors) -> np.ndarray:
+    return np.asarray(vectors.toarray() if sparse.issparse(vectors) else vectors, dtype=np.float64)
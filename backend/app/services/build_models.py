@@ -0,0 +1,125 @@
+"""
+Офлайн-построение всех предрасчитанных моделей рекомендаций.
+
+Задача читает interactions и books из MongoDB пакетами и строит в один
+снимок (см. model_snapshot):
+
+* матрицу пользователь-книга и популярность книг;
+* таблицу соседей item-item;
+* факторы implicit ALS;
+* контентный индекс (TF-IDF, теги, жанры, авторы).
+
+Версия публикуется атомарной заменой ссылки `current`, после чего воркеры
+API переключаются на неё без перезапуска, а тяжёлое построение никогда не
+выполняется на пути запроса.
+
+Запуск (время каждой стадии печатается):
+    python -m app.services.build_models
+
+Профилирование:
+    python -m cProfile -s cumtime -m app.services.build_models
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.models.book import Book
+from app.services.als_model import ALSModel
+from app.services.content_index import CONTENT_PROJECTION, ContentIndex
+from app.services.interaction_model import InteractionModel
+from app.services.item_neighbors import ItemNeighborTable
+from app.services.model_snapshot import (
+    ModelSnapshot,
+    SnapshotValue,
+    prune_versions,
+    write_snapshot,
+)
+
+
+@contextmanager
+def _stage(name: str, timings: Dict[str, float]) -> Iterator[None]:
+    started = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - started
+    print(f"   {name}: {timings[name]:.2f} с")
+
+
+async def load_book_documents(batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Читает поля книг, нужные моделям, пакетами по `batch_size`."""
+
+    cursor = Book.get_motor_collection().find(
+        {}, CONTENT_PROJECTION, batch_size=batch_size or settings.MODEL_BUILD_BATCH_SIZE
+    )
+    return [document async for document in cursor]
+
+
+async def build_snapshot(
+    root: Optional[Union[str, Path]] = None, batch_size: Optional[int] = None
+) -> Tuple[ModelSnapshot, Dict[str, float]]:
+    """Строит все модели и публикует их как новую версию снимка.
+
+    Returns:
+        Опубликованный снимок и время стадий в секундах
+    """
+
+    timings: Dict[str, float] = {}
+    snapshot_time = datetime.utcnow()
+    values: Dict[str, SnapshotValue] = {}
+
+    with _stage("interactions", timings):
+        model = InteractionModel()
+        await model.load(until=snapshot_time, batch_size=batch_size)
+        values.update(model.snapshot_values())
+        matrix = values["interactions"]
+        print(f"   матрица {matrix.shape}, ненулевых элементов: {matrix.nnz}")
+
+    with _stage("item_neighbors", timings):
+        table = ItemNeighborTable.build(matrix, model.book_ids, k=settings.ITEM_NEIGHBORS_K)
+        values.update(table.snapshot_values())
+
+    with _stage("als", timings):
+        als = ALSModel.train(
+            matrix, model.user_index_map, model.book_ids, trained_at=snapshot_time
+        )
+        als.build_ann()
+        values.update(als.snapshot_values())
+
+    with _stage("books", timings):
+        documents = await load_book_documents(batch_size)
+
+    with _stage("content_index", timings):
+        index = ContentIndex()
+        index.build(documents)
+        if index.book_ids:
+            index.build_ann()
+        values.update(index.snapshot_values())
+
+    with _stage("write", timings):
+        snapshot = write_snapshot(values, snapshot_time, root)
+        prune_versions(root=root)
+
+    return snapshot, timings
+
+
+async def main():
+    """Построение и публикация снимка моделей из текущего состояния MongoDB."""
+
+    from app.db.mongodb import close_mongo_connection, connect_to_mongo
+
+    await connect_to_mongo()
+    try:
+        print("🔄 Построение моделей...")
+        snapshot, timings = await build_snapshot()
+        print(f"✅ Опубликована версия {snapshot.version} за {sum(timings.values()):.2f} с: {snapshot.path}")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,284 @@
+"""
+Лучшие книги жанров и авторов в памяти.
+
+Cold-start подборка и рекомендации по жанру берут top-N книг жанра или автора
+по рейтингу, а также новинки каталога. Индекс хранит компактные поля всех
+книг (жанр, автор, рейтинг, дата добавления) и отсортированные списки ID
+top-N для каждой группы, поэтому выборка и ранжирование не обращаются к
+MongoDB. Сами документы книг (цена, наличие) читаются по ID при каждом
+запросе, поэтому всегда актуальны.
+
+Индекс полностью перестраивается по расписанию
+(CATALOG_TOP_LISTS_REFRESH_SECONDS), а изменения каталога применяются сразу:
+книга вставляется в списки своих групп бинарным поиском или убирается из них,
+и только если она выпала из top-N группы (или удалена), список группы
+пересчитывается по всем её книгам. Списки, ключ которых не изменился
+(например, новинки при смене рейтинга), не трогаются.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.models.book import Book
+
+# Порядки списков: по рейтингу и по дате добавления
+ORDERS = ("rating", "newest")
+
+# Группа всего каталога
+OVERALL: Tuple[str, str] = ("all", "")
+
+TOP_LISTS_PROJECTION = {"genre": 1, "author": 1, "average_rating": 1, "created_at": 1}
+
+Group = Tuple[str, str]
+
+
+class _Entry:
+    """Поля книги, по которым строятся списки."""
+
+    __slots__ = ("genre", "author", "rating", "created_at", "position")
+
+    def __init__(
+        self,
+        genre: Optional[str],
+        author: Optional[str],
+        rating: float,
+        created_at: datetime,
+        position: int,
+    ) -> None:
+        self.genre = genre
+        self.author = author
+        self.rating = rating
+        self.created_at = created_at
+        # Порядок в коллекции – для одинаковых значений ключа, как у sort в MongoDB
+        self.position = position
+
+    @property
+    def groups(self) -> List[Group]:
+        groups = [OVERALL]
+        if self.genre:
+            groups.append(("genre", self.genre))
+        if self.author:
+            groups.append(("author", self.author))
+        return groups
+
+
+class CatalogTopLists:
+    """Списки top-N книг каждого жанра, автора и всего каталога."""
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        """Сбрасывает индекс (при остановке приложения)."""
+
+        self.is_loaded = False
+        self.refreshed_at: Optional[datetime] = None
+        self._entries: Dict[str, _Entry] = {}
+        self._members: Dict[Group, Set[str]] = defaultdict(set)
+        # (поле, значение, порядок) → ID книг по убыванию
+        self._lists: Dict[Tuple[str, str, str], List[str]] = {}
+        self._next_position = 0
+
+    @staticmethod
+    def list_size(group: Group) -> int:
+        if group[0] == "author":
+            return settings.CATALOG_TOP_AUTHOR_LIST_SIZE
+        return settings.CATALOG_TOP_LIST_SIZE
+
+    # ------------------------------------------------------------------ #
+    #                              ЗАГРУЗКА                              #
+    # ------------------------------------------------------------------ #
+
+    async def load(self) -> None:
+        """Полностью перестраивает индекс по каталогу."""
+
+        now = datetime.utcnow()
+        entries: Dict[str, _Entry] = {}
+        cursor = Book.get_motor_collection().find({}, TOP_LISTS_PROJECTION)
+        async for document in cursor:
+            entries[str(document["_id"])] = _Entry(
+                document.get("genre"),
+                document.get("author"),
+                document.get("average_rating") or 0.0,
+                document.get("created_at") or datetime.min,
+                len(entries),
+            )
+
+        members: Dict[Group, Set[str]] = defaultdict(set)
+        for book_id, entry in entries.items():
+            for group in entry.groups:
+                members[group].add(book_id)
+
+        lists = {
+            (*group, order): _rank(ids, _sort_key(order, entries), self.list_size(group))
+            for group, ids in members.items()
+            for order in ORDERS
+        }
+        # Переключение состояния без await: читатели видят либо старый, либо новый индекс
+        self._entries = entries
+        self._members = members
+        self._lists = lists
+        self._next_position = len(entries)
+        self.refreshed_at = now
+        self.is_loaded = True
+
+    async def run_refresh(self, interval: Optional[int] = None) -> None:
+        """Фоновая задача: периодическое перестроение индекса."""
+
+        interval = interval or settings.CATALOG_TOP_LISTS_REFRESH_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception as err:  # pylint: disable=broad-except
+                print(f"⚠️  Не удалось обновить списки лучших книг: {err}")
+
+    # ------------------------------------------------------------------ #
+    #                          ИЗМЕНЕНИЯ КАТАЛОГА                        #
+    # ------------------------------------------------------------------ #
+
+    def upsert(self, book: Book) -> None:
+        """Применяет создание или изменение книги."""
+
+        if not self.is_loaded:
+            return
+        book_id = str(book.id)
+        previous = self._entries.get(book_id)
+        if previous is None:
+            position = self._next_position
+            self._next_position += 1
+        else:
+            position = previous.position
+        entry = _Entry(
+            book.genre, book.author, book.average_rating or 0.0, book.created_at or datetime.min, position
+        )
+
+        affected = set(entry.groups)
+        if previous is not None:
+            affected.update(previous.groups)
+        for group in affected:
+            if group in entry.groups:
+                self._members[group].add(book_id)
+            else:
+                self._members[group].discard(book_id)
+        self._entries[book_id] = entry
+        for group in affected:
+            for order in ORDERS:
+                if (
+                    previous is not None
+                    and group in previous.groups
+                    and group in entry.groups
+                    and _entry_key(order, previous) == _entry_key(order, entry)
+                ):
+                    continue
+                self._place(group, order, book_id, entry if group in entry.groups else None)
+
+    def remove(self, book_id: str) -> None:
+        """Применяет удаление книги."""
+
+        if not self.is_loaded:
+            return
+        entry = self._entries.get(book_id)
+        if entry is None:
+            return
+        for group in entry.groups:
+            self._members[group].discard(book_id)
+        for group in entry.groups:
+            for order in ORDERS:
+                self._place(group, order, book_id, None)
+        del self._entries[book_id]
+
+    def _place(self, group: Group, order: str, book_id: str, entry: Optional[_Entry]) -> None:
+        """Переставляет книгу в списке группы (entry=None – книга покинула группу).
+
+        Список пересчитывается по всем книгам группы, только если после
+        перестановки в нём может не хватать книги, следующей за top-N.
+        """
+
+        list_key = (*group, order)
+        ranked = [other for other in self._lists.get(list_key, []) if other != book_id]
+        was_listed = len(ranked) < len(self._lists.get(list_key, []))
+        size = self.list_size(group)
+        members = len(self._members.get(group, ()))
+
+        if entry is not None:
+            keys = [_entry_key(order, self._entries[other]) for other in ranked]
+            index = bisect.bisect_left(keys, _entry_key(order, entry))
+            if index < len(ranked) or len(ranked) >= members - 1:
+                # Книга внутри списка либо список и так содержит всю группу
+                ranked.insert(index, book_id)
+                del ranked[size:]
+            elif was_listed:
+                # Книга выпала в хвост: её место может занять другая книга группы
+                ranked = self._rank_group(group, order)
+        elif was_listed and len(ranked) < members:
+            ranked = self._rank_group(group, order)
+
+        if ranked:
+            self._lists[list_key] = ranked
+        else:
+            self._lists.pop(list_key, None)
+
+    def _rank_group(self, group: Group, order: str) -> List[str]:
+        """Полный пересчёт списка группы."""
+
+        return _rank(
+            self._members.get(group, ()), _sort_key(order, self._entries), self.list_size(group)
+        )
+
+    # ------------------------------------------------------------------ #
+    #                                ЧТЕНИЕ                              #
+    # ------------------------------------------------------------------ #
+
+    def covers(self, limit: int, field: str = "genre") -> bool:
+        """Достаточно ли длины списков для выборки `limit` книг."""
+
+        group = OVERALL if field == "all" else (field, "")
+        return self.is_loaded and limit <= self.list_size(group)
+
+    def top_book_ids(
+        self, field: str, values: Iterable[str], limit: int, order: str = "rating"
+    ) -> List[str]:
+        """ID лучших книг групп `values` поля `field` в порядке `order`.
+
+        Списки нескольких групп сливаются, как при запросе с `$in` и сортировкой.
+        """
+
+        lists = [self._lists.get((field, value, order), []) for value in values]
+        if len(lists) == 1:
+            return lists[0][:limit]
+        return list(islice(heapq.merge(*lists, key=_sort_key(order, self._entries)), limit))
+
+    def overall_book_ids(self, limit: int, order: str = "newest") -> List[str]:
+        """ID лучших книг всего каталога в порядке `order`."""
+
+        return self.top_book_ids(OVERALL[0], [OVERALL[1]], limit, order)
+
+
+def _entry_key(order: str, entry: _Entry) -> tuple:
+    """Ключ сортировки по возрастанию (лучшие книги – первыми)."""
+
+    if order == "rating":
+        return (-entry.rating, entry.position)
+    return (
+        -entry.created_at.timestamp() if entry.created_at > datetime.min else 0.0,
+        entry.position,
+    )
+
+
+def _sort_key(order: str, entries: Dict[str, _Entry]) -> Callable[[str], tuple]:
+    return lambda book_id: _entry_key(order, entries[book_id])
+
+
+def _rank(book_ids: Iterable[str], key: Callable[[str], tuple], size: int) -> List[str]:
+    return heapq.nsmallest(size, book_ids, key=key)
+
+
+catalog_top_lists = CatalogTopLists()
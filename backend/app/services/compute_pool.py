@@ -0,0 +1,278 @@
+"""
+Пул для CPU-ёмких стадий рекомендаций.
+
+Скоринг выполняется вне event loop, чтобы тяжёлый /for-you не блокировал
+остальные запросы воркера. Режим задаётся настройкой RECOMMENDATION_EXECUTOR:
+
+* "thread"  – пул потоков: NumPy/SciPy отпускают GIL на матричных операциях,
+  а данные доступны без копирования;
+* "process" – дополнительно пул процессов для скоринга collaborative
+  filtering; матрица взаимодействий публикуется в shared memory один раз
+  на версию и не сериализуется в каждом запросе;
+* "inline"  – расчёт прямо в event loop (скрипты, отладка).
+
+Пока пул не запущен (CLI-скрипты, бенчмарки), расчёт выполняется inline.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+import numpy as np
+from scipy import sparse
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# Сколько опубликованных версий матрицы держать в shared memory; вытесненная
+# версия освобождается, когда завершатся отправленные с ней задачи
+SHARED_GENERATIONS = 2
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Описание массива в shared memory (передаётся в процесс вместо данных)."""
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+@dataclass(frozen=True)
+class SharedCSR:
+    """CSR-матрица из трёх массивов в shared memory."""
+
+    data: SharedArray
+    indices: SharedArray
+    indptr: SharedArray
+    shape: Tuple[int, int]
+
+
+@dataclass(frozen=True)
+class MappedCSR:
+    """CSR-матрица из .npy-файлов снимка модели (открывается через memmap)."""
+
+    data: str
+    indices: str
+    indptr: str
+    shape: Tuple[int, int]
+
+
+MatrixSource = Union[sparse.csr_matrix, SharedCSR, MappedCSR]
+
+
+def _publish_array(array: np.ndarray) -> Tuple[SharedArray, shared_memory.SharedMemory]:
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return SharedArray(block.name, array.shape, array.dtype.str), block
+
+
+def publish_csr(
+    matrix: sparse.csr_matrix,
+) -> Tuple[SharedCSR, List[shared_memory.SharedMemory]]:
+    """Копирует CSR-матрицу в shared memory."""
+
+    handles, blocks = [], []
+    for array in (matrix.data, matrix.indices, matrix.indptr):
+        handle, block = _publish_array(np.ascontiguousarray(array))
+        handles.append(handle)
+        blocks.append(block)
+    return SharedCSR(*handles, shape=matrix.shape), blocks
+
+
+def open_mapped_csr(handle: MappedCSR) -> sparse.csr_matrix:
+    """Открывает CSR-матрицу снимка только для чтения, без копирования в память процесса."""
+
+    arrays = tuple(
+        np.load(path, mmap_mode="r", allow_pickle=False)
+        for path in (handle.data, handle.indices, handle.indptr)
+    )
+    return sparse.csr_matrix(arrays, shape=handle.shape, copy=False)
+
+
+# Подключённые в процессе-воркере матрицы: handle → (матрица, блоки, слабые
+# ссылки на массивы поверх блоков – представления матрицы ссылаются на них)
+_attached: Dict[
+    Any, Tuple[sparse.csr_matrix, List[shared_memory.SharedMemory], List[weakref.ref]]
+] = {}
+# Вытесненные матрицы: (слабые ссылки на их массивы, блоки). Блоки закрываются,
+# когда массивы (и представления на них) больше не нужны ни одной задаче
+_detached: List[Tuple[List[weakref.ref], List[shared_memory.SharedMemory]]] = []
+
+
+def _attach_array(handle: SharedArray) -> Tuple[np.ndarray, shared_memory.SharedMemory]:
+    # Воркеры пула используют resource tracker основного процесса, который
+    # владеет блоком и удаляет его при смене версии матрицы
+    block = shared_memory.SharedMemory(name=handle.name)
+    return np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=block.buf), block
+
+
+def resolve_csr(source: MatrixSource) -> sparse.csr_matrix:
+    """Возвращает матрицу: саму матрицу или подключённую из shared memory."""
+
+    if not isinstance(source, (SharedCSR, MappedCSR)):
+        return source
+
+    attached = _attached.get(source)
+    if attached is None:
+        if isinstance(source, MappedCSR):
+            matrix, blocks, arrays = open_mapped_csr(source), (), ()
+        else:
+            arrays, blocks = zip(
+                *(_attach_array(handle) for handle in (source.data, source.indices, source.indptr))
+            )
+            matrix = sparse.csr_matrix(tuple(arrays), shape=source.shape, copy=False)
+        while len(_attached) >= SHARED_GENERATIONS:
+            _, old_blocks, old_refs = _attached.pop(next(iter(_attached)))
+            if old_blocks:
+                _detached.append((old_refs, old_blocks))
+        attached = _attached[source] = (
+            matrix,
+            list(blocks),
+            [weakref.ref(array) for array in arrays],
+        )
+    _close_detached()
+    return attached[0]
+
+
+def _close_detached() -> None:
+    """Закрывает блоки вытесненных матриц, массивы которых больше никто не держит.
+
+    Закрытие блока, на который ещё ссылается массив выполняющейся задачи,
+    сделало бы этот массив недействительным.
+    """
+
+    in_use = []
+    for refs, blocks in _detached:
+        if any(ref() is not None for ref in refs):
+            in_use.append((refs, blocks))
+            continue
+        for block in blocks:
+            block.close()
+    _detached[:] = in_use
+
+
+class ComputePool:
+    """Исполнители для CPU-стадий и публикация матриц в shared memory."""
+
+    def __init__(self, mode: Optional[str] = None, workers: Optional[int] = None) -> None:
+        self.mode = mode
+        self.workers = workers
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        # id(матрицы) → (handle, блоки, матрица); ссылка на матрицу не даёт id переиспользоваться
+        self._shared: Dict[int, Tuple[SharedCSR, List[shared_memory.SharedMemory], Any]] = {}
+        # Число незавершённых задач с handle и вытесненные блоки, которые они ещё держат
+        self._in_use: Dict[SharedCSR, int] = {}
+        self._retired: Dict[SharedCSR, List[shared_memory.SharedMemory]] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._threads is not None
+
+    def start(self) -> None:
+        """Создаёт исполнители согласно настройкам."""
+
+        mode = self.mode or settings.RECOMMENDATION_EXECUTOR
+        if mode == "inline" or self.is_running:
+            return
+
+        workers = self.workers or settings.RECOMMENDATION_EXECUTOR_WORKERS or os.cpu_count() or 1
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recommendations")
+        if mode == "process":
+            self._processes = ProcessPoolExecutor(max_workers=workers)
+
+    def shutdown(self) -> None:
+        """Останавливает исполнители и освобождает shared memory."""
+
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = None
+        self._processes = None
+        for _, blocks, _ in self._shared.values():
+            self._release(blocks)
+        for blocks in self._retired.values():
+            self._release(blocks)
+        self._shared = {}
+        self._in_use = {}
+        self._retired = {}
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Выполняет функцию в пуле потоков (или inline, если пул не запущен)."""
+
+        return await self._submit(self._threads, func, *args)
+
+    async def run_process(self, func: Callable[..., T], *args: Any) -> T:
+        """Выполняет функцию модуля в пуле процессов, а без него – как `run`.
+
+        Аргументы сериализуются, поэтому большие долгоживущие матрицы передаются
+        через `share`; блоки shared memory из аргументов не освобождаются, пока
+        задача не завершится.
+        """
+
+        handles = [arg for arg in args if isinstance(arg, SharedCSR)]
+        for handle in handles:
+            self._in_use[handle] = self._in_use.get(handle, 0) + 1
+        try:
+            return await self._submit(self._processes or self._threads, func, *args)
+        finally:
+            for handle in handles:
+                self._in_use[handle] -= 1
+                if not self._in_use[handle]:
+                    del self._in_use[handle]
+                    blocks = self._retired.pop(handle, None)
+                    if blocks is not None:
+                        self._release(blocks)
+
+    def share(
+        self, matrix: sparse.csr_matrix, mapped: Optional[MappedCSR] = None
+    ) -> MatrixSource:
+        """Готовит долгоживущую матрицу (базу модели) для передачи в `run_process`.
+
+        В режиме процессов матрица из снимка передаётся путями к файлам
+        (`mapped`), остальные публикуются в shared memory (один раз на объект
+        матрицы). Без пула процессов матрица возвращается как есть. Небольшие
+        матрицы одного запроса дешевле передать напрямую.
+        """
+
+        if self._processes is None:
+            return matrix
+        if mapped is not None:
+            return mapped
+
+        shared = self._shared.get(id(matrix))
+        if shared is None:
+            handle, blocks = publish_csr(matrix)
+            shared = (handle, blocks, matrix)
+            self._shared[id(matrix)] = shared
+            while len(self._shared) > SHARED_GENERATIONS:
+                old_handle, old_blocks, _ = self._shared.pop(next(iter(self._shared)))
+                if old_handle in self._in_use:
+                    self._retired[old_handle] = old_blocks
+                else:
+                    self._release(old_blocks)
+        return shared[0]
+
+    @staticmethod
+    async def _submit(executor: Optional[Executor], func: Callable[..., T], *args: Any) -> T:
+        if executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+    @staticmethod
+    def _release(blocks: List[shared_memory.SharedMemory]) -> None:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+compute_pool = ComputePool()
@@ -0,0 +1,568 @@
+"""
+Каталожный индекс контента для подбора похожих книг.
+
+TF-IDF матрица (теги + название + описание) и матрица тегов строятся один
+раз для всего каталога и хранятся в памяти. Изменения каталога применяются
+инкрементально: строки изменённых книг пересчитываются с уже обученным
+словарём, а когда изменений накопилось много, индекс переобучается в фоне
+(в пуле потоков) и подменяется целиком. Индекс из снимка переобучает
+следующий снимок (python -m app.services.build_models).
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.core.config import settings
+from app.models.book import Book
+from app.services.ann_index import IVFIndex
+from app.services.compute_pool import compute_pool
+from app.services.id_map import IdMap
+from app.services.model_snapshot import ModelSnapshot, encode_ids
+
+# Поля книги, необходимые индексу
+CONTENT_PROJECTION = {
+    "title": 1,
+    "description": 1,
+    "tags": 1,
+    "genre": 1,
+    "author": 1,
+    "average_rating": 1,
+}
+
+# Веса компонент score (совпадают с исходной формулой get_similar_books)
+GENRE_SCORE = 3.0
+AUTHOR_SCORE = 5.0
+TEXT_SCORE = 5.0
+SHARED_TAG_SCORE = 1.5
+
+# Доля изменённых книг, после которой словарь TF-IDF переобучается целиком
+REFIT_THRESHOLD = 0.1
+
+
+def book_text(document: Dict[str, Any]) -> str:
+    """Текст книги для TF-IDF: теги, название и описание."""
+
+    return " ".join(
+        [
+            " ".join(document.get("tags") or []),
+            document.get("title") or "",
+            document.get("description") or "",
+        ]
+    )
+
+
+class ContentIndex:
+    """TF-IDF и тег-матрицы всего каталога с инкрементальным обновлением."""
+
+    def __init__(self) -> None:
+        self._refit_task: Optional[asyncio.Future] = None
+        # Изменения, применённые во время фонового переобучения: (операция, ID, значение)
+        self._refit_log: List[Tuple[str, str, Any]] = []
+        self.clear()
+
+    def clear(self) -> None:
+        """Сбрасывает индекс."""
+
+        self.book_ids = IdMap()
+        self.book_index_map = self.book_ids
+        self.is_loaded = False
+        self._vectorizer: Optional[TfidfVectorizer] = None
+        self._tfidf = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._tags = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._tag_vocabulary: Dict[str, int] = {}
+        self._genre_codes: Dict[str, int] = {}
+        self._author_codes: Dict[str, int] = {}
+        self._genres = np.zeros(0, dtype=np.int32)
+        self._authors = np.zeros(0, dtype=np.int32)
+        self._ratings = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._changes_since_fit = 0
+        # IVF-индекс по признакам книг и размеры блоков признаков при его построении
+        self._ann: Optional[IVFIndex] = None
+        self._ann_dims: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        # Момент снимка, из которого загружен индекс, и журнал изменений после него
+        self.snapshot_time: Optional[datetime] = None
+        self._journal: List[Tuple[datetime, str, Optional[Dict[str, Any]]]] = []
+        # Рейтинги, изменённые отзывами после снимка: ID книги → (момент, рейтинг)
+        self._rating_journal: Dict[str, Tuple[datetime, float]] = {}
+
+    async def load(self) -> None:
+        """Загружает каталог из MongoDB и обучает TF-IDF."""
+
+        cursor = Book.get_motor_collection().find({}, CONTENT_PROJECTION)
+        self.build([document async for document in cursor])
+        if settings.ANN_MODE == "ivf" and self.book_ids:
+            self.build_ann()
+
+    def schedule_refit(self) -> None:
+        """Запускает фоновое переобучение, если оно нужно и ещё не идёт.
+
+        Индекс из снимка не переобучается: memmap-матрицы общие для воркеров,
+        а новый словарь обучает следующий снимок.
+        """
+
+        if self.snapshot_time is not None or not self.needs_refit:
+            return
+        if self._refit_task is None or self._refit_task.done():
+            self._refit_log = []
+            self._refit_task = asyncio.ensure_future(self.refit())
+
+    async def refit(self) -> None:
+        """Переобучает индекс по каталогу вне event loop и подменяет его состояние."""
+
+        try:
+            cursor = Book.get_motor_collection().find({}, CONTENT_PROJECTION)
+            documents = [document async for document in cursor]
+            fresh = await compute_pool.run(build_content_index, documents)
+            # Изменения каталога, сделанные во время обучения, применяются поверх
+            for operation, book_id, value in self._refit_log:
+                if operation == "upsert":
+                    fresh._upsert_document(book_id, value)
+                elif operation == "remove":
+                    fresh._remove_document(book_id)
+                else:
+                    fresh._set_rating(book_id, value)
+            # Подмена без await: запросы видят либо старый, либо новый индекс
+            state = vars(fresh)
+            state.pop("_refit_task", None)
+            state.pop("_refit_log", None)
+            vars(self).update(state)
+        except Exception as err:  # pylint: disable=broad-except
+            print(f"⚠️  Не удалось переобучить контентный индекс: {err}")
+        finally:
+            self._refit_log = []
+
+    def build(self, documents: Iterable[Dict[str, Any]]) -> None:
+        """Полностью перестраивает индекс по документам книг (с полем `_id`)."""
+
+        documents = list(documents)
+        self.clear()
+        self.book_ids = IdMap.from_ids(document["_id"] for document in documents)
+        self.book_index_map = self.book_ids
+
+        self._vectorizer = TfidfVectorizer(dtype=np.float32)
+        if documents:
+            try:
+                self._tfidf = self._vectorizer.fit_transform(
+                    [book_text(document) for document in documents]
+                ).tocsr()
+            except ValueError:
+                # Пустой словарь (у книг нет текста) – текстовая компонента равна нулю
+                self._vectorizer = None
+                self._tfidf = sparse.csr_matrix((len(documents), 0), dtype=np.float32)
+
+        self._tags = self._tag_rows(documents)
+        self._genres = np.array(
+            [self._code(self._genre_codes, d.get("genre")) for d in documents], dtype=np.int32
+        )
+        self._authors = np.array(
+            [self._code(self._author_codes, d.get("author")) for d in documents], dtype=np.int32
+        )
+        self._ratings = np.array(
+            [d.get("average_rating") or 0.0 for d in documents], dtype=np.float32
+        )
+        self._alive = np.ones(len(documents), dtype=bool)
+        self.is_loaded = True
+
+    def load_snapshot(self, snapshot: ModelSnapshot) -> None:
+        """Загружает индекс из снимка: TF-IDF и теги отображаются в память (memmap).
+
+        Изменения каталога после снимка пересчитывают затронутые матрицы в
+        приватную копию – до публикации следующего снимка. Изменения, уже
+        применённые к индексу после момента снимка, переносятся на него.
+        """
+
+        vocabulary = snapshot.array("content_vocabulary", mmap=False).tolist()
+        vectorizer: Optional[TfidfVectorizer] = None
+        if vocabulary:
+            vectorizer = TfidfVectorizer(dtype=np.float32)
+            vectorizer.vocabulary_ = {term: index for index, term in enumerate(vocabulary)}
+            vectorizer.idf_ = snapshot.array("content_idf", mmap=False)
+
+        book_ids = snapshot.id_map("content_book_ids")
+        journal = [entry for entry in self._journal if entry[0] > snapshot.snapshot_time]
+        rating_journal = {
+            book_id: entry
+            for book_id, entry in self._rating_journal.items()
+            if entry[0] > snapshot.snapshot_time
+        }
+
+        self.clear()
+        self.book_ids = book_ids
+        self.book_index_map = book_ids
+        self._vectorizer = vectorizer
+        self._tfidf = snapshot.csr("content_tfidf")
+        self._tags = snapshot.csr("content_tags")
+        self._tag_vocabulary = self._codes(snapshot.array("content_tag_vocabulary", mmap=False))
+        self._genre_codes = self._codes(snapshot.array("content_genre_codes", mmap=False))
+        self._author_codes = self._codes(snapshot.array("content_author_codes", mmap=False))
+        # Небольшие поколоночные массивы меняются на месте при upsert – копируем их
+        self._genres = snapshot.array("content_genres", mmap=False)
+        self._authors = snapshot.array("content_authors", mmap=False)
+        self._ratings = snapshot.array("content_ratings", mmap=False)
+        self._alive = snapshot.array("content_alive", mmap=False)
+        self._ann = IVFIndex.from_snapshot(snapshot, "content_ann")
+        if self._ann is not None:
+            self._ann_dims = tuple(snapshot.array("content_ann_dims", mmap=False).tolist())
+        self.snapshot_time = snapshot.snapshot_time
+        self.is_loaded = True
+
+        # Изменения каталога, сделанные после снимка, применяются поверх него
+        for _, book_id, document in journal:
+            if document is None:
+                self._remove_document(book_id)
+            else:
+                self._upsert_document(book_id, document)
+        self._journal = journal
+        for book_id, (_, rating) in rating_journal.items():
+            self._set_rating(book_id, rating)
+        self._rating_journal = rating_journal
+
+    def snapshot_values(self) -> Dict[str, Any]:
+        """Массивы индекса для записи в снимок (см. model_snapshot)."""
+
+        if self._pending:
+            self._merge_pending()
+
+        vocabulary: List[str] = []
+        idf = np.zeros(0, dtype=np.float32)
+        if self._vectorizer is not None:
+            vocabulary = [""] * len(self._vectorizer.vocabulary_)
+            for term, index in self._vectorizer.vocabulary_.items():
+                vocabulary[index] = term
+            idf = self._vectorizer.idf_
+
+        values = {
+            "content_book_ids": encode_ids(self.book_ids),
+            "content_tfidf": self._tfidf,
+            "content_tags": self._tags,
+            "content_vocabulary": np.asarray(vocabulary, dtype=str),
+            "content_idf": idf,
+            "content_tag_vocabulary": np.asarray(list(self._tag_vocabulary), dtype=str),
+            "content_genre_codes": np.asarray(list(self._genre_codes), dtype=str),
+            "content_author_codes": np.asarray(list(self._author_codes), dtype=str),
+            "content_genres": self._genres,
+            "content_authors": self._authors,
+            "content_ratings": self._ratings,
+            "content_alive": self._alive,
+        }
+        if self._ann is not None:
+            values.update(self._ann.snapshot_values("content_ann"))
+            values["content_ann_dims"] = np.asarray(self._ann_dims, dtype=np.int64)
+        return values
+
+    @property
+    def ratings(self) -> np.ndarray:
+        """Средние рейтинги книг по индексам `book_ids`."""
+
+        return self._ratings
+
+    @property
+    def ann(self) -> Optional[IVFIndex]:
+        """IVF-индекс по признакам книг (None, если не построен)."""
+
+        return self._ann
+
+    @property
+    def needs_refit(self) -> bool:
+        """True, если словарь TF-IDF устарел и индекс стоит перестроить."""
+
+        return self._changes_since_fit > max(len(self.book_ids) * REFIT_THRESHOLD, 1)
+
+    def upsert(self, book: Book) -> None:
+        """Добавляет или обновляет книгу в индексе (после create/update)."""
+
+        if not self.is_loaded:
+            return
+        book_id = str(book.id)
+        document = book.model_dump(include=set(CONTENT_PROJECTION))
+        self._upsert_document(book_id, document)
+        self._record(book_id, document)
+        self._log_refit("upsert", book_id, document)
+        # Документ в журнале уже содержит актуальный рейтинг
+        self._rating_journal.pop(book_id, None)
+
+    def set_rating(self, book_id: str, rating: Optional[float]) -> None:
+        """Обновляет только рейтинг книги (после отзыва).
+
+        Строки TF-IDF и тегов не пересчитываются, а изменение не считается
+        правкой каталога для переобучения словаря.
+        """
+
+        if not self.is_loaded:
+            return
+        self._set_rating(book_id, rating or 0.0)
+        self._log_refit("rating", book_id, rating or 0.0)
+        if self.snapshot_time is not None:
+            self._rating_journal[book_id] = (datetime.utcnow(), rating or 0.0)
+
+    def remove(self, book_id: str) -> None:
+        """Исключает книгу из индекса (после delete)."""
+
+        self._remove_document(book_id)
+        self._record(book_id, None)
+        self._log_refit("remove", book_id, None)
+
+    def similarity_scores(self, book_id: str) -> Optional[np.ndarray]:
+        """Score сходства книги со всем каталогом.
+
+        score = 3·[жанр] + 5·[автор] + 5·cos(TF-IDF) + 1.5·общие_теги + рейтинг/5
+
+        Returns:
+            Массив score по индексам `book_ids` или None, если книги нет в индексе
+        """
+
+        index = self.book_index_map.get(book_id)
+        if index is None or not self._alive[index]:
+            return None
+        return self.score_rows(np.array([index]))[0]
+
+    def similarity_candidates(
+        self, book_id: str, n_probe: Optional[int] = None
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Кандидаты в похожие книги и их score.
+
+        В режиме ANN_MODE="ivf" score считается только для книг из `n_probe`
+        ближайших списков IVF-индекса, иначе – для всего каталога.
+
+        Returns:
+            (индексы книг, score) или None, если книги нет в индексе
+        """
+
+        index = self.book_index_map.get(book_id)
+        if index is None or not self._alive[index]:
+            return None
+        rows = np.array([index])
+        if self._ann is None or settings.ANN_MODE != "ivf":
+            return np.arange(len(self.book_ids)), self.score_rows(rows)[0]
+
+        candidates = self._ann.probe_scores(
+            self._centroid_scores(index), n_probe, total=len(self.book_ids)
+        )
+        return candidates, self.score_rows(rows, candidates)[0]
+
+    def score_rows(self, indices: np.ndarray, columns: Optional[np.ndarray] = None) -> np.ndarray:
+        """Матрица score (len(indices) × каталог или × columns) для блока книг."""
+
+        if self._pending:
+            self._merge_pending()
+
+        if columns is None:
+            columns = np.arange(len(self.book_ids))
+            tfidf, tags = self._tfidf, self._tags
+        else:
+            tfidf, tags = self._tfidf[columns], self._tags[columns]
+
+        text_scores = (self._tfidf[indices] @ tfidf.T).toarray()
+        shared_tags = (self._tags[indices] @ tags.T).toarray()
+
+        scores = TEXT_SCORE * text_scores + SHARED_TAG_SCORE * shared_tags
+        scores += self._ratings[columns] / 5.0
+
+        genres = self._genres[indices][:, None]
+        scores += GENRE_SCORE * ((self._genres[columns] == genres) & (genres >= 0))
+        authors = self._authors[indices][:, None]
+        scores += AUTHOR_SCORE * ((self._authors[columns] == authors) & (authors >= 0))
+
+        scores[columns == indices[:, None]] = 0  # не рекомендуем саму книгу
+        scores[:, ~self._alive[columns]] = 0
+        return scores
+
+    def features(
+        self,
+        indices: Optional[np.ndarray] = None,
+        dims: Optional[Tuple[int, int, int, int]] = None,
+    ) -> sparse.csr_matrix:
+        """Признаки книг, скалярное произведение которых равно score без рейтинга.
+
+        x = [√3·жанр, √5·автор, √5·TF-IDF, √1.5·теги], жанр и автор – one-hot.
+        `dims` ограничивает блоки размерами на момент построения IVF-индекса
+        (новые жанры, авторы и теги в него не входят).
+        """
+
+        if self._pending:
+            self._merge_pending()
+
+        rows = np.arange(len(self.book_ids)) if indices is None else indices
+        n_genres, n_authors, n_terms, n_tags = dims or self._feature_dims()
+        return sparse.hstack(
+            [
+                self._one_hot(self._genres[rows], n_genres) * np.sqrt(GENRE_SCORE),
+                self._one_hot(self._authors[rows], n_authors) * np.sqrt(AUTHOR_SCORE),
+                self._tfidf[rows][:, :n_terms] * np.sqrt(TEXT_SCORE),
+                self._tags[rows][:, :n_tags] * np.sqrt(SHARED_TAG_SCORE),
+            ],
+            format="csr",
+            dtype=np.float32,
+        )
+
+    def build_ann(self) -> IVFIndex:
+        """Строит IVF-индекс по признакам всего каталога."""
+
+        self._ann_dims = self._feature_dims()
+        self._ann = IVFIndex.build(self.features(dims=self._ann_dims))
+        return self._ann
+
+    def alive_indices(self) -> np.ndarray:
+        """Индексы книг, присутствующих в каталоге."""
+
+        return np.flatnonzero(self._alive)
+
+    # ------------------------------------------------------------------ #
+
+    def _upsert_document(self, book_id: str, document: Dict[str, Any]) -> None:
+        index = self.book_index_map.get(book_id)
+        if index is None:
+            index = self.book_ids.intern(book_id)
+            self._genres = np.append(self._genres, 0).astype(np.int32)
+            self._authors = np.append(self._authors, 0).astype(np.int32)
+            self._ratings = np.append(self._ratings, 0).astype(np.float32)
+            self._alive = np.append(self._alive, True)
+
+        self._genres[index] = self._code(self._genre_codes, document.get("genre"))
+        self._authors[index] = self._code(self._author_codes, document.get("author"))
+        self._ratings[index] = document.get("average_rating") or 0.0
+        self._alive[index] = True
+        self._pending[index] = document
+        self._changes_since_fit += 1
+
+    def _set_rating(self, book_id: str, rating: float) -> None:
+        index = self.book_index_map.get(book_id)
+        if index is not None:
+            self._ratings[index] = rating
+
+    def _remove_document(self, book_id: str) -> None:
+        index = self.book_index_map.get(book_id)
+        if index is None:
+            return
+        self._alive[index] = False
+        self._pending.pop(index, None)
+        self._changes_since_fit += 1
+
+    def _record(self, book_id: str, document: Optional[Dict[str, Any]]) -> None:
+        # Журнал нужен только для переноса изменений на следующий снимок
+        if self.snapshot_time is not None:
+            self._journal.append((datetime.utcnow(), book_id, document))
+
+    def _log_refit(self, operation: str, book_id: str, value: Any) -> None:
+        if self._refit_task is not None and not self._refit_task.done():
+            self._refit_log.append((operation, book_id, value))
+
+    def _centroid_scores(self, index: int) -> np.ndarray:
+        """Сходство признаков книги с центроидами IVF по блокам, без сборки вектора."""
+
+        if self._pending:
+            self._merge_pending()
+
+        n_genres, n_authors, n_terms, n_tags = self._ann_dims
+        centroids = self._ann.centroids
+        scores = np.zeros(centroids.shape[0], dtype=np.float64)
+        genre, author = self._genres[index], self._authors[index]
+        if 0 <= genre < n_genres:
+            scores += np.sqrt(GENRE_SCORE) * centroids[:, genre]
+        if 0 <= author < n_authors:
+            scores += np.sqrt(AUTHOR_SCORE) * centroids[:, n_genres + author]
+        offset = n_genres + n_authors
+        for matrix, size, weight in (
+            (self._tfidf, n_terms, TEXT_SCORE),
+            (self._tags, n_tags, SHARED_TAG_SCORE),
+        ):
+            start, end = matrix.indptr[index], matrix.indptr[index + 1]
+            columns = matrix.indices[start:end]
+            keep = columns < size
+            scores += np.sqrt(weight) * (
+                centroids[:, offset + columns[keep]] @ matrix.data[start:end][keep]
+            )
+            offset += size
+        return scores
+
+    def _feature_dims(self) -> Tuple[int, int, int, int]:
+        return (
+            len(self._genre_codes),
+            len(self._author_codes),
+            self._tfidf.shape[1],
+            self._tags.shape[1],
+        )
+
+    @staticmethod
+    def _one_hot(codes: np.ndarray, size: int) -> sparse.csr_matrix:
+        valid = np.flatnonzero((codes >= 0) & (codes < size))
+        return sparse.csr_matrix(
+            (np.ones(valid.size, dtype=np.float32), (valid, codes[valid])),
+            shape=(codes.shape[0], size),
+        )
+
+    @staticmethod
+    def _codes(values: np.ndarray) -> Dict[str, int]:
+        return {value: index for index, value in enumerate(values.tolist())}
+
+    @staticmethod
+    def _code(codes: Dict[str, int], value: Optional[str]) -> int:
+        # -1 – пустое значение, оно не совпадает ни с одной книгой
+        if not value:
+            return -1
+        return codes.setdefault(value, len(codes))
+
+    def _tag_rows(self, documents: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        rows: List[int] = []
+        cols: List[int] = []
+        for row, document in enumerate(documents):
+            for tag in set(document.get("tags") or []):
+                rows.append(row)
+                cols.append(self._tag_vocabulary.setdefault(tag, len(self._tag_vocabulary)))
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(documents), len(self._tag_vocabulary)),
+        )
+
+    def _merge_pending(self) -> None:
+        indices = np.fromiter(self._pending.keys(), dtype=np.int64)
+        documents = list(self._pending.values())
+        n_books = len(self.book_ids)
+
+        if self._vectorizer is not None:
+            text_rows = self._vectorizer.transform([book_text(d) for d in documents])
+        else:
+            text_rows = sparse.csr_matrix((len(documents), self._tfidf.shape[1]))
+        self._tfidf = self._replace_rows(self._tfidf, indices, text_rows, n_books)
+
+        tag_rows = self._tag_rows(documents)
+        self._tags = self._replace_rows(self._tags, indices, tag_rows, n_books)
+
+        self._pending = {}
+
+    @staticmethod
+    def _replace_rows(
+        matrix: sparse.csr_matrix, indices: np.ndarray, rows: sparse.csr_matrix, n_rows: int
+    ) -> sparse.csr_matrix:
+        """Заменяет строки `indices` матрицы на `rows` (с расширением до n_rows)."""
+
+        matrix = matrix.copy()
+        matrix.resize((n_rows, rows.shape[1]))
+        keep = np.ones(n_rows, dtype=np.float32)
+        keep[indices] = 0
+        patch = rows.tocoo()
+        patch = sparse.csr_matrix(
+            (patch.data, (indices[patch.row], patch.col)), shape=(n_rows, rows.shape[1])
+        )
+        return (sparse.diags(keep) @ matrix + patch).tocsr().astype(np.float32)
+
+
+def build_content_index(documents: List[Dict[str, Any]]) -> ContentIndex:
+    """Строит новый индекс по документам каталога (CPU-ёмко, для пула)."""
+
+    index = ContentIndex()
+    index.build(documents)
+    if settings.ANN_MODE == "ivf" and index.book_ids:
+        index.build_ann()
+    return index
+
+
+content_index = ContentIndex()
@@ -0,0 +1,209 @@
+"""
+Интернирование ObjectId в плотные int32-индексы.
+
+Модели рекомендаций адресуют пользователей и книги номерами строк и столбцов.
+`IdMap` хранит соответствие ObjectId → номер в словаре по 12-байтовому
+двоичному ID (без строк `str(ObjectId)`), а обратное соответствие – в
+NumPy-массиве `S12`, поэтому номера переводятся в ID векторно, а строковые ID
+создаются только для итоговых книг ответа. Массив пишется в снимок моделей
+как есть и открывается через memmap; все модели одного снимка делят один
+`IdMap`.
+
+`IdMap` ведёт себя как последовательность строковых ID (`ids[i]`, `len`,
+итерация) с поиском номера за O(1): `get`, `index`, `in`.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+import numpy as np
+from bson import ObjectId
+from beanie import PydanticObjectId
+
+# Двоичный ObjectId – 12 байт
+RAW_ID_DTYPE = "S12"
+RAW_ID_SIZE = 12
+
+# Начальная ёмкость буфера при добавлении ID
+_MIN_CAPACITY = 64
+
+
+def raw_id(value: Any) -> Optional[bytes]:
+    """Двоичный ObjectId для ObjectId, 24-символьной hex-строки или 12 байт.
+
+    Returns:
+        12 байт или None, если значение не является ObjectId
+    """
+
+    if isinstance(value, ObjectId):
+        return value.binary
+    if isinstance(value, str):
+        if len(value) != 2 * RAW_ID_SIZE:
+            return None
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            return None
+    if isinstance(value, (bytes, np.bytes_)):
+        # NumPy отрезает нулевые байты в конце элементов S12
+        return bytes(value).ljust(RAW_ID_SIZE, b"\0") if len(value) <= RAW_ID_SIZE else None
+    return None
+
+
+def hex_ids(raw: np.ndarray) -> List[str]:
+    """Строковые ID по массиву `S12` (векторно, без поэлементных ObjectId)."""
+
+    text = np.ascontiguousarray(raw).tobytes().hex()
+    step = 2 * RAW_ID_SIZE
+    return [text[start:start + step] for start in range(0, len(text), step)]
+
+
+class IdMap(Sequence[str]):
+    """Двустороннее соответствие ObjectId ↔ плотный номер."""
+
+    def __init__(self, raw: Optional[np.ndarray] = None) -> None:
+        # Буфер может быть memmap снимка – он копируется при первом добавлении
+        self._raw = raw if raw is not None else np.zeros(0, dtype=RAW_ID_DTYPE)
+        self._size = self._raw.shape[0]
+        data = self._raw.tobytes()
+        self._positions: Dict[bytes, int] = {
+            data[start:start + RAW_ID_SIZE]: index
+            for index, start in enumerate(range(0, len(data), RAW_ID_SIZE))
+        }
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[Any]) -> "IdMap":
+        """IdMap из ObjectId или строковых ID (порядок сохраняется, дубли – один номер)."""
+
+        id_map = cls()
+        for value in ids:
+            id_map.intern(value)
+        return id_map
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "IdMap":
+        """IdMap по сохранённому массиву: двоичному `S12` или hex-строкам прежнего формата."""
+
+        if array.dtype.kind == "S" and array.dtype.itemsize == RAW_ID_SIZE:
+            return cls(array)
+        return cls.from_ids(
+            value.decode("ascii") if isinstance(value, bytes) else value
+            for value in array.tolist()
+        )
+
+    @classmethod
+    def of(cls, ids: Union["IdMap", Iterable[Any]]) -> "IdMap":
+        return ids if isinstance(ids, IdMap) else cls.from_ids(ids)
+
+    # ------------------------------------------------------------------ #
+    #                          ID → номер                                #
+    # ------------------------------------------------------------------ #
+
+    def get(
+        self, value: Any, default: Optional[int] = None, limit: Optional[int] = None
+    ) -> Optional[int]:
+        """Номер ID или `default`, если ID не интернирован.
+
+        Args:
+            limit: Номера от `limit` и выше считаются отсутствующими – для
+                моделей, обученных на префиксе общего IdMap снимка
+        """
+
+        key = raw_id(value)
+        if key is None:
+            return default
+        position = self._positions.get(key)
+        if position is None or (limit is not None and position >= limit):
+            return default
+        return position
+
+    def index(self, value: Any, start: int = 0, stop: Optional[int] = None) -> int:
+        """Номер ID за O(1) (как `list.index`); ValueError, если ID нет."""
+
+        position = self.get(value, limit=stop)
+        if position is None or position < start:
+            raise ValueError(f"{value!r} is not in IdMap")
+        return position
+
+    def __contains__(self, value: object) -> bool:
+        return self.get(value) is not None
+
+    def intern(self, value: Any) -> int:
+        """Номер ID; новый ID получает следующий номер."""
+
+        key = raw_id(value)
+        if key is None:
+            raise ValueError(f"Некорректный ObjectId: {value!r}")
+        position = self._positions.get(key)
+        if position is None:
+            position = self._size
+            self._reserve(position + 1)
+            self._raw[position] = key
+            self._size += 1
+            self._positions[key] = position
+        return position
+
+    def intern_many(self, values: Iterable[Any]) -> np.ndarray:
+        """Номера последовательности ID (новые ID добавляются) в виде int32."""
+
+        return np.fromiter((self.intern(value) for value in values), dtype=np.int32)
+
+    # ------------------------------------------------------------------ #
+    #                          номер → ID                                #
+    # ------------------------------------------------------------------ #
+
+    def __len__(self) -> int:
+        return self._size
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return self.ids(np.arange(self._size)[index])
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("IdMap index out of range")
+        # Срез, а не элемент: скаляр S12 теряет нулевые байты в конце
+        return self._raw[index:index + 1].tobytes().hex()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids())
+
+    def ids(self, indices: Optional[Union[Sequence[int], np.ndarray]] = None) -> List[str]:
+        """Строковые ID по номерам (все ID, если `indices` не задан)."""
+
+        return hex_ids(self.raw if indices is None else self.raw[np.asarray(indices, dtype=np.int64)])
+
+    def object_ids(
+        self, indices: Optional[Union[Sequence[int], np.ndarray]] = None
+    ) -> List[PydanticObjectId]:
+        """ObjectId по номерам – для запросов к MongoDB без промежуточных строк."""
+
+        raw = self.raw if indices is None else self.raw[np.asarray(indices, dtype=np.int64)]
+        data = raw.tobytes()
+        return [
+            PydanticObjectId(data[start:start + RAW_ID_SIZE])
+            for start in range(0, len(data), RAW_ID_SIZE)
+        ]
+
+    @property
+    def raw(self) -> np.ndarray:
+        """Двоичные ID (`S12`) в порядке номеров."""
+
+        return self._raw[: self._size]
+
+    def copy(self) -> "IdMap":
+        return IdMap(self.raw.copy())
+
+    def _reserve(self, size: int) -> None:
+        if size <= self._raw.shape[0] and self._raw.flags.writeable:
+            return
+        capacity = max(size, 2 * self._raw.shape[0], _MIN_CAPACITY)
+        grown = np.zeros(capacity, dtype=RAW_ID_DTYPE)
+        grown[: self._size] = self._raw[: self._size]
+        self._raw = grown
@@ -0,0 +1,33 @@
+"""
+Обработчики событий записи взаимодействий.
+
+Все эндпоинты, которые создают или удаляют взаимодействия, вызывают эти
+функции, чтобы in-memory структуры рекомендаций, агрегаты трендов, профили
+предпочтений и кэш персональных рекомендаций оставались актуальными.
+"""
+from app.models.interaction import Interaction
+from app.services.interaction_model import interaction_model
+from app.services.recommendation_cache import recommendation_cache
+from app.services.trending_rollups import record_interaction
+from app.services.trending_stream import trending_stream
+from app.services.user_profiles import record_profile_interaction
+
+
+async def on_interaction_created(interaction: Interaction) -> None:
+    """Вызывается после успешной вставки взаимодействия."""
+
+    interaction_model.apply(interaction)
+    trending_stream.apply(interaction)
+    await recommendation_cache.invalidate_user(str(interaction.user_id))
+    await record_interaction(interaction)
+    await record_profile_interaction(interaction)
+
+
+async def on_interaction_deleted(interaction: Interaction) -> None:
+    """Вызывается после удаления взаимодействия."""
+
+    interaction_model.apply(interaction, removed=True)
+    trending_stream.apply(interaction, removed=True)
+    await recommendation_cache.invalidate_user(str(interaction.user_id))
+    await record_interaction(interaction, removed=True)
+    await record_profile_interaction(interaction, removed=True)
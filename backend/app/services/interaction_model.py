@@ -0,0 +1,464 @@
+"""
+Долгоживущая in-memory модель взаимодействий для collaborative filtering.
+
+Модель загружается один раз при старте приложения и далее обновляется
+инкрементально при каждой записи взаимодействия, поэтому персональные
+рекомендации не требуют полного сканирования коллекции interactions.
+Записи других воркеров модель дочитывает из MongoDB фоновой задачей `run_sync`.
+Пользователи и книги адресуются плотными номерами из `IdMap`.
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.core.config import settings
+from app.models.interaction import Interaction
+from app.services.compute_pool import MappedCSR
+from app.services.interaction_weights import (
+    CF_INTERACTION_TYPES,
+    interaction_weight,
+    user_item_weights_pipeline,
+)
+from app.services.id_map import IdMap
+from app.services.lean_data import InteractionRecord, load_interaction_records
+from app.services.model_snapshot import ModelSnapshot, encode_ids
+
+# Значения ниже порога после вычитания (удаление лайка) считаются нулём
+_ZERO_TOLERANCE = 1e-6
+
+
+def build_user_item_matrix_from_triplets(
+    user_keys: Sequence[Any],
+    book_keys: Sequence[Any],
+    weights: Sequence[float],
+) -> Tuple[IdMap, IdMap, sparse.csr_matrix]:
+    """Формирует разреженную (CSR, float32) матрицу пользователь-книга.
+
+    Матрица собирается из COO-триплетов, поэтому память и время построения
+    растут с числом взаимодействий, а не с произведением users × books.
+    Повторные пары (пользователь, книга) суммируются при конвертации в CSR.
+    Ключи – ObjectId или их строковые представления.
+    """
+
+    user_index_map = IdMap()
+    book_index_map = IdMap()
+    rows = user_index_map.intern_many(user_keys)
+    cols = book_index_map.intern_many(book_keys)
+
+    matrix = sparse.coo_matrix(
+        (np.asarray(weights, dtype=np.float32), (rows, cols)),
+        shape=(len(user_index_map), len(book_index_map)),
+        dtype=np.float32,
+    ).tocsr()
+
+    return user_index_map, book_index_map, matrix
+
+
+def build_user_item_matrix(
+    interactions: Sequence[Interaction],
+) -> Tuple[IdMap, IdMap, sparse.csr_matrix]:
+    """Формирует CSR-матрицу пользователь-книга по Beanie-документам."""
+
+    user_keys: List[Any] = []
+    book_keys: List[Any] = []
+    weights: List[float] = []
+
+    for interaction in interactions:
+        weight = interaction_weight(interaction)
+        if weight <= 0:
+            continue
+        user_keys.append(interaction.user_id)
+        book_keys.append(interaction.book_id)
+        weights.append(weight)
+
+    return build_user_item_matrix_from_triplets(user_keys, book_keys, weights)
+
+
+async def aggregate_user_item_weights(
+    match: Dict[str, Any],
+) -> Tuple[List[Any], List[Any], List[float]]:
+    """Считает веса пар (пользователь, книга) на стороне MongoDB.
+
+    Вместо гидрации каждого взаимодействия в Beanie/Pydantic-документ сервер
+    возвращает только компактные триплеты (user_id, book_id, weight) с ObjectId.
+    """
+
+    user_keys: List[Any] = []
+    book_keys: List[Any] = []
+    weights: List[float] = []
+
+    cursor = Interaction.get_motor_collection().aggregate(
+        user_item_weights_pipeline(match), allowDiskUse=True
+    )
+    async for document in cursor:
+        pair = document["_id"]
+        user_keys.append(pair["u"])
+        book_keys.append(pair["b"])
+        weights.append(document["w"])
+
+    return user_keys, book_keys, weights
+
+
+async def stream_user_item_matrix(
+    match: Dict[str, Any], batch_size: Optional[int] = None
+) -> Tuple[IdMap, IdMap, sparse.csr_matrix]:
+    """Строит CSR-матрицу по агрегации MongoDB, читая триплеты пакетами.
+
+    Каждый пакет сразу переводится в int32/float32-массивы, поэтому ключи
+    всех пар не накапливаются в памяти одновременно.
+    """
+
+    batch_size = batch_size or settings.MODEL_BUILD_BATCH_SIZE
+    user_index_map = IdMap()
+    book_index_map = IdMap()
+    rows: List[np.ndarray] = []
+    cols: List[np.ndarray] = []
+    weights: List[np.ndarray] = []
+    batch: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        rows.append(user_index_map.intern_many(d["_id"]["u"] for d in batch))
+        cols.append(book_index_map.intern_many(d["_id"]["b"] for d in batch))
+        weights.append(np.fromiter((d["w"] for d in batch), dtype=np.float32, count=len(batch)))
+        batch.clear()
+
+    cursor = Interaction.get_motor_collection().aggregate(
+        user_item_weights_pipeline(match), allowDiskUse=True, batchSize=batch_size
+    )
+    async for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    empty_index = np.zeros(0, dtype=np.int32)
+    matrix = sparse.coo_matrix(
+        (
+            np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            (
+                np.concatenate(rows) if rows else empty_index,
+                np.concatenate(cols) if cols else empty_index,
+            ),
+        ),
+        shape=(len(user_index_map), len(book_index_map)),
+        dtype=np.float32,
+    ).tocsr()
+    return user_index_map, book_index_map, matrix
+
+
+class InteractionModel:
+    """Матрица пользователь-книга, которая живёт всё время работы приложения.
+
+    Матрица хранится как база плюс дельта. База – результат полной загрузки из
+    MongoDB или снимок на диске (memmap, общий для воркеров хоста); дельта –
+    небольшая приватная CSR-матрица взаимодействий, записанных после базы.
+    Новые взаимодействия копятся как COO-триплеты и вливаются в дельту лениво,
+    при первом чтении после записи, так что база никогда не копируется.
+    """
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        """Сбрасывает модель и освобождает память (при остановке приложения)."""
+
+        self.user_index_map = IdMap()
+        self.book_index_map = IdMap()
+        self.is_loaded = False
+        # Версия и момент снимка, из которого загружена база (None – загрузка из MongoDB)
+        self.snapshot_version: Optional[str] = None
+        self.snapshot_time: Optional[datetime] = None
+        # База содержит взаимодействия с timestamp <= base_time (None – синхронизации нет)
+        self.base_time: Optional[datetime] = None
+        # Момент, до которого взаимодействия после базы дочитаны из MongoDB
+        self.synced_until: Optional[datetime] = None
+        # Файлы базы для передачи в пул процессов без копирования
+        self.base_source: Optional[MappedCSR] = None
+        self._base = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._base_popularity = np.zeros(0, dtype=np.float32)
+        self._delta = sparse.csr_matrix((0, 0), dtype=np.float32)
+        # ID взаимодействий после базы, учтённых в дельте и удалённых в этом воркере
+        self._applied_ids: Set[Any] = set()
+        self._removed_ids: Set[Any] = set()
+        self._matrix: Optional[sparse.csr_matrix] = None
+        self._popularity: Optional[np.ndarray] = None
+        self._clear_pending()
+
+    async def load(
+        self, until: Optional[datetime] = None, batch_size: Optional[int] = None
+    ) -> None:
+        """Загружает веса всех CF-взаимодействий из MongoDB и строит матрицу.
+
+        Args:
+            until: Учитывать только взаимодействия с timestamp <= until
+                (по умолчанию – момент начала загрузки)
+            batch_size: Размер пакета чтения агрегации
+        """
+
+        until = until or datetime.utcnow()
+        match: Dict[str, Any] = {
+            "interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]},
+            "timestamp": {"$lte": until},
+        }
+        self._reset_matrix(*await stream_user_item_matrix(match, batch_size))
+        self.base_time = until
+        self.synced_until = until
+
+    def load_interactions(self, interactions: Sequence[Interaction]) -> None:
+        """Полностью перестраивает модель по переданным взаимодействиям."""
+
+        self._reset_matrix(*build_user_item_matrix(interactions))
+
+    async def load_snapshot(self, snapshot: ModelSnapshot) -> None:
+        """Переключает базу на снимок и дочитывает взаимодействия после него.
+
+        Взаимодействия с timestamp > snapshot_time читаются из MongoDB, поэтому
+        после переключения учтены записи всех воркеров, а не только этого.
+        """
+
+        started = datetime.utcnow()
+        records = await self._load_records_after(snapshot.snapshot_time)
+
+        # Переключение состояния без await: запросы видят либо старую, либо новую модель.
+        # IdMap снимка общий с остальными моделями снимка; новые ID дельт
+        # получают номера после обученных
+        self._reset_matrix(
+            snapshot.id_map("interactions_user_ids"),
+            snapshot.id_map("interactions_book_ids"),
+            snapshot.csr("interactions"),
+            popularity=snapshot.array("interactions_popularity"),
+        )
+        self.snapshot_version = snapshot.version
+        self.snapshot_time = snapshot.snapshot_time
+        self.base_time = snapshot.snapshot_time
+        self.synced_until = started
+        self.base_source = snapshot.mapped_csr("interactions")
+        for record in records:
+            self._apply_record(record)
+
+    async def sync(self) -> None:
+        """Дочитывает из MongoDB взаимодействия, записанные другими воркерами.
+
+        Читается окно с перекрытием `INTERACTION_SYNC_OVERLAP_SECONDS` (запись
+        может попасть в коллекцию позже своего timestamp); уже учтённые ID
+        пропускаются. Удаление лайка, сделанное другим воркером, видно здесь
+        только после переключения на следующий снимок.
+        """
+
+        if self.base_time is None or self.synced_until is None:
+            return
+        base_time = self.base_time
+        started = datetime.utcnow()
+        overlap = timedelta(seconds=settings.INTERACTION_SYNC_OVERLAP_SECONDS)
+        records = await self._load_records_after(max(base_time, self.synced_until - overlap))
+        if self.base_time != base_time:
+            # Пока шло чтение, база переключилась и уже дочитала свои взаимодействия
+            return
+        for record in records:
+            self._apply_record(record)
+        self.synced_until = started
+
+    async def run_sync(self, interval: Optional[int] = None) -> None:
+        """Фоновая задача периодической синхронизации с MongoDB."""
+
+        interval = interval or settings.INTERACTION_SYNC_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception as err:  # pylint: disable=broad-except
+                print(f"⚠️  Не удалось дочитать взаимодействия: {err}")
+
+    def apply(self, interaction: Interaction, removed: bool = False) -> None:
+        """Применяет одно взаимодействие как дельту к матрице.
+
+        Args:
+            interaction: Записанное (или удалённое) взаимодействие
+            removed: True, если взаимодействие было удалено (например, снят лайк)
+        """
+
+        if not self.is_loaded:
+            return
+        if interaction.interaction_type not in CF_INTERACTION_TYPES:
+            return
+
+        weight = interaction_weight(interaction)
+        if weight <= 0:
+            return
+
+        if self._after_base(interaction):
+            if removed:
+                self._removed_ids.add(interaction.id)
+                if interaction.id not in self._applied_ids:
+                    # Взаимодействие другого воркера ещё не дочитано – вычитать нечего
+                    return
+                self._applied_ids.discard(interaction.id)
+            elif interaction.id in self._applied_ids:
+                # Уже дочитано синхронизацией
+                return
+            else:
+                self._applied_ids.add(interaction.id)
+        self._add_delta(
+            interaction.user_id,
+            interaction.book_id,
+            -weight if removed else weight,
+        )
+
+    def snapshot_values(self) -> Dict[str, Any]:
+        """Массивы модели для записи в снимок (см. model_snapshot)."""
+
+        return {
+            "interactions": self.matrix,
+            "interactions_popularity": self.popularity,
+            "interactions_user_ids": encode_ids(self.user_index_map),
+            "interactions_book_ids": encode_ids(self.book_index_map),
+        }
+
+    @property
+    def book_ids(self) -> IdMap:
+        """ID книг по номерам столбцов (тот же IdMap, что `book_index_map`)."""
+
+        return self.book_index_map
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.user_index_map), len(self.book_index_map)
+
+    @property
+    def base(self) -> sparse.csr_matrix:
+        """Базовая матрица (может быть меньше `shape`, если появились новые id)."""
+
+        return self._base
+
+    @property
+    def delta(self) -> sparse.csr_matrix:
+        """Дельта после базы размером `shape`."""
+
+        if self._pending_data:
+            self._merge_pending()
+        return self._delta
+
+    @property
+    def matrix(self) -> sparse.csr_matrix:
+        """Материализованная матрица база + дельта (CSR, float32).
+
+        Копирует базу – предназначена для офлайн-задач и снимков; онлайн-скоринг
+        работает с `base` и `delta` напрямую.
+        """
+
+        if self._pending_data:
+            self._merge_pending()
+        if self._matrix is None:
+            merged = self._base.copy()
+            merged.resize(self.shape)
+            merged = (merged + self._delta).tocsr()
+            merged.data[merged.data < _ZERO_TOLERANCE] = 0
+            merged.eliminate_zeros()
+            self._matrix = merged
+        return self._matrix
+
+    @property
+    def popularity(self) -> np.ndarray:
+        """Суммарный вес взаимодействий по каждой книге (столбцу матрицы)."""
+
+        if self._pending_data:
+            self._merge_pending()
+        if self._popularity is None:
+            popularity = np.zeros(self.shape[1], dtype=np.float32)
+            popularity[: self._base_popularity.shape[0]] = self._base_popularity
+            popularity += np.asarray(self._delta.sum(axis=0), dtype=np.float32).ravel()
+            self._popularity = popularity
+        return self._popularity
+
+    # ------------------------------------------------------------------ #
+
+    async def _load_records_after(self, moment: datetime) -> List[InteractionRecord]:
+        return await load_interaction_records(
+            {
+                "interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]},
+                "timestamp": {"$gt": moment},
+            }
+        )
+
+    def _after_base(self, interaction: Any) -> bool:
+        return (
+            self.base_time is not None
+            and interaction.timestamp is not None
+            and interaction.timestamp > self.base_time
+        )
+
+    def _apply_record(self, record: InteractionRecord) -> None:
+        if record.id in self._applied_ids or record.id in self._removed_ids:
+            return
+        weight = interaction_weight(record)
+        if weight <= 0:
+            return
+        self._applied_ids.add(record.id)
+        self._add_delta(record.user_id, record.book_id, weight)
+
+    def _add_delta(self, user_key: Any, book_key: Any, weight: float) -> None:
+        self._pending_rows.append(self.user_index_map.intern(user_key))
+        self._pending_cols.append(self.book_index_map.intern(book_key))
+        self._pending_data.append(weight)
+
+    def _merge_pending(self) -> None:
+        shape = self.shape
+        pending = sparse.coo_matrix(
+            (
+                np.asarray(self._pending_data, dtype=np.float32),
+                (
+                    np.asarray(self._pending_rows, dtype=np.int32),
+                    np.asarray(self._pending_cols, dtype=np.int32),
+                ),
+            ),
+            shape=shape,
+            dtype=np.float32,
+        ).tocsr()
+
+        delta = self._delta.copy()
+        delta.resize(shape)
+        # Дельта заменяется целиком, чтобы уже выданные ссылки оставались согласованными
+        self._delta = (delta + pending).tocsr()
+        self._matrix = None
+        self._popularity = None
+        self._clear_pending()
+
+    def _reset_matrix(
+        self,
+        user_index_map: IdMap,
+        book_index_map: IdMap,
+        matrix: sparse.csr_matrix,
+        popularity: Optional[np.ndarray] = None,
+    ) -> None:
+        self.user_index_map = user_index_map
+        self.book_index_map = book_index_map
+        self.snapshot_version = None
+        self.snapshot_time = None
+        self.base_time = None
+        self.synced_until = None
+        self.base_source = None
+        self._base = matrix
+        if popularity is None:
+            popularity = np.asarray(matrix.sum(axis=0), dtype=np.float32).ravel()
+        self._base_popularity = popularity
+        self._delta = sparse.csr_matrix(matrix.shape, dtype=np.float32)
+        self._applied_ids = set()
+        self._removed_ids = set()
+        self._matrix = matrix
+        self._popularity = None
+        self._clear_pending()
+        self.is_loaded = True
+
+    def _clear_pending(self) -> None:
+        self._pending_rows: List[int] = []
+        self._pending_cols: List[int] = []
+        self._pending_data: List[float] = []
+
+
+interaction_model = InteractionModel()
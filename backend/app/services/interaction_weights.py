@@ -0,0 +1,145 @@
+"""
+Веса взаимодействий, общие для движка рекомендаций и in-memory моделей.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from app.models.interaction import Interaction, InteractionType
+
+
+# Веса для различных типов взаимодействий
+INTERACTION_WEIGHTS: Dict[InteractionType, float] = {
+    InteractionType.VIEW: 1.0,
+    InteractionType.LIKE: 3.0,
+    InteractionType.ADD_TO_CART: 5.0,
+    InteractionType.REMOVE_FROM_CART: -2.0,
+    InteractionType.PURCHASE: 10.0,
+    InteractionType.REVIEW: 8.0,
+}
+
+# Типы взаимодействий, которые учитываются при collaborative filtering
+CF_INTERACTION_TYPES: Tuple[InteractionType, ...] = (
+    InteractionType.VIEW,
+    InteractionType.LIKE,
+    InteractionType.ADD_TO_CART,
+    InteractionType.PURCHASE,
+    InteractionType.REVIEW,
+)
+
+
+def interaction_weight(interaction: Interaction) -> float:
+    """Вычисляет вес взаимодействия с учётом метаданных."""
+
+    base_weight = INTERACTION_WEIGHTS.get(interaction.interaction_type, 0.0)
+    metadata = getattr(interaction, "metadata", None)
+
+    def _get(field: str, default=None):
+        if metadata is None:
+            return default
+        if isinstance(metadata, dict):
+            return metadata.get(field, default)
+        return getattr(metadata, field, default)
+
+    if interaction.interaction_type in (InteractionType.PURCHASE, InteractionType.ADD_TO_CART):
+        quantity = _get("quantity", 0) or 0
+        base_weight += float(quantity)
+        price = _get("price_at_purchase", 0) or 0
+        base_weight += float(price) / 1000.0  # небольшая поправка за дорогие покупки
+
+    if interaction.interaction_type == InteractionType.REVIEW:
+        rating = _get("rating")
+        if rating:
+            base_weight += float(rating)
+
+    if interaction.interaction_type == InteractionType.VIEW:
+        duration = _get("duration")
+        if duration:
+            base_weight += min(float(duration) / 120.0, 2.0)
+
+    return max(base_weight, 0.0)
+
+
+def interaction_weight_expression() -> Dict[str, Any]:
+    """MongoDB-выражение, вычисляющее тот же вес, что и `interaction_weight`.
+
+    Используется в aggregation pipeline, чтобы суммировать веса на стороне
+    сервера и не гидрировать каждое взаимодействие в Beanie-документ.
+    """
+
+    base_weight = {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": ["$interaction_type", itype.value]}, "then": weight}
+                for itype, weight in INTERACTION_WEIGHTS.items()
+            ],
+            "default": 0.0,
+        }
+    }
+    metadata_bonus = {
+        "$switch": {
+            "branches": [
+                {
+                    "case": {
+                        "$in": [
+                            "$interaction_type",
+                            [InteractionType.PURCHASE.value, InteractionType.ADD_TO_CART.value],
+                        ]
+                    },
+                    "then": {
+                        "$add": [
+                            {"$ifNull": ["$metadata.quantity", 0]},
+                            {
+                                "$divide": [
+                                    {"$ifNull": ["$metadata.price_at_purchase", 0]},
+                                    1000.0,
+                                ]
+                            },
+                        ]
+                    },
+                },
+                {
+                    "case": {"$eq": ["$interaction_type", InteractionType.REVIEW.value]},
+                    "then": {"$ifNull": ["$metadata.rating", 0]},
+                },
+                {
+                    "case": {"$eq": ["$interaction_type", InteractionType.VIEW.value]},
+                    "then": {
+                        "$min": [
+                            {"$divide": [{"$ifNull": ["$metadata.duration", 0]}, 120.0]},
+                            2.0,
+                        ]
+                    },
+                },
+            ],
+            "default": 0.0,
+        }
+    }
+    return {"$max": [{"$add": [base_weight, metadata_bonus]}, 0.0]}
+
+
+def user_item_weights_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pipeline, возвращающий суммарный вес по каждой паре (user_id, book_id).
+
+    Результат – компактные документы `{_id: {u, b}, w}` вместо полных
+    взаимодействий; пары с нулевым весом отбрасываются.
+    """
+
+    return [
+        {"$match": match},
+        {
+            "$project": {
+                "_id": 0,
+                "user_id": 1,
+                "book_id": 1,
+                "weight": interaction_weight_expression(),
+            }
+        },
+        {"$match": {"weight": {"$gt": 0}}},
+        {
+            "$group": {
+                "_id": {"u": "$user_id", "b": "$book_id"},
+                "w": {"$sum": "$weight"},
+            }
+        },
+    ]
@@ -0,0 +1,203 @@
+"""
+Таблица соседей item-item для item-based collaborative filtering.
+
+Для каждой книги заранее (офлайн) вычисляются K наиболее похожих книг по
+косинусной мере над столбцами матрицы пользователь-книга. При обслуживании
+запроса достаточно собрать соседей нескольких книг из истории пользователя,
+поэтому стоимость запроса равна O(история × K), а не O(число пользователей).
+
+Запуск офлайн-построения (отдельный .npz-файл):
+    python -m app.services.item_neighbors
+
+Вместе с остальными моделями таблица строится в снимок:
+    python -m app.services.build_models
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from app.core.config import settings
+from app.services.id_map import IdMap
+from app.services.model_snapshot import ModelSnapshot
+
+# Размер блока строк при вычислении сходства (ограничивает пиковую память)
+SIMILARITY_BLOCK_SIZE = 512
+
+
+class ItemNeighborTable:
+    """Компактная таблица top-K соседей для каждой книги.
+
+    ID книг – IdMap матрицы взаимодействий (в снимке общий с моделью
+    взаимодействий); книги с номерами за пределами таблицы не учитываются.
+    """
+
+    def __init__(
+        self,
+        book_ids: Union[IdMap, Sequence[str]],
+        neighbors: np.ndarray,
+        scores: np.ndarray,
+        popularity: np.ndarray,
+    ) -> None:
+        self.book_ids = IdMap.of(book_ids)
+        self.book_index_map = self.book_ids
+        # neighbors[i] – индексы соседей книги i (-1 = пусто), scores[i] – их сходство
+        self.neighbors = neighbors
+        self.scores = scores
+        self.popularity = popularity
+
+    @classmethod
+    def build(
+        cls,
+        matrix: sparse.csr_matrix,
+        book_ids: Union[IdMap, Sequence[str]],
+        k: int = 50,
+    ) -> "ItemNeighborTable":
+        """Строит таблицу по матрице пользователь-книга (users × books)."""
+
+        n_books = matrix.shape[1]
+        k = max(min(k, n_books - 1), 0)
+        neighbors = np.full((n_books, k), -1, dtype=np.int32)
+        scores = np.zeros((n_books, k), dtype=np.float32)
+
+        # Строки item_vectors – нормированные столбцы матрицы
+        item_vectors = normalize(matrix.T.tocsr().astype(np.float32), norm="l2", axis=1)
+        item_vectors_t = item_vectors.T.tocsc()
+
+        for start in range(0, n_books, SIMILARITY_BLOCK_SIZE):
+            stop = min(start + SIMILARITY_BLOCK_SIZE, n_books)
+            block = (item_vectors[start:stop] @ item_vectors_t).toarray()
+            block[np.arange(stop - start), np.arange(start, stop)] = 0  # без самой книги
+
+            if k == 0:
+                continue
+            top = np.argpartition(block, -k, axis=1)[:, -k:]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            top[top_scores <= 0] = -1
+            top_scores[top_scores <= 0] = 0
+            neighbors[start:stop] = top
+            scores[start:stop] = top_scores
+
+        popularity = np.asarray(matrix.sum(axis=0), dtype=np.float32).ravel()
+        return cls(book_ids, neighbors, scores, popularity)
+
+    def score_candidates(self, history: Mapping[Any, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Суммирует сходство соседей книг из истории пользователя.
+
+        Args:
+            history: Вес взаимодействия пользователя по ID каждой книги
+
+        Returns:
+            Индексы книг-кандидатов в таблице и их score
+        """
+
+        indices: List[int] = []
+        weights: List[float] = []
+        n_books = self.neighbors.shape[0]
+        for book_id, weight in history.items():
+            index = self.book_index_map.get(book_id, limit=n_books)
+            if index is not None and weight > 0:
+                indices.append(index)
+                weights.append(weight)
+
+        if not indices:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+
+        neighbor_rows = self.neighbors[indices]
+        contributions = self.scores[indices] * np.asarray(weights, dtype=np.float32)[:, None]
+        valid = neighbor_rows >= 0
+
+        candidate_indices, inverse = np.unique(neighbor_rows[valid], return_inverse=True)
+        candidate_scores = np.bincount(inverse, weights=contributions[valid])
+        return candidate_indices, candidate_scores
+
+    def snapshot_values(self) -> Dict[str, np.ndarray]:
+        """Массивы таблицы для снимка моделей.
+
+        ID книг и популярность совпадают с матрицей взаимодействий, по которой
+        построена таблица, и берутся из её массивов снимка.
+        """
+
+        return {"item_neighbors": self.neighbors, "item_neighbor_scores": self.scores}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: ModelSnapshot) -> Optional["ItemNeighborTable"]:
+        """Открывает таблицу из снимка (memmap) или None, если её там нет."""
+
+        if not snapshot.has("item_neighbors"):
+            return None
+        return cls(
+            snapshot.id_map("interactions_book_ids"),
+            snapshot.array("item_neighbors"),
+            snapshot.array("item_neighbor_scores"),
+            snapshot.array("interactions_popularity"),
+        )
+
+    def save(self, path: str) -> None:
+        """Сохраняет таблицу в .npz файл (атомарно, через временный файл)."""
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            book_ids=self.book_ids.raw[: self.neighbors.shape[0]],
+            neighbors=self.neighbors,
+            scores=self.scores,
+            popularity=self.popularity,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ItemNeighborTable":
+        """Загружает таблицу из .npz файла."""
+
+        with np.load(path) as data:
+            return cls(
+                IdMap.from_array(data["book_ids"]),
+                data["neighbors"],
+                data["scores"],
+                data["popularity"],
+            )
+
+
+def load_item_neighbors(path: Optional[str] = None) -> Optional[ItemNeighborTable]:
+    """Загружает таблицу соседей, если офлайн-задача уже её построила."""
+
+    path = path or settings.ITEM_NEIGHBORS_PATH
+    if not os.path.exists(path):
+        return None
+    return ItemNeighborTable.load(path)
+
+
+async def main():
+    """Офлайн-построение таблицы соседей по всем взаимодействиям."""
+
+    from app.db.mongodb import close_mongo_connection, connect_to_mongo
+    from app.services.interaction_model import InteractionModel
+
+    await connect_to_mongo()
+    try:
+        model = InteractionModel()
+        await model.load()
+        print(f"🔄 Матрица {model.matrix.shape}, ненулевых элементов: {model.matrix.nnz}")
+
+        table = ItemNeighborTable.build(
+            model.matrix, model.book_ids, k=settings.ITEM_NEIGHBORS_K
+        )
+        table.save(settings.ITEM_NEIGHBORS_PATH)
+        print(f"✅ Таблица соседей сохранена: {settings.ITEM_NEIGHBORS_PATH}")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,228 @@
+"""
+Облегчённый слой чтения данных для движка рекомендаций.
+
+Массовые выборки движка идут напрямую через коллекции Motor с узкими
+проекциями и декодируются в компактные записи со `__slots__` или NumPy-массивы,
+минуя валидацию Pydantic/Beanie. Beanie остаётся на путях записи и в API.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from beanie import PydanticObjectId
+
+from app.models.book import Book
+from app.models.interaction import Interaction, InteractionType
+from app.services.id_map import IdMap
+from app.services.interaction_weights import INTERACTION_WEIGHTS
+
+# Поля книги, которые нужны движку для расчёта score
+BOOK_RECORD_PROJECTION = {"genre": 1, "author": 1, "average_rating": 1, "tags": 1}
+
+INTERACTION_RECORD_PROJECTION = {
+    "user_id": 1,
+    "book_id": 1,
+    "interaction_type": 1,
+    "timestamp": 1,
+    "metadata": 1,
+}
+
+
+class BookRecord:
+    """Минимальное представление книги для скоринга."""
+
+    __slots__ = ("id", "genre", "author", "average_rating", "tags")
+
+    def __init__(
+        self,
+        id: PydanticObjectId,
+        genre: Optional[str],
+        author: Optional[str],
+        average_rating: float,
+        tags: List[str],
+    ) -> None:
+        self.id = id
+        self.genre = genre
+        self.author = author
+        self.average_rating = average_rating
+        self.tags = tags
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "BookRecord":
+        return cls(
+            document["_id"],
+            document.get("genre"),
+            document.get("author"),
+            document.get("average_rating") or 0.0,
+            document.get("tags") or [],
+        )
+
+
+class InteractionRecord:
+    """Минимальное представление взаимодействия (метаданные – сырой dict)."""
+
+    __slots__ = ("id", "user_id", "book_id", "interaction_type", "timestamp", "metadata")
+
+    def __init__(
+        self,
+        id: PydanticObjectId,
+        user_id: PydanticObjectId,
+        book_id: PydanticObjectId,
+        interaction_type: InteractionType,
+        timestamp: Optional[datetime],
+        metadata: Dict[str, Any],
+    ) -> None:
+        self.id = id
+        self.user_id = user_id
+        self.book_id = book_id
+        self.interaction_type = interaction_type
+        self.timestamp = timestamp
+        self.metadata = metadata
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "InteractionRecord":
+        return cls(
+            document["_id"],
+            document["user_id"],
+            document["book_id"],
+            InteractionType(document["interaction_type"]),
+            document.get("timestamp"),
+            document.get("metadata") or {},
+        )
+
+
+class CatalogArrays:
+    """Рейтинги, жанры и авторы книг в колоночном виде (порядок – номера `book_ids`).
+
+    Жанр и автор закодированы номерами (-1 – нет значения или книги нет в
+    каталоге), чтобы бонусы за предпочтения считались векторно.
+    """
+
+    __slots__ = ("book_ids", "present", "ratings", "genres", "authors", "genre_codes", "author_codes")
+
+    def __init__(
+        self, book_ids: IdMap, records: Iterable[BookRecord], count: Optional[int] = None
+    ) -> None:
+        """Раскладывает найденные книги по их номерам в `book_ids`.
+
+        Args:
+            book_ids: Номера книг
+            records: Найденные книги (в любом порядке)
+            count: Число первых номеров `book_ids`, для которых строятся массивы
+        """
+
+        count = len(book_ids) if count is None else count
+        self.book_ids = book_ids
+        self.genre_codes: Dict[str, int] = {}
+        self.author_codes: Dict[str, int] = {}
+        self.present = np.zeros(count, dtype=bool)
+        self.ratings = np.zeros(count, dtype=np.float64)
+        self.genres = np.full(count, -1, dtype=np.int32)
+        self.authors = np.full(count, -1, dtype=np.int32)
+        for record in records:
+            index = book_ids.get(record.id, limit=count)
+            if index is None:
+                continue
+            self.present[index] = True
+            self.ratings[index] = record.average_rating or 4.0
+            if record.genre:
+                self.genres[index] = self.genre_codes.setdefault(record.genre, len(self.genre_codes))
+            if record.author:
+                self.authors[index] = self.author_codes.setdefault(
+                    record.author, len(self.author_codes)
+                )
+
+
+def to_object_ids(ids: Iterable[Any]) -> List[PydanticObjectId]:
+    """Приводит строковые идентификаторы к ObjectId (без дублей)."""
+
+    return [PydanticObjectId(value) for value in set(ids)]
+
+
+async def load_book_records(book_ids: Iterable[Any]) -> Dict[str, BookRecord]:
+    """Загружает книги по ID в виде `BookRecord`, ключ – строковый ID."""
+
+    object_ids = to_object_ids(book_ids)
+    if not object_ids:
+        return {}
+
+    cursor = Book.get_motor_collection().find(
+        {"_id": {"$in": object_ids}}, BOOK_RECORD_PROJECTION
+    )
+    records: Dict[str, BookRecord] = {}
+    async for document in cursor:
+        record = BookRecord.from_document(document)
+        records[str(record.id)] = record
+    return records
+
+
+async def load_catalog_arrays(book_ids: IdMap, count: Optional[int] = None) -> CatalogArrays:
+    """Загружает книги первых `count` номеров IdMap в виде `CatalogArrays` (один запрос).
+
+    ID передаются в запрос как ObjectId прямо из двоичного массива IdMap,
+    без промежуточных строк.
+    """
+
+    count = len(book_ids) if count is None else count
+    if not count:
+        return CatalogArrays(book_ids, [], 0)
+    cursor = Book.get_motor_collection().find(
+        {"_id": {"$in": book_ids.object_ids(np.arange(count))}}, BOOK_RECORD_PROJECTION
+    )
+    records = [BookRecord.from_document(document) async for document in cursor]
+    return CatalogArrays(book_ids, records, count)
+
+
+async def load_interaction_records(match: Dict[str, Any]) -> List[InteractionRecord]:
+    """Загружает взаимодействия по фильтру в виде `InteractionRecord`."""
+
+    cursor = Interaction.get_motor_collection().find(match, INTERACTION_RECORD_PROJECTION)
+    return [InteractionRecord.from_document(document) async for document in cursor]
+
+
+async def load_interacted_book_ids(match: Dict[str, Any]) -> set[str]:
+    """Возвращает множество ID книг, по которым есть взаимодействия."""
+
+    book_ids = await Interaction.get_motor_collection().distinct("book_id", match)
+    return {str(book_id) for book_id in book_ids}
+
+
+async def load_weighted_events(
+    match: Dict[str, Any],
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Загружает события в колоночном виде для векторных расчётов.
+
+    Returns:
+        (book_ids, базовые веса по типу взаимодействия, timestamps в datetime64[ms])
+    """
+
+    type_weights = {itype.value: weight for itype, weight in INTERACTION_WEIGHTS.items()}
+    book_ids: List[str] = []
+    weights: List[float] = []
+    timestamps: List[datetime] = []
+
+    cursor = Interaction.get_motor_collection().find(
+        match, {"_id": 0, "book_id": 1, "interaction_type": 1, "timestamp": 1}
+    )
+    async for document in cursor:
+        book_ids.append(str(document["book_id"]))
+        weights.append(type_weights.get(document["interaction_type"], 0.0))
+        timestamps.append(document["timestamp"])
+
+    return (
+        book_ids,
+        np.asarray(weights, dtype=np.float64),
+        np.asarray(timestamps, dtype="datetime64[ms]"),
+    )
+
+
+async def load_books_in_order(book_ids: List[str]) -> List[Book]:
+    """Гидрирует в Beanie-документы только итоговые книги, сохраняя порядок."""
+
+    if not book_ids:
+        return []
+    books = await Book.find({"_id": {"$in": to_object_ids(book_ids)}}).to_list()
+    book_map = {str(book.id): book for book in books}
+    return [book_map[book_id] for book_id in book_ids if book_id in book_map]
@@ -0,0 +1,231 @@
+"""
+Версионированные снимки моделей рекомендаций на диске.
+
+Снимок – каталог `<MODEL_SNAPSHOT_DIR>/<версия>/` с `.npy`-файлами (массивы и
+CSR-матрицы, разложенные на data/indices/indptr) и `manifest.json`. Ссылка
+`current` указывает на опубликованную версию и переключается атомарно
+(os.replace symlink'а). Воркеры uvicorn открывают массивы через
+`numpy.load(mmap_mode="r")`, поэтому все процессы хоста делят одну копию
+данных через page cache, а новая версия подхватывается без перезапуска.
+
+Снимки строит офлайн-задача:
+    python -m app.services.build_models
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+from scipy import sparse
+
+from app.core.config import settings
+from app.services.compute_pool import MappedCSR, open_mapped_csr
+from app.services.id_map import RAW_ID_DTYPE, RAW_ID_SIZE, IdMap, hex_ids, raw_id
+
+MANIFEST_NAME = "manifest.json"
+CURRENT_LINK = "current"
+
+# ID документов MongoDB хранятся в двоичном виде (12 байт); в снимках
+# прежнего формата – 24 hex-символа
+OBJECT_ID_DTYPE = RAW_ID_DTYPE
+
+SnapshotValue = Union[np.ndarray, sparse.spmatrix]
+
+
+def encode_ids(ids: Union[IdMap, Sequence[str]]) -> np.ndarray:
+    """ID (строки или IdMap) → массив двоичных ObjectId фиксированной ширины."""
+
+    if isinstance(ids, IdMap):
+        return np.ascontiguousarray(ids.raw)
+    return np.asarray([raw_id(value) for value in ids], dtype=OBJECT_ID_DTYPE)
+
+
+def decode_ids(array: np.ndarray) -> List[str]:
+    """Обратное преобразование `encode_ids` (понимает и hex-массивы прежнего формата)."""
+
+    if array.dtype.itemsize == RAW_ID_SIZE:
+        return hex_ids(array)
+    return [value.decode("ascii") for value in array.tolist()]
+
+
+def snapshot_root(root: Optional[Union[str, Path]] = None) -> Path:
+    return Path(root or settings.MODEL_SNAPSHOT_DIR)
+
+
+class ModelSnapshot:
+    """Открытый (только для чтения) снимок моделей."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path).resolve()
+        with open(self.path / MANIFEST_NAME, encoding="utf-8") as manifest_file:
+            self.manifest: Dict[str, Any] = json.load(manifest_file)
+        self.version: str = self.manifest["version"]
+        # Снимок содержит взаимодействия с timestamp <= snapshot_time
+        self.snapshot_time = datetime.fromisoformat(self.manifest["snapshot_time"])
+        self._id_maps: Dict[str, IdMap] = {}
+
+    def has(self, name: str) -> bool:
+        return name in self.manifest["arrays"] or name in self.manifest["matrices"]
+
+    def array(self, name: str, mmap: bool = True) -> np.ndarray:
+        """Массив снимка; по умолчанию отображается в память без копирования."""
+
+        return np.load(
+            self._file(name), mmap_mode="r" if mmap else None, allow_pickle=False
+        )
+
+    def id_map(self, name: str) -> IdMap:
+        """IdMap по массиву ID снимка; все модели снимка получают один объект."""
+
+        id_map = self._id_maps.get(name)
+        if id_map is None:
+            id_map = IdMap.from_array(self.array(name))
+            self._id_maps[name] = id_map
+        return id_map
+
+    def mapped_csr(self, name: str) -> MappedCSR:
+        """Описание CSR-матрицы снимка (для передачи в пул процессов)."""
+
+        return MappedCSR(
+            data=str(self._file(f"{name}.data")),
+            indices=str(self._file(f"{name}.indices")),
+            indptr=str(self._file(f"{name}.indptr")),
+            shape=tuple(self.manifest["matrices"][name]),
+        )
+
+    def csr(self, name: str) -> sparse.csr_matrix:
+        """CSR-матрица поверх memmap-массивов (только для чтения)."""
+
+        return open_mapped_csr(self.mapped_csr(name))
+
+    def _file(self, name: str) -> Path:
+        return self.path / f"{name}.npy"
+
+
+def write_snapshot(
+    values: Mapping[str, SnapshotValue],
+    snapshot_time: datetime,
+    root: Optional[Union[str, Path]] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> ModelSnapshot:
+    """Записывает новую версию снимка и атомарно публикует её.
+
+    Каталог версии сначала пишется под временным именем и переименовывается
+    целиком, поэтому читатели никогда не видят частично записанный снимок.
+    """
+
+    root = snapshot_root(root)
+    root.mkdir(parents=True, exist_ok=True)
+    version = snapshot_time.strftime("%Y%m%dT%H%M%S%f")
+    staging = root / f".{version}.tmp"
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir()
+
+    manifest: Dict[str, Any] = {
+        "version": version,
+        "snapshot_time": snapshot_time.isoformat(),
+        "created_at": datetime.utcnow().isoformat(),
+        "arrays": [],
+        "matrices": {},
+        **(metadata or {}),
+    }
+    for name, value in values.items():
+        if sparse.issparse(value):
+            matrix = value.tocsr()
+            for part in ("data", "indices", "indptr"):
+                np.save(staging / f"{name}.{part}.npy", np.ascontiguousarray(getattr(matrix, part)))
+            manifest["matrices"][name] = list(matrix.shape)
+        else:
+            np.save(staging / f"{name}.npy", np.ascontiguousarray(value), allow_pickle=False)
+            manifest["arrays"].append(name)
+
+    with open(staging / MANIFEST_NAME, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False, indent=2)
+
+    os.replace(staging, root / version)
+    publish_version(version, root)
+    return ModelSnapshot(root / version)
+
+
+def publish_version(version: str, root: Optional[Union[str, Path]] = None) -> None:
+    """Атомарно переключает ссылку `current` на версию."""
+
+    root = snapshot_root(root)
+    staging_link = root / f".{CURRENT_LINK}.{os.getpid()}"
+    if staging_link.is_symlink():
+        staging_link.unlink()
+    os.symlink(version, staging_link)
+    os.replace(staging_link, root / CURRENT_LINK)
+
+
+def current_version(root: Optional[Union[str, Path]] = None) -> Optional[str]:
+    """Имя опубликованной версии или None."""
+
+    link = snapshot_root(root) / CURRENT_LINK
+    if not link.is_symlink():
+        return None
+    return os.path.basename(os.readlink(link))
+
+
+def open_current(root: Optional[Union[str, Path]] = None) -> Optional[ModelSnapshot]:
+    """Открывает опубликованную версию снимка."""
+
+    version = current_version(root)
+    if version is None:
+        return None
+    return ModelSnapshot(snapshot_root(root) / version)
+
+
+def prune_versions(keep: Optional[int] = None, root: Optional[Union[str, Path]] = None) -> None:
+    """Удаляет старые версии, оставляя `keep` последних и опубликованную.
+
+    Воркеры, ещё использующие удалённую версию, продолжают читать её через
+    открытые отображения до переключения на новую.
+    """
+
+    root = snapshot_root(root)
+    keep = keep or settings.MODEL_SNAPSHOT_KEEP
+    current = current_version(root)
+    versions = sorted(
+        entry.name
+        for entry in root.iterdir()
+        if entry.is_dir() and not entry.is_symlink() and not entry.name.startswith(".")
+    )
+    for version in versions[:-keep]:
+        if version != current:
+            shutil.rmtree(root / version, ignore_errors=True)
+
+
+async def watch_snapshots(
+    load: Callable[[ModelSnapshot], Awaitable[None]],
+    version: Optional[str] = None,
+    interval: Optional[int] = None,
+) -> None:
+    """Фоновая задача: передаёт в `load` каждую новую опубликованную версию.
+
+    Args:
+        load: Загрузка моделей воркера из снимка
+        version: Уже загруженная версия
+        interval: Период проверки ссылки `current` (сек)
+    """
+
+    interval = interval or settings.MODEL_SNAPSHOT_POLL_SECONDS
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = current_version()
+            if current is None or current == version:
+                continue
+            snapshot = ModelSnapshot(snapshot_root() / current)
+            await load(snapshot)
+            version = snapshot.version
+            print(f"🔄 Модели переключены на снимок {snapshot.version}")
+        except Exception as err:  # pylint: disable=broad-except
+            print(f"⚠️  Не удалось загрузить снимок моделей: {err}")
@@ -0,0 +1,139 @@
+"""
+Отложенная запись выведенных предпочтений пользователей.
+
+Если у пользователя не заданы любимые жанры или авторы, движок выводит их из
+взаимодействий прямо на пути чтения (/for-you, /new). Чтобы GET-запрос не
+ждал записи в MongoDB и не конкурировал за документ пользователя, выведенные
+значения ставятся в очередь: фоновый писатель раз в
+PREFERENCE_WRITE_INTERVAL_SECONDS сбрасывает все накопленные обновления одним
+`bulk_write`.
+
+Пока запись не выполнена, значения из очереди отдаются повторным запросам,
+поэтому предпочтения пользователя выводятся один раз. Обновление применяется
+только к пустому полю: предпочтения, заданные самим пользователем, не
+перезаписываются.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import UpdateOne
+
+from app.core.config import settings
+from app.models.user import User
+
+# Поле предпочтений → выведенные значения
+PendingPreferences = Dict[str, List[str]]
+
+PREFERENCE_FIELDS = ("favorite_genres", "favorite_authors")
+
+
+def _update_operation(user_id: str, field: str, values: List[str]) -> UpdateOne:
+    return UpdateOne(
+        {"_id": PydanticObjectId(user_id), "$or": [{field: None}, {field: {"$size": 0}}]},
+        {"$set": {field: values}},
+    )
+
+
+class PreferenceWriter:
+    """Очередь выведенных предпочтений с пакетной фоновой записью."""
+
+    def __init__(self) -> None:
+        # user_id → ещё не записанные поля (повторные выводы объединяются)
+        self._pending: Dict[str, PendingPreferences] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, user_id: str, genres: List[str], authors: List[str]) -> None:
+        """Ставит выведенные жанры и авторов пользователя в очередь на запись.
+
+        Пустые списки не записываются.
+        """
+
+        pending = self._pending.setdefault(user_id, {})
+        for field, values in zip(PREFERENCE_FIELDS, (genres, authors)):
+            if values:
+                pending[field] = list(values)
+        if not pending:
+            del self._pending[user_id]
+            return
+        self._wakeup.set()
+
+    def pending(self, user_id: str) -> Tuple[List[str], List[str]]:
+        """Ещё не записанные жанры и авторы пользователя (пустые, если их нет)."""
+
+        pending = self._pending.get(user_id, {})
+        return pending.get("favorite_genres", []), pending.get("favorite_authors", [])
+
+    def discard(self, user_id: str) -> None:
+        """Отменяет запись (пользователь сам изменил предпочтения)."""
+
+        self._pending.pop(user_id, None)
+
+    async def flush(self) -> int:
+        """Записывает все накопленные обновления одним bulk_write.
+
+        Returns:
+            Число обновлённых полей
+        """
+
+        if not self._pending:
+            return 0
+        batch = {user_id: dict(fields) for user_id, fields in self._pending.items()}
+        operations = [
+            _update_operation(user_id, field, values)
+            for user_id, fields in batch.items()
+            for field, values in fields.items()
+        ]
+        await User.get_motor_collection().bulk_write(operations, ordered=False)
+
+        # Выводы, поставленные во время записи, остаются в очереди
+        for user_id, fields in batch.items():
+            if self._pending.get(user_id) == fields:
+                del self._pending[user_id]
+        return len(operations)
+
+    async def run(self, interval: Optional[float] = None) -> None:
+        """Фоновая задача: сбрасывает очередь не чаще раза в `interval` секунд."""
+
+        interval = interval or settings.PREFERENCE_WRITE_INTERVAL_SECONDS
+        while True:
+            await self._wakeup.wait()
+            # Окно накопления: обновления за интервал уходят одним пакетом
+            await asyncio.sleep(interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as err:  # pylint: disable=broad-except
+                print(f"⚠️  Не удалось записать предпочтения пользователей: {err}")
+                self._wakeup.set()
+
+    def start(self) -> None:
+        """Запускает фоновую запись (в lifespan приложения)."""
+
+        if not self.is_running:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую запись и сбрасывает остаток очереди."""
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as err:  # pylint: disable=broad-except
+            print(f"⚠️  Не удалось записать предпочтения пользователей: {err}")
+        self._pending.clear()
+
+
+preference_writer = PreferenceWriter()
@@ -0,0 +1,137 @@
+"""
+Общие вспомогательные функции ранжирования.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.services.compute_pool import MatrixSource, resolve_csr
+
+# Веса ниже порога (например, после удаления лайка) считаются нулём
+ZERO_TOLERANCE = 1e-6
+
+
+def top_indices(scores: np.ndarray, limit: int) -> np.ndarray:
+    """Индексы `limit` наибольших положительных score по убыванию."""
+
+    candidates = np.flatnonzero(scores > 0)
+    if candidates.size > limit:
+        partition = np.argpartition(scores[candidates], -limit)[-limit:]
+        candidates = candidates[partition]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _row_norms_sq(matrix: sparse.csr_matrix) -> np.ndarray:
+    """Квадраты норм строк CSR-матрицы за O(nnz) без копирования матрицы."""
+
+    cumulative = np.concatenate(([0.0], np.cumsum(np.square(matrix.data, dtype=np.float64))))
+    return cumulative[matrix.indptr[1:]] - cumulative[matrix.indptr[:-1]]
+
+
+def row_norms(matrix: sparse.csr_matrix) -> np.ndarray:
+    """Нормы строк CSR-матрицы."""
+
+    return np.sqrt(np.maximum(_row_norms_sq(matrix), 0))
+
+
+def score_user_based(
+    base_source: MatrixSource,
+    delta: Optional[sparse.csr_matrix],
+    target_index: int,
+    multipliers: np.ndarray,
+    limit: int,
+) -> np.ndarray:
+    """User-based CF: индексы top-N книг для пользователя `target_index`.
+
+    score[b] = Σ_u sim[u] · w[u, b] · multipliers[b], где sim – неотрицательное
+    косинусное сходство с другими пользователями, а w = база + дельта.
+    База может быть меньше дельты (новые пользователи и книги) и не
+    копируется: её можно передать через shared memory или файлы снимка.
+    Функция выполняется в пуле (см. compute_pool).
+    """
+
+    base = resolve_csr(base_source)
+    n_users, n_books = delta.shape if delta is not None else base.shape
+    base_users, base_books = base.shape
+
+    target = np.zeros(n_books, dtype=np.float64)
+    if target_index < base_users:
+        row = base[target_index]
+        target[row.indices] += row.data
+    if delta is not None:
+        row = delta[target_index]
+        target[row.indices] += row.data
+    target[target < ZERO_TOLERANCE] = 0
+
+    # Скалярные произведения и нормы строк (база + дельта) без материализации суммы
+    dots = np.zeros(n_users, dtype=np.float64)
+    dots[:base_users] = base @ target[:base_books]
+    norms_sq = np.zeros(n_users, dtype=np.float64)
+    norms_sq[:base_users] = _row_norms_sq(base)
+    if delta is not None and delta.nnz:
+        dots += delta @ target
+        # ||b + d||² = ||b||² + 2·b·d + ||d||² – перекрёстный член только для строк дельты
+        norms_sq += _row_norms_sq(delta)
+        rows = np.unique(delta.nonzero()[0])
+        rows = rows[rows < base_users]
+        if rows.size:
+            overlap = delta[rows][:, :base_books]
+            cross = np.asarray(base[rows].multiply(overlap).sum(axis=1)).ravel()
+            norms_sq[rows] += 2 * cross
+
+    norms = np.sqrt(np.maximum(norms_sq, 0)) * np.linalg.norm(target)
+    similarities = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+    similarities[target_index] = 0  # не сравниваем пользователя с самим собой
+    # Учитываем только похожих пользователей
+    np.clip(similarities, 0, None, out=similarities)
+
+    scores = np.zeros(n_books, dtype=np.float64)
+    scores[:base_books] = base.T @ similarities[:base_users]
+    if delta is not None:
+        scores += delta.T @ similarities
+    return top_indices(scores[: multipliers.shape[0]] * multipliers, limit)
+
+
+def score_user_based_block(
+    matrix: sparse.csr_matrix,
+    norms: np.ndarray,
+    target_indices: np.ndarray,
+    multipliers: np.ndarray,
+    limit: int,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """User-based CF сразу для блока пользователей.
+
+    То же, что `score_user_based` для каждого из `target_indices`, но сходство
+    и score блока считаются двумя произведениями разреженных матриц:
+    sim = T · Wᵀ и scores = sim · W.
+
+    Args:
+        matrix: Материализованная матрица пользователь-книга (база + дельта)
+        norms: Нормы строк `matrix`
+        target_indices: Строки пользователей блока
+        multipliers: Множители score книг для каждого пользователя блока (блок × книги)
+        limit: Размер выдачи
+
+    Returns:
+        Индексы top-N книг и их score для каждого пользователя блока
+    """
+
+    targets = matrix[target_indices]
+    dots = (targets @ matrix.T).tocoo()
+    inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    similarities = dots.data * inverse_norms[target_indices][dots.row] * inverse_norms[dots.col]
+    # Без самого пользователя и только похожие пользователи
+    similarities[dots.col == target_indices[dots.row]] = 0
+    np.clip(similarities, 0, None, out=similarities)
+    similarity_matrix = sparse.csr_matrix(
+        (similarities, (dots.row, dots.col)), shape=dots.shape
+    )
+
+    scores = (similarity_matrix @ matrix).toarray()
+    scores *= multipliers
+    ranked = []
+    for row in scores:
+        top = top_indices(row, limit)
+        ranked.append((top, row[top]))
+    return ranked
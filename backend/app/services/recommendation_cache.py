@@ -0,0 +1,173 @@
+"""
+Кэш персональных рекомендаций.
+
+LRU-кэш с TTL по ключу (user_id, корзина limit). Записи пользователя
+сбрасываются при любом его взаимодействии (включая корзину и заказы) и при
+изменении предпочтений; остальные изменения данных (новые взаимодействия
+других пользователей, каталог) учитываются по истечении TTL.
+
+Кэш у каждого воркера свой, поэтому инвалидация увеличивает поколение
+пользователя в MongoDB (`RecommendationGeneration`), а попадание проверяет,
+что запись посчитана при текущем поколении.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from beanie import PydanticObjectId
+
+from app.core.config import settings
+from app.models.book import Book
+from app.models.recommendation_generation import RecommendationGeneration
+
+# Корзины limit: запрос с limit=7 обслуживается префиксом списка на 10 книг
+LIMIT_BUCKETS: Tuple[int, ...] = (10, 20, 50)
+
+CacheKey = Tuple[str, int]
+
+
+def limit_bucket(limit: int) -> int:
+    """Наименьшая корзина, вмещающая `limit` (или сам limit, если он больше всех)."""
+
+    for bucket in LIMIT_BUCKETS:
+        if limit <= bucket:
+            return bucket
+    return limit
+
+
+class RecommendationCache:
+    """Ограниченный LRU+TTL кэш списков рекомендаций."""
+
+    def __init__(
+        self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = time.monotonic
+        self.clear()
+
+    def clear(self) -> None:
+        """Очищает кэш и счётчики."""
+
+        # Запись: (момент истечения, поколение пользователя при расчёте, книги)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, int, List[Book]]]" = OrderedDict()
+        self._user_buckets: Dict[str, Set[int]] = {}
+        # Поколение пользователя растёт при каждой инвалидации, чтобы результат,
+        # посчитанный до записи взаимодействия, не отдавался после неё
+        # (локальные поколения – если общие выключены)
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # ------------------------------------------------------------------ #
+
+    async def get(self, user_id: str, bucket: int) -> Optional[List[Book]]:
+        """Возвращает актуальную запись или None."""
+
+        key = (user_id, bucket)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, generation, books = entry
+        if expires_at <= self._clock():
+            self._discard(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        if generation != await self.generation(user_id):
+            # Пользователь записал взаимодействие (возможно, в другом воркере)
+            if self._entries.get(key) is entry:
+                self._discard(key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self.hits += 1
+        return books
+
+    async def generation(self, user_id: str) -> int:
+        """Текущее поколение записей пользователя."""
+
+        if not settings.RECOMMENDATION_CACHE_SHARED_GENERATIONS:
+            return self._generations.get(user_id, 0)
+        document = await RecommendationGeneration.get_motor_collection().find_one(
+            {"user_id": PydanticObjectId(user_id)}, {"_id": 0, "generation": 1}
+        )
+        return document["generation"] if document else 0
+
+    def set(self, user_id: str, bucket: int, books: List[Book], generation: int) -> None:
+        """Сохраняет список, посчитанный при поколении `generation`.
+
+        Если поколение с тех пор сменилось, запись отбросит первое же попадание.
+        """
+
+        if (
+            not settings.RECOMMENDATION_CACHE_SHARED_GENERATIONS
+            and generation != self._generations.get(user_id, 0)
+        ):
+            return
+
+        key = (user_id, bucket)
+        ttl = self.ttl_seconds or settings.RECOMMENDATION_CACHE_TTL_SECONDS
+        self._entries[key] = (self._clock() + ttl, generation, books)
+        self._entries.move_to_end(key)
+        self._user_buckets.setdefault(user_id, set()).add(bucket)
+
+        max_entries = self.max_entries or settings.RECOMMENDATION_CACHE_SIZE
+        while len(self._entries) > max_entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """Сбрасывает все записи пользователя во всех воркерах."""
+
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        buckets = self._user_buckets.pop(user_id, None)
+        if buckets:
+            for bucket in buckets:
+                self._entries.pop((user_id, bucket), None)
+            self.invalidations += 1
+        if settings.RECOMMENDATION_CACHE_SHARED_GENERATIONS:
+            await RecommendationGeneration.get_motor_collection().update_one(
+                {"user_id": PydanticObjectId(user_id)},
+                {"$inc": {"generation": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+            )
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий, промахов и вытеснений."""
+
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    # ------------------------------------------------------------------ #
+
+    def _discard(self, key: CacheKey) -> None:
+        self._entries.pop(key, None)
+        user_id, bucket = key
+        buckets = self._user_buckets.get(user_id)
+        if buckets is not None:
+            buckets.discard(bucket)
+            if not buckets:
+                del self._user_buckets[user_id]
+
+
+recommendation_cache = RecommendationCache()
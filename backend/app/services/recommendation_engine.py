@@ -1,43 +1,71 @@
 from __future__ import annotations
 
-import math
+import asyncio
 from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
 import numpy as np
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
 from beanie import PydanticObjectId
 
+from app.core.config import settings
 from app.models.book import Book
 from app.models.user import User
 from app.models.interaction import Interaction, InteractionType
+from app.models.similar_books import SimilarBooks
+from app.models.user_recommendations import UserRecommendations
+from app.services.als_model import ALSModel
+from app.services.catalog_top_lists import CatalogTopLists
+from app.services.compute_pool import compute_pool
+from app.services.content_index import ContentIndex
+from app.services.id_map import IdMap
+from app.services.interaction_model import (
+    InteractionModel,
+    aggregate_user_item_weights,
+    build_user_item_matrix_from_triplets,
+)
+from app.services.interaction_weights import (  # noqa: F401 – реэкспорт весов
+    CF_INTERACTION_TYPES,
+    INTERACTION_WEIGHTS,
+    interaction_weight,
+)
+from app.services.item_neighbors import ItemNeighborTable
+from app.services.lean_data import (
+    BookRecord,
+    CatalogArrays,
+    load_book_records,
+    load_books_in_order,
+    load_catalog_arrays,
+    load_interacted_book_ids,
+    load_interaction_records,
+    load_weighted_events,
+)
+from app.services.preference_writer import PreferenceWriter
+from app.services.ranking import (
+    row_norms,
+    score_user_based,
+    score_user_based_block,
+    top_indices,
+)
+from app.services.recommendation_cache import RecommendationCache, limit_bucket
+from app.services.single_flight import SingleFlight, coalesced
+from app.services.trending_rollups import top_trending_book_ids
+from app.services.trending_stream import TrendingStream
+from app.services.user_profiles import load_profile_favorites
 
 
-# Веса для различных типов взаимодействий
-INTERACTION_WEIGHTS: Dict[InteractionType, float] = {
-    InteractionType.VIEW: 1.0,
-    InteractionType.LIKE: 3.0,
-    InteractionType.ADD_TO_CART: 5.0,
-    InteractionType.REMOVE_FROM_CART: -2.0,
-    InteractionType.PURCHASE: 10.0,
-    InteractionType.REVIEW: 8.0,
-}
-
-# Типы взаимодействий, которые учитываются при collaborative filtering
-CF_INTERACTION_TYPES: Tuple[InteractionType, ...] = (
-    InteractionType.VIEW,
-    InteractionType.LIKE,
-    InteractionType.ADD_TO_CART,
-    InteractionType.PURCHASE,
-    InteractionType.REVIEW,
-)
+T = TypeVar("T")
 
 # Ограничение числа кандидатов для content-based расчётов
 MAX_CONTENT_CANDIDATES = 250
 
+# Во сколько раз больше limit кандидатов ALS переранжируется с учётом каталога
+ALS_CANDIDATE_FACTOR = 5
+
 # Веса предпочтений пользователя
 PREFERENCE_WEIGHTS = {
     "genre_bonus": 1.15,   # множитель за совпадение жанра
@@ -47,38 +75,293 @@ PREFERENCE_WEIGHTS = {
 }
 
 
+async def _within_budget(awaitable: Awaitable[T], default: T) -> T:
+    """Результат источника данных или `default`, если он не уложился в бюджет."""
+
+    try:
+        return await asyncio.wait_for(awaitable, settings.COLD_START_SOURCE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return default
+
+
+class BatchState:
+    """Данные моделей и каталога, зафиксированные на один пакетный расчёт.
+
+    Используется только одна модель – согласно RECOMMENDATION_CF_MODE,
+    как в `get_personalized_recommendations`.
+    """
+
+    def __init__(self) -> None:
+        self.als_model: Optional[ALSModel] = None
+        self.item_neighbors: Optional[ItemNeighborTable] = None
+        # User-based CF: материализованная матрица (float64) и нормы её строк
+        self.matrix: Optional[sparse.csr_matrix] = None
+        self.norms: Optional[np.ndarray] = None
+        self.user_index_map = IdMap()
+        # Книги модели: первые n_books номеров IdMap (он может расти после фиксации)
+        self.book_ids = IdMap()
+        self.n_books = 0
+        self.popularity_penalty: Optional[np.ndarray] = None
+        # None – модели нет, пользователи считаются по одному
+        self.catalog: Optional[CatalogArrays] = None
+
+    def book_index(self, book_id: Any) -> Optional[int]:
+        return self.book_ids.get(book_id, limit=self.n_books)
+
+    def ranked(self, indices: np.ndarray, scores: np.ndarray) -> List[Tuple[str, float]]:
+        return list(zip(self.book_ids.ids(indices), np.asarray(scores, dtype=np.float64).tolist()))
+
+
 class RecommendationEngine:
     """Главный сервис рекомендаций."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        interaction_model: Optional[InteractionModel] = None,
+        item_neighbors: Optional[ItemNeighborTable] = None,
+        content_index: Optional[ContentIndex] = None,
+        trending_stream: Optional[TrendingStream] = None,
+        recommendation_cache: Optional[RecommendationCache] = None,
+        als_model: Optional[ALSModel] = None,
+        catalog_top_lists: Optional[CatalogTopLists] = None,
+        preference_writer: Optional[PreferenceWriter] = None,
+    ) -> None:
         self._now = datetime.utcnow
+        # Одинаковые конкурентные вызовы публичных методов выполняются один раз
+        self._in_flight = SingleFlight()
+        # Долгоживущая модель взаимодействий (загружается в lifespan приложения)
+        self.interaction_model = interaction_model
+        # Предрасчитанная таблица соседей для item-based режима
+        self.item_neighbors = item_neighbors
+        # Каталожный TF-IDF индекс для похожих книг
+        self.content_index = content_index
+        # Потоковые trending-счётчики (режим TRENDING_MODE="stream")
+        self.trending_stream = trending_stream
+        # Кэш персональных рекомендаций (LRU + TTL)
+        self.recommendation_cache = recommendation_cache
+        # Факторы implicit ALS для режима RECOMMENDATION_CF_MODE="als"
+        self.als_model = als_model
+        # Списки лучших книг жанров, авторов и каталога в памяти
+        self.catalog_top_lists = catalog_top_lists
+        # Отложенная запись выведенных предпочтений (без неё – user.save() сразу)
+        self.preference_writer = preference_writer
 
     # ------------------------------------------------------------------ #
     #                      PUBLIC API МЕТОДЫ                             #
     # ------------------------------------------------------------------ #
 
+    @coalesced
     async def get_personal_recommendations(
         self, user_id: str, limit: int = 10
     ) -> List[Book]:
-        """Основная точка входа – персональные рекомендации."""
+        """Основная точка входа – персональные рекомендации.
+
+        При наличии кэша список считается для корзины limit и отдаётся префиксом.
+        """
+
+        cache = self.recommendation_cache
+        if cache is None:
+            return await self.get_personalized_recommendations(user_id=user_id, limit=limit)
+
+        bucket = limit_bucket(limit)
+        books = await cache.get(user_id, bucket)
+        if books is None:
+            generation = await cache.generation(user_id)
+            books = await self.get_personalized_recommendations(user_id=user_id, limit=bucket)
+            cache.set(user_id, bucket, books, generation)
+        return books[:limit]
+
+    async def iter_batch_recommendations(
+        self,
+        user_ids: Sequence[str],
+        limit: int = 10,
+        block_size: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[str, List[str]]]:
+        """Персональные рекомендации для многих пользователей (рассылки).
+
+        Модель и каталог читаются один раз на пакет (`prepare_batch`), а score
+        считается блоками по `block_size` пользователей произведением матриц.
+        Пользователи, которых нельзя оценить по модели, получают обычный
+        `get_personalized_recommendations` (в т.ч. cold-start).
+
+        Yields:
+            (ID пользователя, ID рекомендованных книг) в порядке `user_ids`
+        """
+
+        block_size = block_size or settings.RECOMMENDATION_BATCH_BLOCK_SIZE
+        state = await self.prepare_batch()
+        for start in range(0, len(user_ids), block_size):
+            block = list(user_ids[start:start + block_size])
+            results = await self.score_batch_block(state, block, limit)
+            for user_id in block:
+                ranked = results[user_id]
+                if ranked is None:
+                    books = await self.get_personalized_recommendations(user_id=user_id, limit=limit)
+                    yield user_id, [str(book.id) for book in books]
+                else:
+                    yield user_id, [book_id for book_id, _ in ranked]
+
+    async def prepare_batch(self) -> BatchState:
+        """Фиксирует данные моделей и каталога для пакетного расчёта."""
+
+        mode = settings.RECOMMENDATION_CF_MODE
+        model = self.interaction_model
+        state = BatchState()
+        if mode == "als" and self.als_model is not None:
+            state.als_model = model_data = self.als_model
+        elif mode == "item" and self.item_neighbors is not None:
+            state.item_neighbors = model_data = self.item_neighbors
+        elif model is not None and model.is_loaded:
+            state.matrix = model.matrix.astype(np.float64)
+            state.norms = row_norms(state.matrix)
+            state.user_index_map = model.user_index_map
+            model_data = model
+        else:
+            return state
+
+        state.book_ids = model_data.book_ids
+        state.n_books = model_data.popularity.shape[0]
+        state.popularity_penalty = 1 + np.log1p(model_data.popularity)
+        state.catalog = await load_catalog_arrays(state.book_ids, state.n_books)
+        return state
+
+    async def score_batch_block(
+        self, state: BatchState, user_ids: Sequence[str], limit: int = 10
+    ) -> Dict[str, Optional[List[Tuple[str, float]]]]:
+        """Рекомендации блока пользователей по данным пакета.
+
+        Returns:
+            Пользователь → [(ID книги, score)]; None – пользователя нельзя
+            оценить по модели (cold-start, нет в модели, модель не загружена)
+        """
+
+        object_ids = [
+            PydanticObjectId(user_id) for user_id in user_ids if PydanticObjectId.is_valid(user_id)
+        ]
+        users = {
+            str(user.id): user for user in await User.find({"_id": {"$in": object_ids}}).to_list()
+        }
+        block_interactions: Dict[str, List[Interaction]] = defaultdict(list)
+        for record in await load_interaction_records(
+            {
+                "user_id": {"$in": object_ids},
+                "interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]},
+            }
+        ):
+            block_interactions[str(record.user_id)].append(record)
+
+        results: Dict[str, Optional[List[Tuple[str, float]]]] = {}
+        # Пользователи блока для матричного расчёта и их данные
+        scored: List[str] = []
+        rows: List[int] = []
+        vectors: List[np.ndarray] = []
+        excluded_rows: List[List[int]] = []
+        multiplier_rows: List[np.ndarray] = []
+
+        for user_id in user_ids:
+            user = users.get(user_id)
+            if user is None:
+                results[user_id] = []
+                continue
+            target_interactions = block_interactions.get(user_id)
+            if not target_interactions or state.catalog is None:
+                results[user_id] = None
+                continue
 
-        return await self.get_personalized_recommendations(user_id=user_id, limit=limit)
+            favorite_genres, favorite_authors = await self._ensure_user_preferences(
+                user, target_interactions
+            )
+            excluded = [
+                index
+                for index in (
+                    state.book_index(interaction.book_id)
+                    for interaction in target_interactions
+                    if interaction.interaction_type == InteractionType.PURCHASE
+                )
+                if index is not None
+            ]
+            multipliers = self._catalog_multipliers(
+                state.catalog, state.popularity_penalty, favorite_genres, favorite_authors, excluded
+            )
 
+            if state.als_model is not None:
+                vector = await self._als_user_vector(state.als_model, user_id, target_interactions)
+                if vector is None:
+                    results[user_id] = None
+                    continue
+                vectors.append(vector)
+                excluded_rows.append(excluded)
+            elif state.item_neighbors is not None:
+                history: Dict[Any, float] = defaultdict(float)
+                for interaction in target_interactions:
+                    weight = self._interaction_weight(interaction)
+                    if weight > 0:
+                        history[interaction.book_id] += weight
+                candidates, scores = state.item_neighbors.score_candidates(history)
+                scores = scores * multipliers[candidates]
+                top = top_indices(scores, limit)
+                results[user_id] = state.ranked(candidates[top], scores[top]) or None
+                continue
+            else:
+                index = state.user_index_map.get(user_id, limit=state.matrix.shape[0])
+                if index is None:
+                    results[user_id] = None
+                    continue
+                rows.append(index)
+            scored.append(user_id)
+            multiplier_rows.append(multipliers)
+
+        if scored:
+            if state.als_model is not None:
+                candidates = await compute_pool.run(
+                    state.als_model.top_candidates_block,
+                    np.vstack(vectors),
+                    excluded_rows,
+                    limit * ALS_CANDIDATE_FACTOR,
+                )
+                ranked_rows = []
+                for (indices, scores), multipliers in zip(candidates, multiplier_rows):
+                    scores = scores * multipliers[indices]
+                    top = top_indices(scores, limit)
+                    ranked_rows.append((indices[top], scores[top]))
+            else:
+                ranked_rows = await compute_pool.run(
+                    score_user_based_block,
+                    state.matrix,
+                    state.norms,
+                    np.asarray(rows, dtype=np.int64),
+                    np.vstack(multiplier_rows),
+                    limit,
+                )
+            for user_id, (indices, scores) in zip(scored, ranked_rows):
+                results[user_id] = state.ranked(indices, scores) or None
+
+        return results
+
+    @coalesced
     async def get_personalized_recommendations(
         self, user_id: str, limit: int = 10
     ) -> List[Book]:
-        """User-based collaborative filtering + cold-start fallback."""
+        """User-based collaborative filtering + cold-start fallback.
+
+        Пользователи из коллекции user_recommendations (ночной расчёт)
+        обслуживаются из неё без живого расчёта.
+        """
+
+        materialized = await self._materialized_recommendations(user_id, limit)
+        if materialized is not None:
+            return materialized
 
         user = await User.get(user_id)
         if not user:
             return []
 
-        target_interactions = await Interaction.find(
+        target_interactions = await load_interaction_records(
             {
                 "user_id": user.id,
                 "interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]},
             }
-        ).to_list()
+        )
 
         # Исключаем из выдачи только уже купленные книги
         purchased_interactions = [
@@ -96,83 +379,272 @@ class RecommendationEngine:
         favorite_genres, favorite_authors = await self._ensure_user_preferences(
             user, target_interactions
         )
-        genre_bonus = PREFERENCE_WEIGHTS.get("genre_bonus", 1.0)
-        author_bonus = PREFERENCE_WEIGHTS.get("author_bonus", 1.0)
 
-        # Строим матрицу пользователь-книга для всех релевантных взаимодействий
-        all_interactions = await Interaction.find(
-            {"interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]}}
-        ).to_list()
+        if settings.RECOMMENDATION_CF_MODE == "als" and self.als_model is not None:
+            recommended = await self._als_recommendations(
+                user,
+                target_interactions,
+                favorite_genres,
+                favorite_authors,
+                user_purchased_books,
+                limit,
+            )
+            if not recommended:
+                return await self.get_recommendations_for_new_user(user_id=user_id, limit=limit)
+            return recommended
+
+        if settings.RECOMMENDATION_CF_MODE == "item" and self.item_neighbors is not None:
+            recommended = await self._item_based_recommendations(
+                target_interactions,
+                favorite_genres,
+                favorite_authors,
+                user_purchased_books,
+                limit,
+            )
+            if not recommended:
+                return await self.get_recommendations_for_new_user(user_id=user_id, limit=limit)
+            return recommended
+
+        model = self.interaction_model
+        if model is not None and model.is_loaded:
+            # База (в т.ч. memmap снимка) + дельта, поддерживаемая инкрементально
+            base, delta = model.base, model.delta
+            base_source = compute_pool.share(base, mapped=model.base_source)
+            popularity = model.popularity
+            user_index_map = model.user_index_map
+            book_ids = model.book_ids
+            n_users, n_books = delta.shape
+        else:
+            # Строим матрицу только по окрестности пользователя (two-hop запрос)
+            user_index_map, book_ids, base = await self._build_neighbourhood_matrix(
+                user, target_interactions
+            )
+            delta = None
+            # Матрица окрестности мала и живёт один запрос – передаётся в пул напрямую
+            base_source = base
+            popularity = np.asarray(base.sum(axis=0)).ravel()
+            n_users, n_books = base.shape
+
+        target_index = user_index_map.get(user.id, limit=n_users)
+        if target_index is None:
+            return await self.get_recommendations_for_new_user(user_id=user_id, limit=limit)
 
-        (
-            user_index_map,
-            book_index_map,
-            user_item_matrix,
-            book_popularity,
-        ) = self._build_user_item_matrix(all_interactions)
+        # Книги матрицы – первые n_books номеров IdMap; для скоринга достаточно
+        # колоночных рейтингов, жанров и авторов
+        catalog = await load_catalog_arrays(book_ids, n_books)
+        excluded = [
+            index
+            for index in (book_ids.get(book_id, limit=n_books) for book_id in user_purchased_books)
+            if index is not None
+        ]
 
-        user_key = str(user.id)
-        if user_key not in user_index_map:
-            return await self.get_recommendations_for_new_user(user_id=user_id, limit=limit)
+        # CPU-стадии выполняются в пуле, чтобы не блокировать event loop
+        book_multipliers = await compute_pool.run(
+            self._catalog_multipliers,
+            catalog,
+            1 + np.log1p(popularity),
+            favorite_genres,
+            favorite_authors,
+            excluded,
+        )
 
-        target_index = user_index_map[user_key]
-        target_vector = user_item_matrix[target_index : target_index + 1]
+        # score[b] = Σ_u sim[u] · w[u, b] · rating[b] · pref[b] / penalty[b]
+        ranked = await compute_pool.run_process(
+            score_user_based,
+            base_source,
+            delta,
+            target_index,
+            book_multipliers,
+            limit,
+        )
+        recommended = await load_books_in_order(book_ids.ids(ranked))
 
-        if not np.any(target_vector):
+        if not recommended:
             return await self.get_recommendations_for_new_user(user_id=user_id, limit=limit)
 
-        similarities = cosine_similarity(target_vector, user_item_matrix)[0]
-        similarities[target_index] = 0  # не сравниваем пользователя с самим собой
+        return recommended
 
-        candidate_scores: Dict[str, float] = defaultdict(float)
+    async def _materialized_recommendations(
+        self, user_id: str, limit: int
+    ) -> Optional[List[Book]]:
+        """Список из коллекции user_recommendations без купленных после расчёта книг.
+
+        Returns:
+            None, если свежего списка нет или покупки сократили полный
+            список меньше `limit` (тогда нужен живой расчёт)
+        """
+
+        if limit > settings.USER_RECOMMENDATIONS_LIMIT or not PydanticObjectId.is_valid(user_id):
+            return None
+        object_id = PydanticObjectId(user_id)
+        document = await UserRecommendations.get_motor_collection().find_one(
+            {"user_id": object_id}, {"books.book_id": 1, "generated_at": 1}
+        )
+        if document is None:
+            return None
+        generated_at = document["generated_at"]
+        max_age = timedelta(hours=settings.USER_RECOMMENDATIONS_MAX_AGE_HOURS)
+        if generated_at < self._now() - max_age:
+            return None
+
+        purchased = await load_interacted_book_ids(
+            {
+                "user_id": object_id,
+                "interaction_type": InteractionType.PURCHASE.value,
+                "timestamp": {"$gt": generated_at},
+            }
+        )
+        stored = [str(entry["book_id"]) for entry in document["books"]]
+        book_ids = [book_id for book_id in stored if book_id not in purchased]
+        if not book_ids or (
+            len(book_ids) < limit and len(stored) >= settings.USER_RECOMMENDATIONS_LIMIT
+        ):
+            return None
+        return await load_books_in_order(book_ids[:limit])
+
+    async def _item_based_recommendations(
+        self,
+        target_interactions: Sequence[Interaction],
+        favorite_genres: set[str],
+        favorite_authors: set[str],
+        purchased_books: set[str],
+        limit: int,
+    ) -> List[Book]:
+        """Item-based CF по предрасчитанной таблице соседей.
 
-        # Загружаем объекты книг
-        book_ids = list(book_index_map.keys())
-        book_map = await self._load_books_map(book_ids)
+        Стоимость запроса – O(история пользователя × K), независимо от числа
+        пользователей в системе.
+        """
 
-        for other_user, other_idx in user_index_map.items():
-            similarity = similarities[other_idx]
-            if similarity <= 0:
-                continue
+        history: Dict[Any, float] = defaultdict(float)
+        for interaction in target_interactions:
+            weight = self._interaction_weight(interaction)
+            if weight > 0:
+                history[interaction.book_id] += weight
 
-            other_vector = user_item_matrix[other_idx]
-            for book_id, book_idx in book_index_map.items():
-                if other_vector[book_idx] <= 0:
-                    continue
-                if book_id in user_purchased_books:
-                    continue
+        table = self.item_neighbors
+        candidate_indices, candidate_scores = await compute_pool.run(
+            table.score_candidates, history
+        )
+        if not candidate_indices.size:
+            return []
 
-                book = book_map.get(book_id)
-                if not book:
-                    continue
+        book_ids = table.book_ids.ids(candidate_indices)
+        book_map = await load_book_records(book_ids)
+        book_multipliers = await compute_pool.run(
+            self._book_score_multipliers,
+            book_ids,
+            book_map,
+            table.popularity[candidate_indices],
+            favorite_genres,
+            favorite_authors,
+            purchased_books,
+        )
 
-                interaction_strength = other_vector[book_idx]
-                rating = book.average_rating or 4.0
-                popularity_penalty = 1 + math.log(1 + book_popularity.get(book_id, 1))
-                preference_multiplier = 1.0
-                if favorite_genres and book.genre in favorite_genres:
-                    preference_multiplier *= genre_bonus
-                if favorite_authors and book.author in favorite_authors:
-                    preference_multiplier *= author_bonus
+        scores = candidate_scores * book_multipliers
+        return await load_books_in_order(
+            [book_ids[index] for index in top_indices(scores, limit)]
+        )
 
-                score = (
-                    similarity
-                    * interaction_strength
-                    * rating
-                    * preference_multiplier
-                ) / popularity_penalty
-                candidate_scores[book_id] += score
+    async def _als_recommendations(
+        self,
+        user: User,
+        target_interactions: Sequence[Interaction],
+        favorite_genres: set[str],
+        favorite_authors: set[str],
+        purchased_books: set[str],
+        limit: int,
+    ) -> List[Book]:
+        """Рекомендации по факторам ALS.
 
-        recommended = self._books_from_scores(candidate_scores, book_map, limit)
+        Score всех книг – одно произведение item_factors @ u (O(k × книги));
+        лучшие кандидаты переранжируются множителями каталога.
+        """
 
-        if not recommended:
-            return await self.get_recommendations_for_new_user(user_id=user_id, limit=limit)
+        model = self.als_model
+        vector = await self._als_user_vector(model, str(user.id), target_interactions)
+        if vector is None:
+            return []
 
-        return recommended
+        excluded = [
+            index
+            for index in (
+                model.book_index_map.get(book_id, limit=model.n_books) for book_id in purchased_books
+            )
+            if index is not None
+        ]
+        candidate_indices, candidate_scores = await compute_pool.run(
+            model.top_candidates, vector, excluded, limit * ALS_CANDIDATE_FACTOR
+        )
+        if not candidate_indices.size:
+            return []
+
+        book_ids = model.book_ids.ids(candidate_indices)
+        book_map = await load_book_records(book_ids)
+        book_multipliers = await compute_pool.run(
+            self._book_score_multipliers,
+            book_ids,
+            book_map,
+            model.popularity[candidate_indices],
+            favorite_genres,
+            favorite_authors,
+            purchased_books,
+        )
 
+        scores = candidate_scores * book_multipliers
+        return await load_books_in_order(
+            [book_ids[index] for index in top_indices(scores, limit)]
+        )
+
+    async def _als_user_vector(
+        self,
+        model: ALSModel,
+        user_id: str,
+        target_interactions: Sequence[Interaction],
+    ) -> Optional[np.ndarray]:
+        """Обученные факторы пользователя или fold-in по его взаимодействиям.
+
+        Fold-in нужен пользователю без обученных факторов или с
+        взаимодействиями после обучения.
+        """
+
+        vector = model.user_vector(user_id)
+        trained_at = model.trained_at
+        if vector is None or any(
+            interaction.timestamp is None or trained_at is None or interaction.timestamp > trained_at
+            for interaction in target_interactions
+        ):
+            history: Dict[Any, float] = defaultdict(float)
+            for interaction in target_interactions:
+                weight = self._interaction_weight(interaction)
+                if weight > 0:
+                    history[interaction.book_id] += weight
+            vector = await compute_pool.run(model.fold_in, history) if history else vector
+        return vector
+
+    @coalesced
     async def get_similar_books(self, book_id: str, limit: int = 10) -> List[Book]:
         """Content-based подбор похожих книг."""
 
+        # Быстрый путь: материализованный список из коллекции similar_books
+        if limit <= settings.SIMILAR_BOOKS_LIMIT:
+            materialized = await SimilarBooks.get_motor_collection().find_one(
+                {"book_id": PydanticObjectId(book_id)},
+                {"neighbors": {"$slice": limit}},
+            )
+            if materialized is not None:
+                return await load_books_in_order(
+                    [str(entry["book_id"]) for entry in materialized["neighbors"]]
+                )
+
+        if self.content_index is not None and self.content_index.is_loaded:
+            found = self.content_index.similarity_candidates(book_id)
+            if found is not None:
+                candidates, scores = found
+                return await load_books_in_order(
+                    self.content_index.book_ids.ids(candidates[top_indices(scores, limit)])
+                )
+
         book = await Book.get(book_id)
         if not book:
             return []
@@ -194,7 +666,7 @@ class RecommendationEngine:
                 if str(candidate.id) not in existing_ids:
                     candidates.append(candidate)
 
-        tag_scores = self._compute_tag_similarities(book, candidates)
+        tag_scores = await compute_pool.run(self._compute_tag_similarities, book, candidates)
 
         results: List[Tuple[float, Book]] = []
         for candidate, tag_score in zip(candidates, tag_scores):
@@ -216,47 +688,26 @@ class RecommendationEngine:
         results.sort(key=lambda item: item[0], reverse=True)
         return [book for _, book in results[:limit]]
 
+    @coalesced
     async def get_trending_books(
         self, limit: int = 10, days: int = 7
     ) -> List[Book]:
-        """Популярные книги с учётом недавней активности."""
+        """Популярные книги с учётом недавней активности.
 
-        now = self._now()
-        start_date = now - timedelta(days=days)
+        В режиме "stream" окно `days` не используется: давность событий
+        учитывается экспоненциальным затуханием счётчиков.
+        """
 
-        recent_interactions = await Interaction.find(
-            {"timestamp": {"$gte": start_date}}
-        ).to_list()
-
-        if not recent_interactions:
-            return await Book.find().sort(-Book.average_rating).limit(limit).to_list()
-
-        book_scores: Dict[str, float] = defaultdict(float)
-
-        for interaction in recent_interactions:
-            weight = INTERACTION_WEIGHTS.get(interaction.interaction_type, 0)
-            if weight <= 0:
-                continue
-
-            recency = self._recency_multiplier(now, interaction.timestamp)
-            book_scores[str(interaction.book_id)] += weight * recency
-
-        if not book_scores:
-            return await Book.find().sort(-Book.average_rating).limit(limit).to_list()
-
-        books_map = await self._load_books_map(book_scores.keys())
-        scored_books: List[Tuple[float, Book]] = []
-
-        for book_id, raw_score in book_scores.items():
-            book = books_map.get(book_id)
-            if not book:
-                continue
-            rating = book.average_rating or 4.0
-            score = raw_score * rating
-            scored_books.append((score, book))
+        now = self._now()
+        stream = self.trending_stream
+        if settings.TRENDING_MODE == "stream" and stream is not None and stream.is_loaded:
+            ranked_ids = stream.top_book_ids(limit)
+        elif settings.TRENDING_MODE == "rollups":
+            ranked_ids = await top_trending_book_ids(now, days, limit)
+        else:
+            ranked_ids = await self._scan_trending_book_ids(now, days, limit)
 
-        scored_books.sort(key=lambda item: item[0], reverse=True)
-        result = [book for _, book in scored_books[:limit]]
+        result = await load_books_in_order(ranked_ids)
 
         if len(result) < limit:
             fallback = await Book.find().sort(-Book.average_rating).limit(
@@ -268,6 +719,7 @@ class RecommendationEngine:
                     result.append(book)
         return result[:limit]
 
+    @coalesced
     async def get_new_books(
         self, limit: int = 10, user: Optional[User] = None, days: int = 60
     ) -> List[Book]:
@@ -317,52 +769,68 @@ class RecommendationEngine:
 
         return books[:limit]
 
+    @coalesced
     async def get_recommendations_for_new_user(
         self, user_id: str, limit: int = 10
     ) -> List[Book]:
-        """Стратегия для новых пользователей."""
+        """Стратегия для новых пользователей.
 
-        user = await User.get(user_id)
-        if not user:
-            return await self.get_trending_books(limit=limit)
+        Независимые источники (купленные книги, тренды, новинки) запрашиваются
+        параллельно сразу, жанровые и авторские кандидаты – параллельно после
+        получения предпочтений. Каждый источник ограничен бюджетом
+        COLD_START_SOURCE_TIMEOUT_SECONDS: не уложившийся источник считается
+        пустым, и подборка добирается из остальных. Когда загружены списки
+        лучших книг, жанровые, авторские кандидаты и новинки ранжируются по ним,
+        а из MongoDB читаются только документы выбранных книг.
+        """
 
-        favorite_genres, favorite_authors = await self._ensure_user_preferences(user)
         genre_ratio = PREFERENCE_WEIGHTS.get("new_user_genre_ratio", 0.6)
         author_ratio = PREFERENCE_WEIGHTS.get("new_user_author_ratio", 0.25)
 
-        genre_quota = max(1, int(limit * genre_ratio)) if favorite_genres else 0
-        recommendations: List[Book] = []
-        seen: set[str] = set()
-
+        # Тренды и новинки запрашиваются на весь limit: нужная часть – их префикс
+        trending_task = asyncio.ensure_future(
+            _within_budget(self.get_trending_books(limit=limit), [])
+        )
+        new_books_task = asyncio.ensure_future(self._cold_start_new_books(limit))
         # В fallback исключаем только купленные книги
-        purchased = await Interaction.find(
-            {"user_id": user.id, "interaction_type": InteractionType.PURCHASE.value}
-        ).to_list()
-        seen.update(str(interaction.book_id) for interaction in purchased)
+        purchased_task = asyncio.ensure_future(self._purchased_book_ids(user_id))
 
-        if favorite_genres:
-            preferred = await Book.find(
-                {"genre": {"$in": list(favorite_genres)}}
-            ).sort(-Book.average_rating).limit(genre_quota * 2).to_list()
+        try:
+            user = await User.get(user_id)
+            if not user:
+                new_books_task.cancel()
+                purchased_task.cancel()
+                return await trending_task
 
-            for book in preferred:
-                if str(book.id) not in seen:
-                    recommendations.append(book)
-                    seen.add(str(book.id))
-                if len(recommendations) >= genre_quota:
-                    break
+            favorite_genres, favorite_authors = await self._ensure_user_preferences(user)
+            genre_quota = max(1, int(limit * genre_ratio)) if favorite_genres else 0
+            max_author_quota = max(1, int(limit * author_ratio))
+            preferred, by_author, purchased = await asyncio.gather(
+                self._top_rated_books("genre", favorite_genres, genre_quota * 2),
+                self._top_rated_books("author", favorite_authors, max_author_quota * 2),
+                purchased_task,
+            )
+        except BaseException:
+            for task in (trending_task, new_books_task, purchased_task):
+                task.cancel()
+            raise
+
+        recommendations: List[Book] = []
+        seen: set[str] = set(purchased)
+
+        for book in preferred:
+            if str(book.id) not in seen:
+                recommendations.append(book)
+                seen.add(str(book.id))
+            if len(recommendations) >= genre_quota:
+                break
 
         remaining = limit - len(recommendations)
 
         if favorite_authors and remaining > 0:
-            author_quota = max(1, int(limit * author_ratio))
-            author_quota = min(author_quota, remaining)
-            author_candidates = await Book.find(
-                {"author": {"$in": list(favorite_authors)}}
-            ).sort(-Book.average_rating).limit(author_quota * 2).to_list()
-
+            author_quota = min(max_author_quota, remaining)
             added = 0
-            for book in author_candidates:
+            for book in by_author[: author_quota * 2]:
                 if str(book.id) in seen:
                     continue
                 recommendations.append(book)
@@ -374,15 +842,13 @@ class RecommendationEngine:
         remaining = limit - len(recommendations)
 
         if remaining > 0:
-            trending = await self.get_trending_books(limit=remaining)
-            for book in trending:
+            for book in (await trending_task)[:remaining]:
                 if str(book.id) not in seen:
                     recommendations.append(book)
                     seen.add(str(book.id))
 
         if len(recommendations) < limit:
-            new_books = await self.get_new_books(limit=limit)
-            for book in new_books:
+            for book in await new_books_task:
                 if str(book.id) not in seen:
                     recommendations.append(book)
                     seen.add(str(book.id))
@@ -391,20 +857,73 @@ class RecommendationEngine:
 
         return recommendations[:limit]
 
+    async def _purchased_book_ids(self, user_id: str) -> set[str]:
+        """Купленные пользователем книги (в пределах бюджета)."""
+
+        if not PydanticObjectId.is_valid(user_id):
+            return set()
+        return await _within_budget(
+            load_interacted_book_ids(
+                {
+                    "user_id": PydanticObjectId(user_id),
+                    "interaction_type": InteractionType.PURCHASE.value,
+                }
+            ),
+            set(),
+        )
+
+    def _top_lists(self, field: str, limit: int) -> Optional[CatalogTopLists]:
+        """Списки лучших книг, если они загружены и вмещают `limit` книг."""
+
+        top_lists = self.catalog_top_lists
+        if top_lists is not None and top_lists.covers(limit, field):
+            return top_lists
+        return None
+
+    async def _cold_start_new_books(self, limit: int) -> List[Book]:
+        """Новинки для cold-start подборки."""
+
+        top_lists = self._top_lists("all", limit)
+        if top_lists is not None:
+            return await _within_budget(
+                load_books_in_order(top_lists.overall_book_ids(limit, "newest")), []
+            )
+        return await _within_budget(self.get_new_books(limit=limit), [])
+
+    async def _top_rated_books(self, field: str, values: set[str], limit: int) -> List[Book]:
+        """Лучшие по рейтингу книги с `field` из `values` (в пределах бюджета)."""
+
+        if not values or limit <= 0:
+            return []
+        top_lists = self._top_lists(field, limit)
+        if top_lists is not None:
+            return await _within_budget(
+                load_books_in_order(top_lists.top_book_ids(field, values, limit)), []
+            )
+        query = Book.find({field: {"$in": list(values)}}).sort(-Book.average_rating).limit(limit)
+        return await _within_budget(query.to_list(), [])
+
+    @coalesced
     async def get_recommendations_by_genre(
         self, genre: str, limit: int = 10, user_id: Optional[str] = None
     ) -> List[Book]:
         """Подбор книг в рамках жанра с учётом активности пользователя."""
 
-        query = Book.find(Book.genre == genre)
-        books = await query.sort(-Book.average_rating).limit(limit * 3).to_list()
+        top_lists = self._top_lists("genre", limit * 3)
+        if top_lists is not None:
+            books = await load_books_in_order(top_lists.top_book_ids("genre", [genre], limit * 3))
+        else:
+            query = Book.find(Book.genre == genre)
+            books = await query.sort(-Book.average_rating).limit(limit * 3).to_list()
 
         if user_id:
             # Исключаем из жанровых рекомендаций только уже купленные книги
-            interactions = await Interaction.find(
-                {"user_id": user_id, "interaction_type": InteractionType.PURCHASE.value}
-            ).to_list()
-            seen = {str(inter.book_id) for inter in interactions}
+            seen = await load_interacted_book_ids(
+                {
+                    "user_id": PydanticObjectId(user_id),
+                    "interaction_type": InteractionType.PURCHASE.value,
+                }
+            )
             books = [book for book in books if str(book.id) not in seen]
 
         if len(books) < limit:
@@ -422,97 +941,112 @@ class RecommendationEngine:
     #                         ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ                     #
     # ------------------------------------------------------------------ #
 
-    async def _load_books_map(self, book_ids: Iterable[str]) -> Dict[str, Book]:
-        """Загружает книги по ID и возвращает словарь."""
-
-        object_ids = [PydanticObjectId(book_id) for book_id in set(book_ids)]
-        books = await Book.find({"_id": {"$in": object_ids}}).to_list()
-        return {str(book.id): book for book in books}
+    async def _build_neighbourhood_matrix(
+        self, user: User, target_interactions: Sequence[Interaction]
+    ) -> Tuple[IdMap, IdMap, sparse.csr_matrix]:
+        """Строит матрицу пользователь-книга по пользователю и его соседям.
 
-    def _interaction_weight(self, interaction: Interaction) -> float:
-        """Вычисляет вес взаимодействия с учётом метаданных."""
+        Сначала по индексу (book_id, interaction_type) находятся пользователи,
+        которые взаимодействовали с теми же книгами, затем веса только их
+        взаимодействий агрегируются на стороне MongoDB. Число соседей ограничено
+        настройкой CF_MAX_NEIGHBOURS (приоритет – у соседей с наибольшим
+        пересечением), поэтому объём I/O зависит от размера окрестности,
+        а не от размера коллекции. Популярность книг в этом режиме считается
+        по окрестности.
+        """
 
-        base_weight = INTERACTION_WEIGHTS.get(interaction.interaction_type, 0.0)
-        metadata = getattr(interaction, "metadata", None)
+        cf_types = [t.value for t in CF_INTERACTION_TYPES]
+        target_book_ids = list({interaction.book_id for interaction in target_interactions})
 
-        def _get(field: str, default=None):
-            if metadata is None:
-                return default
-            value = getattr(metadata, field, default)
-            if value is None and isinstance(metadata, dict):
-                return metadata.get(field, default)
-            return value
-
-        if interaction.interaction_type in (InteractionType.PURCHASE, InteractionType.ADD_TO_CART):
-            quantity = _get("quantity", 0) or 0
-            base_weight += float(quantity)
-            price = _get("price_at_purchase", 0) or 0
-            base_weight += float(price) / 1000.0  # небольшая поправка за дорогие покупки
-
-        if interaction.interaction_type == InteractionType.REVIEW:
-            rating = _get("rating")
-            if rating:
-                base_weight += float(rating)
+        pipeline = [
+            {
+                "$match": {
+                    "book_id": {"$in": target_book_ids},
+                    "interaction_type": {"$in": cf_types},
+                    "user_id": {"$ne": user.id},
+                }
+            },
+            {"$group": {"_id": "$user_id", "overlap": {"$sum": 1}}},
+            {"$sort": {"overlap": -1}},
+            {"$limit": settings.CF_MAX_NEIGHBOURS},
+        ]
+        neighbours = await Interaction.get_motor_collection().aggregate(pipeline).to_list(
+            length=None
+        )
 
-        if interaction.interaction_type == InteractionType.VIEW:
-            duration = _get("duration")
-            if duration:
-                base_weight += min(float(duration) / 120.0, 2.0)
+        user_ids = [user.id, *(neighbour["_id"] for neighbour in neighbours)]
+        triplets = await aggregate_user_item_weights(
+            {"user_id": {"$in": user_ids}, "interaction_type": {"$in": cf_types}}
+        )
+        return build_user_item_matrix_from_triplets(*triplets)
 
-        return max(base_weight, 0.0)
+    def _interaction_weight(self, interaction: Interaction) -> float:
+        """Вычисляет вес взаимодействия с учётом метаданных."""
 
-    def _build_user_item_matrix(
-        self, interactions: Sequence[Interaction]
-    ) -> Tuple[Dict[str, int], Dict[str, int], np.ndarray, Dict[str, float]]:
-        """Формирует матрицу пользователь-книга."""
+        return interaction_weight(interaction)
 
-        user_index_map: Dict[str, int] = {}
-        book_index_map: Dict[str, int] = {}
+    def _book_score_multipliers(
+        self,
+        book_ids: Sequence[str],
+        book_map: Dict[str, BookRecord],
+        popularity: np.ndarray,
+        favorite_genres: set[str],
+        favorite_authors: set[str],
+        excluded: Optional[set[str]] = None,
+    ) -> np.ndarray:
+        """Поэлементный множитель score для каждой книги матрицы.
 
-        for interaction in interactions:
-            user_id = str(interaction.user_id)
-            book_id = str(interaction.book_id)
-            if user_id not in user_index_map:
-                user_index_map[user_id] = len(user_index_map)
-            if book_id not in book_index_map:
-                book_index_map[book_id] = len(book_index_map)
+        Объединяет рейтинг, штраф за популярность и бонусы за любимые жанры
+        и авторов. Отсутствующие в каталоге и исключённые книги получают 0.
+        """
 
-        matrix = np.zeros((len(user_index_map), len(book_index_map)), dtype=float)
-        book_popularity: Dict[str, float] = defaultdict(float)
+        genre_bonus = PREFERENCE_WEIGHTS.get("genre_bonus", 1.0)
+        author_bonus = PREFERENCE_WEIGHTS.get("author_bonus", 1.0)
+        excluded = excluded or set()
 
-        for interaction in interactions:
-            user_idx = user_index_map[str(interaction.user_id)]
-            book_idx = book_index_map[str(interaction.book_id)]
-            weight = self._interaction_weight(interaction)
-            if weight <= 0:
+        ratings = np.zeros(len(book_ids), dtype=np.float64)
+        preferences = np.ones(len(book_ids), dtype=np.float64)
+        for index, book_id in enumerate(book_ids):
+            book = book_map.get(book_id)
+            if not book or book_id in excluded:
                 continue
-            matrix[user_idx, book_idx] += weight
-            book_popularity[str(interaction.book_id)] += weight
+            ratings[index] = book.average_rating or 4.0
+            if favorite_genres and book.genre in favorite_genres:
+                preferences[index] *= genre_bonus
+            if favorite_authors and book.author in favorite_authors:
+                preferences[index] *= author_bonus
 
-        return user_index_map, book_index_map, matrix, book_popularity
+        popularity_penalty = 1 + np.log1p(popularity)
+        return ratings * preferences / popularity_penalty
 
-    def _books_from_scores(
-        self, scores: Dict[str, float], book_map: Dict[str, Book], limit: int
-    ) -> List[Book]:
-        """Возвращает книги, отсортированные по убыванию score."""
+    def _catalog_multipliers(
+        self,
+        catalog: CatalogArrays,
+        popularity_penalty: np.ndarray,
+        favorite_genres: set[str],
+        favorite_authors: set[str],
+        excluded: Sequence[int],
+    ) -> np.ndarray:
+        """Векторный `_book_score_multipliers` для всех книг `CatalogArrays`."""
 
-        if not scores:
-            return []
+        genre_bonus = PREFERENCE_WEIGHTS.get("genre_bonus", 1.0)
+        author_bonus = PREFERENCE_WEIGHTS.get("author_bonus", 1.0)
 
-        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
-        result: List[Book] = []
-        seen: set[str] = set()
-        for book_id, _ in ranked:
-            book = book_map.get(book_id)
-            if not book:
-                continue
-            if book_id in seen:
-                continue
-            result.append(book)
-            seen.add(book_id)
-            if len(result) >= limit:
-                break
-        return result
+        preferences = np.ones(len(catalog.present), dtype=np.float64)
+        genre_codes = [
+            catalog.genre_codes[genre] for genre in favorite_genres if genre in catalog.genre_codes
+        ]
+        if genre_codes:
+            preferences[np.isin(catalog.genres, genre_codes)] *= genre_bonus
+        author_codes = [
+            catalog.author_codes[author] for author in favorite_authors if author in catalog.author_codes
+        ]
+        if author_codes:
+            preferences[np.isin(catalog.authors, author_codes)] *= author_bonus
+
+        ratings = catalog.ratings.copy()
+        ratings[np.asarray(excluded, dtype=np.int64)] = 0
+        return ratings * preferences / popularity_penalty
 
     async def _ensure_user_preferences(
         self,
@@ -520,41 +1054,56 @@ class RecommendationEngine:
         interactions: Optional[Sequence[Interaction]] = None,
         top_n: int = 5,
     ) -> Tuple[set[str], set[str]]:
-        """Гарантирует наличие предпочтений пользователя, при необходимости вычисляя их."""
+        """Гарантирует наличие предпочтений пользователя, при необходимости вычисляя их.
+
+        Выведенные значения используются сразу, а записываются в MongoDB
+        через очередь `preference_writer`; пока запись не выполнена, повторный
+        вызов берёт их из очереди, а не выводит заново.
+        При USER_PROFILES_MODE="profiles" предпочтения выводятся из счётчиков
+        профиля пользователя, без сканирования истории взаимодействий.
+        """
 
         genres = [genre for genre in (user.favorite_genres or []) if genre]
         authors = [author for author in (user.favorite_authors or []) if author]
 
+        if self.preference_writer is not None and not (genres and authors):
+            pending_genres, pending_authors = self.preference_writer.pending(str(user.id))
+            genres = genres or pending_genres
+            authors = authors or pending_authors
+
         if genres and authors:
             return set(genres), set(authors)
 
-        if interactions is None:
-            interactions = await Interaction.find(
-                {
-                    "user_id": user.id,
-                    "interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]},
-                }
-            ).to_list()
-
         derived_genres: List[str] = []
         derived_authors: List[str] = []
-        if interactions:
-            derived_genres, derived_authors = await self._derive_preferences_from_interactions(
-                interactions, top_n=top_n
-            )
-
-        updated = False
-        if not genres and derived_genres:
-            genres = derived_genres
-            updated = True
-        if not authors and derived_authors:
-            authors = derived_authors
-            updated = True
-
-        if updated:
+        if settings.USER_PROFILES_MODE == "profiles":
+            # Счётчики профиля обновляются при записи взаимодействий
+            derived_genres, derived_authors = await load_profile_favorites(user.id, top_n=top_n)
+        else:
+            if interactions is None:
+                interactions = await load_interaction_records(
+                    {
+                        "user_id": user.id,
+                        "interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]},
+                    }
+                )
+            if interactions:
+                derived_genres, derived_authors = await self._derive_preferences_from_interactions(
+                    interactions, top_n=top_n
+                )
+
+        new_genres = derived_genres if not genres else []
+        new_authors = derived_authors if not authors else []
+        genres = genres or new_genres
+        authors = authors or new_authors
+
+        if new_genres or new_authors:
             user.favorite_genres = genres
             user.favorite_authors = authors
-            await user.save()
+            if self.preference_writer is not None:
+                self.preference_writer.submit(str(user.id), new_genres, new_authors)
+            else:
+                await user.save()
 
         return set(genres), set(authors)
 
@@ -566,15 +1115,15 @@ class RecommendationEngine:
         if not interactions:
             return [], []
 
-        book_ids = {interaction.book_id for interaction in interactions}
-        books = await Book.find({"_id": {"$in": list(book_ids)}}).to_list()
-        book_map = {book.id: book for book in books}
+        book_map = await load_book_records(
+            interaction.book_id for interaction in interactions
+        )
 
         genre_counter: Counter[str] = Counter()
         author_counter: Counter[str] = Counter()
 
         for interaction in interactions:
-            book = book_map.get(interaction.book_id)
+            book = book_map.get(str(interaction.book_id))
             if not book:
                 continue
 
@@ -591,6 +1140,53 @@ class RecommendationEngine:
         favorite_authors = [author for author, _ in author_counter.most_common(top_n)]
         return favorite_genres, favorite_authors
 
+    async def _scan_trending_book_ids(
+        self, now: datetime, days: int, limit: int
+    ) -> List[str]:
+        """Тренды по сырым взаимодействиям за окно `days`."""
+
+        start_date = now - timedelta(days=days)
+        event_book_ids, event_weights, event_timestamps = await load_weighted_events(
+            {"timestamp": {"$gte": start_date}}
+        )
+
+        book_ids, raw_scores = await compute_pool.run(
+            self._aggregate_event_scores, now, event_book_ids, event_weights, event_timestamps
+        )
+        if not book_ids.size:
+            return []
+
+        records = await load_book_records(book_ids)
+        ratings = np.array(
+            [
+                (records[book_id].average_rating or 4.0) if book_id in records else 0.0
+                for book_id in book_ids
+            ]
+        )
+        scores = raw_scores * ratings
+        return [book_ids[index] for index in top_indices(scores, limit)]
+
+    def _aggregate_event_scores(
+        self,
+        now: datetime,
+        event_book_ids: List[str],
+        event_weights: np.ndarray,
+        event_timestamps: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Сумма положительных весов событий по книгам с учётом давности."""
+
+        positive = event_weights > 0
+        if not positive.any():
+            return np.empty(0, dtype=object), np.empty(0)
+
+        contributions = event_weights[positive] * self._recency_multipliers(
+            now, event_timestamps[positive]
+        )
+        book_ids, inverse = np.unique(
+            np.asarray(event_book_ids, dtype=object)[positive], return_inverse=True
+        )
+        return book_ids, np.bincount(inverse, weights=contributions)
+
     def _recency_multiplier(self, now: datetime, timestamp: datetime) -> float:
         """Временной коэффициент: чем свежее взаимодействие, тем больше вес."""
 
@@ -598,6 +1194,13 @@ class RecommendationEngine:
         days = delta / 86400.0
         return 1 / (1 + days)
 
+    def _recency_multipliers(self, now: datetime, timestamps: np.ndarray) -> np.ndarray:
+        """Векторная версия `_recency_multiplier` для массива datetime64."""
+
+        delta_ms = (np.datetime64(now, "ms") - timestamps).astype(np.float64)
+        days = np.maximum(delta_ms, 0) / 86_400_000.0
+        return 1 / (1 + days)
+
     def _compute_tag_similarities(
         self, base_book: Book, candidates: Sequence[Book]
     ) -> np.ndarray:
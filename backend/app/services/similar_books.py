@@ -0,0 +1,230 @@
+"""
+Материализованная таблица похожих книг.
+
+Пакетная задача пересчитывает top-N соседей для всего каталога в пуле
+процессов и сохраняет их в коллекцию similar_books. Изменения каталога через
+админские CRUD-эндпоинты пересчитываются в фоне только для затронутой книги,
+поэтому /recommendations/similar обслуживается одним индексированным чтением.
+
+Запуск полного пересчёта:
+    python -m app.services.similar_books
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from beanie import PydanticObjectId
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+from app.core.config import settings
+from app.models.similar_books import SimilarBooks
+from app.services.content_index import ContentIndex, content_index
+from app.services.ranking import top_indices
+
+# Число книг в одной задаче пула процессов
+CHUNK_SIZE = 256
+
+# Сколько книг-соседей проверяется при инкрементальной вставке изменённой книги
+REVERSE_CANDIDATES_FACTOR = 4
+
+Neighbors = List[Tuple[str, float]]
+
+_worker_index: Optional[ContentIndex] = None
+
+
+def _init_worker(index: ContentIndex) -> None:
+    """Инициализатор процесса пула: индекс передаётся один раз на процесс."""
+
+    global _worker_index
+    _worker_index = index
+
+
+def compute_neighbors(
+    index: ContentIndex, indices: Sequence[int], limit: int
+) -> List[Tuple[str, Neighbors]]:
+    """Вычисляет top-N похожих книг для блока строк индекса."""
+
+    indices = np.asarray(indices, dtype=np.int64)
+    scores = index.score_rows(indices)
+    result: List[Tuple[str, Neighbors]] = []
+    for row, book_id in enumerate(index.book_ids.ids(indices)):
+        top = top_indices(scores[row], limit)
+        result.append(
+            (
+                book_id,
+                list(zip(index.book_ids.ids(top), scores[row, top].tolist())),
+            )
+        )
+    return result
+
+
+def _compute_chunk(indices: Sequence[int], limit: int) -> List[Tuple[str, Neighbors]]:
+    return compute_neighbors(_worker_index, indices, limit)
+
+
+def _replace_operation(book_id: str, neighbors: Neighbors, now: datetime) -> ReplaceOne:
+    object_id = PydanticObjectId(book_id)
+    return ReplaceOne(
+        {"book_id": object_id},
+        {
+            "book_id": object_id,
+            "neighbors": [
+                {"book_id": PydanticObjectId(neighbor_id), "score": score}
+                for neighbor_id, score in neighbors
+            ],
+            "updated_at": now,
+        },
+        upsert=True,
+    )
+
+
+async def rebuild_similar_books(
+    index: ContentIndex, limit: Optional[int] = None, workers: Optional[int] = None
+) -> int:
+    """Полностью пересчитывает коллекцию similar_books в пуле процессов.
+
+    Returns:
+        Число записанных книг
+    """
+
+    limit = limit or settings.SIMILAR_BOOKS_LIMIT
+    workers = workers or settings.SIMILAR_BOOKS_WORKERS or os.cpu_count() or 1
+    alive = index.alive_indices()
+    index.score_rows(alive[:1])  # применяем отложенные изменения до передачи в пул
+
+    chunks = [alive[start : start + CHUNK_SIZE] for start in range(0, len(alive), CHUNK_SIZE)]
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(index,)
+    ) as pool:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, _compute_chunk, chunk, limit) for chunk in chunks)
+        )
+
+    now = datetime.utcnow()
+    collection = SimilarBooks.get_motor_collection()
+    written = 0
+    for chunk_result in results:
+        operations = [
+            _replace_operation(book_id, neighbors, now) for book_id, neighbors in chunk_result
+        ]
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+
+    # Удаляем записи книг, которых больше нет в каталоге
+    await collection.delete_many({"updated_at": {"$lt": now}})
+    return written
+
+
+async def _recompute_lists_containing(
+    object_id: PydanticObjectId, index: ContentIndex, now: datetime
+) -> Tuple[List[ReplaceOne], set[str]]:
+    """Полностью пересчитывает списки, в которых встречается книга."""
+
+    affected = await SimilarBooks.get_motor_collection().distinct(
+        "book_id", {"neighbors.book_id": object_id}
+    )
+    affected_ids = {str(book_id) for book_id in affected}
+    indices = [
+        book_index
+        for book_index in (index.book_index_map.get(book_id) for book_id in affected)
+        if book_index is not None
+    ]
+    operations = [
+        _replace_operation(book_id, neighbors, now)
+        for book_id, neighbors in compute_neighbors(
+            index, indices, settings.SIMILAR_BOOKS_LIMIT
+        )
+    ]
+    return operations, affected_ids
+
+
+async def refresh_book(book_id: str, index: ContentIndex = content_index) -> None:
+    """Фоновый пересчёт после create/update книги.
+
+    Пересчитывает список самой книги и списки, где она уже встречалась,
+    а в остальные списки вставляет её только там, где она проходит в top-N.
+    """
+
+    scores = index.similarity_scores(book_id)
+    if scores is None:
+        return
+
+    limit = settings.SIMILAR_BOOKS_LIMIT
+    object_id = PydanticObjectId(book_id)
+    now = datetime.utcnow()
+    top = top_indices(scores, limit)
+    operations = [
+        _replace_operation(book_id, list(zip(index.book_ids.ids(top), scores[top].tolist())), now)
+    ]
+    recomputed, affected_ids = await _recompute_lists_containing(object_id, index, now)
+    operations.extend(recomputed)
+
+    # Score симметричен, кроме слагаемого рейтинга: для соседа j книга
+    # получает rating[book]/5 вместо rating[j]/5
+    book_index = index.book_index_map.index(book_id)
+    reverse_scores = scores - index.ratings / 5.0 + index.ratings[book_index] / 5.0
+    reverse_scores[book_index] = 0
+    reverse_scores[scores <= 0] = 0
+    for j in top_indices(reverse_scores, limit * REVERSE_CANDIDATES_FACTOR):
+        if index.book_ids[j] in affected_ids:
+            continue
+        score = float(reverse_scores[j])
+        operations.append(
+            UpdateOne(
+                {
+                    "book_id": PydanticObjectId(index.book_ids[j]),
+                    "$or": [
+                        {f"neighbors.{limit - 1}": {"$exists": False}},
+                        {f"neighbors.{limit - 1}.score": {"$lt": score}},
+                    ],
+                },
+                {
+                    "$push": {
+                        "neighbors": {
+                            "$each": [{"book_id": object_id, "score": score}],
+                            "$sort": {"score": -1},
+                            "$slice": limit,
+                        }
+                    }
+                },
+            )
+        )
+
+    await SimilarBooks.get_motor_collection().bulk_write(operations, ordered=True)
+
+
+async def remove_book(book_id: str, index: ContentIndex = content_index) -> None:
+    """Фоновая очистка после удаления книги."""
+
+    object_id = PydanticObjectId(book_id)
+    recomputed, _ = await _recompute_lists_containing(object_id, index, datetime.utcnow())
+    await SimilarBooks.get_motor_collection().bulk_write(
+        [DeleteOne({"book_id": object_id}), *recomputed]
+    )
+
+
+async def main():
+    """Полный пересчёт коллекции similar_books."""
+
+    from app.db.mongodb import close_mongo_connection, connect_to_mongo
+
+    await connect_to_mongo()
+    try:
+        index = ContentIndex()
+        await index.load()
+        print(f"🔄 Пересчёт похожих книг для {len(index.book_ids)} книг...")
+        written = await rebuild_similar_books(index)
+        print(f"✅ Записано списков похожих книг: {written}")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""
+Объединение одинаковых конкурентных вызовов (single-flight).
+
+Пока вычисление с данным ключом выполняется, остальные вызовы с тем же
+ключом ждут его результат вместо того, чтобы запускать собственный расчёт.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Реестр выполняющихся вычислений по ключу."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Число выполняющихся вычислений."""
+
+        return len(self._calls)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """Выполняет `factory()` или присоединяется к уже идущему вызову.
+
+        Вычисление выполняется отдельной задачей, поэтому отмена одного из
+        ожидающих запросов не прерывает расчёт для остальных.
+        """
+
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+def _freeze(value: Any) -> Hashable:
+    """Хэшируемое представление аргумента для ключа вызова."""
+
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if getattr(value, "id", None) is not None:
+        # Документы (например, User) идентифицируются по id
+        return (type(value).__name__, str(value.id))
+    return repr(value)
+
+
+def coalesced(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Декоратор асинхронного метода: одинаковые конкурентные вызовы выполняются один раз.
+
+    Экземпляр класса должен иметь атрибут `_in_flight: SingleFlight`. Аргументы
+    нормализуются по сигнатуре, поэтому позиционные и именованные вызовы
+    совпадают. Списки копируются для каждого вызывающего.
+    """
+
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = tuple(
+            (name, _freeze(value)) for name, value in bound.arguments.items() if name != "self"
+        )
+        result = await self._in_flight.do(
+            (method.__name__, arguments), lambda: method(self, *args, **kwargs)
+        )
+        return list(result) if isinstance(result, list) else result
+
+    return wrapper
@@ -0,0 +1,200 @@
+"""
+Агрегаты активности для трендов.
+
+Каждое взаимодействие увеличивает счётчики своего bucket'а (по умолчанию –
+час) в коллекции trending_buckets. Тренды за любое окно считаются на стороне
+MongoDB суммированием buckets с затуханием по давности середины bucket'а, так
+что задержка зависит от числа книг и buckets, а не от объёма сырых событий.
+
+Пересборка агрегатов из коллекции interactions (нужна один раз перед
+включением TRENDING_MODE="rollups" и после массовой загрузки данных):
+    python -m app.services.trending_rollups
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.book import Book
+from app.models.interaction import Interaction, InteractionType
+from app.models.trending_bucket import TrendingBucket
+from app.services.interaction_weights import INTERACTION_WEIGHTS
+
+EPOCH = datetime(1970, 1, 1)
+
+# Размер пакета вставки при пересборке
+REBUILD_BATCH_SIZE = 1000
+
+
+def bucket_size(hours: Optional[int] = None) -> timedelta:
+    """Длительность одного bucket'а."""
+
+    return timedelta(hours=hours or settings.TRENDING_BUCKET_HOURS)
+
+
+def bucket_start(timestamp: datetime, size: Optional[timedelta] = None) -> datetime:
+    """Начало bucket'а, в который попадает момент времени."""
+
+    size = size or bucket_size()
+    return timestamp - (timestamp - EPOCH) % size
+
+
+def _score_increment(interaction_type: InteractionType) -> float:
+    """Вклад одного события в score bucket'а (как в расчёте трендов по сырым событиям)."""
+
+    return max(INTERACTION_WEIGHTS.get(InteractionType(interaction_type), 0.0), 0.0)
+
+
+def rollup_update(
+    interaction: Interaction, removed: bool = False
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Фильтр и `$inc`-обновление bucket'а для одного взаимодействия."""
+
+    sign = -1 if removed else 1
+    interaction_type = InteractionType(interaction.interaction_type)
+    increments: Dict[str, float] = {f"counts.{interaction_type.value}": sign}
+    score = _score_increment(interaction_type)
+    if score:
+        increments["score"] = sign * score
+
+    key = {
+        "book_id": interaction.book_id,
+        "bucket": bucket_start(interaction.timestamp),
+    }
+    return key, {"$inc": increments}
+
+
+async def record_interaction(interaction: Interaction, removed: bool = False) -> None:
+    """Обновляет bucket взаимодействия (вызывается из обработчиков событий)."""
+
+    key, update = rollup_update(interaction, removed=removed)
+    await TrendingBucket.get_motor_collection().update_one(key, update, upsert=True)
+
+
+def trending_pipeline(now: datetime, days: int, limit: int) -> List[Dict[str, Any]]:
+    """Aggregation pipeline: сумма buckets с затуханием, умноженная на рейтинг книги.
+
+    Затухание 1 / (1 + возраст в днях) вычисляется для середины bucket'а
+    (для текущего bucket'а – не позже `now`).
+    """
+
+    size = bucket_size()
+    half_ms = int(size.total_seconds() * 1000) // 2
+    age_ms = {"$max": [{"$subtract": [{"$subtract": [now, "$bucket"]}, half_ms]}, 0]}
+    age_days = {"$divide": [age_ms, 86_400_000]}
+    decay = {"$divide": [1, {"$add": [1, age_days]}]}
+    rating = {"$ifNull": ["$book.average_rating", 0]}
+
+    return [
+        {
+            "$match": {
+                "bucket": {"$gte": bucket_start(now - timedelta(days=days), size)},
+                "score": {"$gt": 0},
+            }
+        },
+        {"$group": {"_id": "$book_id", "raw": {"$sum": {"$multiply": ["$score", decay]}}}},
+        {
+            "$lookup": {
+                "from": Book.get_motor_collection().name,
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "book",
+            }
+        },
+        {"$unwind": "$book"},
+        {
+            "$project": {
+                "score": {
+                    "$multiply": [
+                        "$raw",
+                        {"$cond": [{"$gt": [rating, 0]}, rating, 4.0]},
+                    ]
+                }
+            }
+        },
+        {"$match": {"score": {"$gt": 0}}},
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+
+
+async def top_trending_book_ids(now: datetime, days: int, limit: int) -> List[str]:
+    """Идентификаторы самых популярных книг за окно `days` по агрегатам."""
+
+    cursor = TrendingBucket.get_motor_collection().aggregate(
+        trending_pipeline(now, days, limit), allowDiskUse=True
+    )
+    return [str(document["_id"]) async for document in cursor]
+
+
+async def rebuild_trending_buckets() -> int:
+    """Пересобирает агрегаты по всей коллекции взаимодействий.
+
+    Buckets перезаписываются целиком, поэтому повторный запуск идемпотентен.
+    Запись событий во время пересборки может быть учтена дважды или потеряна
+    для текущего bucket'а – задачу стоит запускать в период низкой нагрузки.
+    """
+
+    size_ms = int(bucket_size().total_seconds() * 1000)
+    pipeline = [
+        {
+            "$group": {
+                "_id": {
+                    "book_id": "$book_id",
+                    "bucket": {
+                        "$subtract": [
+                            "$timestamp",
+                            {"$mod": [{"$subtract": ["$timestamp", EPOCH]}, size_ms]},
+                        ]
+                    },
+                    "type": "$interaction_type",
+                },
+                "count": {"$sum": 1},
+            }
+        }
+    ]
+
+    buckets: Dict[Tuple[Any, datetime], Dict[str, Any]] = defaultdict(
+        lambda: {"score": 0.0, "counts": {}}
+    )
+    cursor = Interaction.get_motor_collection().aggregate(pipeline, allowDiskUse=True)
+    async for document in cursor:
+        key = document["_id"]
+        bucket = buckets[(key["book_id"], key["bucket"])]
+        bucket["counts"][key["type"]] = document["count"]
+        bucket["score"] += document["count"] * _score_increment(key["type"])
+
+    collection = TrendingBucket.get_motor_collection()
+    await collection.delete_many({})
+
+    documents: List[Dict[str, Any]] = []
+    for (book_id, bucket), values in buckets.items():
+        documents.append({"book_id": book_id, "bucket": bucket, **values})
+        if len(documents) >= REBUILD_BATCH_SIZE:
+            await collection.insert_many(documents, ordered=False)
+            documents = []
+    if documents:
+        await collection.insert_many(documents, ordered=False)
+
+    return len(buckets)
+
+
+async def main():
+    """Полная пересборка агрегатов трендов."""
+
+    from app.db.mongodb import close_mongo_connection, connect_to_mongo
+
+    await connect_to_mongo()
+    try:
+        print("🔄 Пересборка агрегатов трендов...")
+        written = await rebuild_trending_buckets()
+        print(f"✅ Записано buckets: {written}")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,382 @@
+"""
+Потоковые trending-счётчики в памяти.
+
+Для каждой книги хранится один экспоненциально затухающий score. Чтобы
+обновление оставалось O(1), score хранится в масштабе опорного момента
+`reference`: событие с весом w в момент t добавляет w · e^{λ(t − reference)},
+а фактическое значение на момент now равно stored · e^{−λ(now − reference)}.
+Общий множитель не меняет порядок книг, поэтому кэш top-N не нужно
+пересчитывать со временем.
+
+Счётчики общие для всех воркеров и хранятся в коллекции trending_scores.
+Воркер копит собственные приращения и периодически прибавляет их через
+`$inc` (не перезаписывая вклад других воркеров), после чего перечитывает
+общие значения – записи любого воркера видны остальным в пределах
+TRENDING_SNAPSHOT_SECONDS. Чтобы `$inc` был возможен без пересчёта
+сохранённых значений, они хранятся в масштабе эпохи – фиксированного
+момента, сменяющегося раз в EPOCH_HALF_LIVES периодов полураспада; у книги
+по документу на эпоху, документы старых эпох со временем удаляются.
+При старте события после последней записи доигрываются из interactions.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import heapq
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from beanie import PydanticObjectId
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
+from app.models.book import Book
+from app.models.interaction import Interaction, InteractionType
+from app.models.trending_score import TrendingScore
+from app.services.interaction_weights import INTERACTION_WEIGHTS
+from app.services.lean_data import load_weighted_events
+
+# Размер кэша лучших книг (запросы с большим limit пересчитывают его целиком)
+TOP_CACHE_SIZE = 100
+
+# Показатель экспоненты, после которого счётчики переводятся на новый опорный момент
+RENORMALIZE_EXPONENT = 200.0
+
+# Глубина первичной загрузки из взаимодействий в периодах полураспада
+BOOTSTRAP_HALF_LIVES = 10
+
+# Начало отсчёта эпох и длина эпохи в периодах полураспада: значения в
+# масштабе эпохи растут не более чем в 2^EPOCH_HALF_LIVES раз
+EPOCH_ORIGIN = datetime(2020, 1, 1)
+EPOCH_HALF_LIVES = 16
+
+# Документы эпох старше стольких эпох назад удаляются (вклад < 2^-16)
+EPOCH_RETENTION = 2
+
+
+class TrendingStream:
+    """Затухающие счётчики популярности книг с кэшем top-N."""
+
+    def __init__(self, half_life_hours: Optional[float] = None) -> None:
+        self.half_life_hours = half_life_hours
+        self.clear()
+
+    @property
+    def half_life(self) -> timedelta:
+        return timedelta(hours=self.half_life_hours or settings.TRENDING_HALF_LIFE_HOURS)
+
+    @property
+    def decay_rate(self) -> float:
+        """Коэффициент затухания λ (1/сек)."""
+
+        return math.log(2) / self.half_life.total_seconds()
+
+    def epoch(self, moment: datetime) -> datetime:
+        """Начало эпохи, в масштабе которой хранятся записи момента `moment`."""
+
+        period = EPOCH_HALF_LIVES * self.half_life
+        return EPOCH_ORIGIN + ((moment - EPOCH_ORIGIN) // period) * period
+
+    def clear(self) -> None:
+        """Сбрасывает счётчики."""
+
+        self.reference: datetime = datetime.utcnow()
+        self.is_loaded = False
+        self._scores: Dict[str, float] = {}
+        # Множитель рейтинга книги (как в расчёте трендов: rating или 4.0)
+        self._ratings: Dict[str, float] = {}
+        # Приращения воркера, ещё не записанные в MongoDB (в масштабе reference)
+        self._pending: Dict[str, float] = {}
+        self._removed: Set[str] = set()
+        # Отсортированный по убыванию кэш top-N: (−ключ, book_id)
+        self._top: List[Tuple[float, str]] = []
+        self._top_ids: Set[str] = set()
+        self._top_valid = False
+
+    # ------------------------------------------------------------------ #
+    #                             ЗАГРУЗКА                               #
+    # ------------------------------------------------------------------ #
+
+    async def load(self) -> None:
+        """Читает общие счётчики из MongoDB и доигрывает свежие события.
+
+        События после последней записи счётчиков учитываются только в памяти:
+        их ещё запишут воркеры, которые их обработали. Если счётчиков ещё
+        нет, они строятся по недавним взаимодействиям и записываются только
+        для книг, которых в коллекции нет (одновременно стартующие воркеры не
+        удваивают значения).
+        """
+
+        self.clear()
+        async for document in Book.get_motor_collection().find({}, {"average_rating": 1}):
+            self._ratings[str(document["_id"])] = document.get("average_rating") or 4.0
+
+        self._scores, last_write = await self._read_shared()
+        if last_write is None:
+            since = datetime.utcnow() - BOOTSTRAP_HALF_LIVES * self.half_life
+            match = {"timestamp": {"$gte": since}}
+        else:
+            match = {"timestamp": {"$gt": last_write}}
+
+        book_ids, weights, timestamps = await load_weighted_events(match)
+        positive = weights > 0
+        if positive.any():
+            offsets = (
+                timestamps[positive] - np.datetime64(self.reference, "ms")
+            ).astype(np.float64) / 1000.0
+            contributions = weights[positive] * np.exp(self.decay_rate * offsets)
+            for book_id, contribution in zip(
+                np.asarray(book_ids, dtype=object)[positive], contributions
+            ):
+                self._scores[book_id] = self._scores.get(book_id, 0.0) + float(contribution)
+
+        if last_write is None and self._scores:
+            await self._write_bootstrap()
+        self.is_loaded = True
+
+    # ------------------------------------------------------------------ #
+    #                        ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ                  #
+    # ------------------------------------------------------------------ #
+
+    def apply(self, interaction: Interaction, removed: bool = False) -> None:
+        """Учитывает записанное (или удалённое) взаимодействие за O(1)."""
+
+        if not self.is_loaded:
+            return
+        weight = INTERACTION_WEIGHTS.get(InteractionType(interaction.interaction_type), 0.0)
+        if weight <= 0:
+            return
+
+        contribution = weight * self._growth(interaction.timestamp)
+        self._bump(str(interaction.book_id), -contribution if removed else contribution)
+
+    def set_rating(self, book_id: str, rating: Optional[float]) -> None:
+        """Обновляет рейтинг книги (создание/изменение книги, новый отзыв)."""
+
+        if not self.is_loaded:
+            return
+        self._ratings[book_id] = rating or 4.0
+        if book_id in self._top_ids or self._scores.get(book_id):
+            self._top_valid = False
+
+    def remove_book(self, book_id: str) -> None:
+        """Удаляет книгу из счётчиков (книга удалена из каталога)."""
+
+        if not self.is_loaded:
+            return
+        self._ratings.pop(book_id, None)
+        self._pending.pop(book_id, None)
+        if self._scores.pop(book_id, None) is not None:
+            self._removed.add(book_id)
+        if book_id in self._top_ids:
+            self._top_valid = False
+
+    # ------------------------------------------------------------------ #
+    #                                ЧТЕНИЕ                              #
+    # ------------------------------------------------------------------ #
+
+    def score(self, book_id: str, now: Optional[datetime] = None) -> float:
+        """Текущий затухший score книги (без множителя рейтинга)."""
+
+        return self._scores.get(book_id, 0.0) / self._growth(now or datetime.utcnow())
+
+    def top_book_ids(self, limit: int) -> List[str]:
+        """Книги с наибольшим score · рейтинг."""
+
+        if self._top_valid and limit <= TOP_CACHE_SIZE:
+            ranked = self._top
+        else:
+            ranked = heapq.nsmallest(
+                max(limit, TOP_CACHE_SIZE),
+                ((-key, book_id) for book_id in self._scores if (key := self._key(book_id)) > 0),
+            )
+            self._top = ranked[:TOP_CACHE_SIZE]
+            self._top_ids = {book_id for _, book_id in self._top}
+            self._top_valid = True
+        return [book_id for _, book_id in ranked[:limit]]
+
+    # ------------------------------------------------------------------ #
+    #                                СНИМКИ                              #
+    # ------------------------------------------------------------------ #
+
+    async def snapshot(self) -> int:
+        """Прибавляет приращения воркера к общим счётчикам и перечитывает их.
+
+        Returns:
+            Число операций записи
+        """
+
+        if not self.is_loaded:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        removed, self._removed = self._removed, set()
+        now = datetime.utcnow()
+        epoch = self.epoch(now)
+        scale = 1.0 / self._growth(epoch)
+
+        operations: List = [
+            UpdateOne(
+                {"book_id": PydanticObjectId(book_id), "epoch": epoch},
+                {"$inc": {"score": delta * scale}, "$max": {"updated_at": now}},
+                upsert=True,
+            )
+            for book_id, delta in pending.items()
+            if delta
+        ]
+        operations.extend(DeleteMany({"book_id": PydanticObjectId(book_id)}) for book_id in removed)
+
+        collection = TrendingScore.get_motor_collection()
+        if operations:
+            try:
+                await collection.bulk_write(operations, ordered=False)
+            except Exception:
+                # Приращения вернутся в следующую запись
+                for book_id, delta in pending.items():
+                    self._pending[book_id] = self._pending.get(book_id, 0.0) + delta
+                self._removed |= removed
+                raise
+
+        expired = epoch - EPOCH_RETENTION * EPOCH_HALF_LIVES * self.half_life
+        await collection.delete_many({"epoch": {"$lt": expired}})
+        await self._sync()
+        return len(operations)
+
+    async def run_snapshots(self, interval: Optional[int] = None) -> None:
+        """Фоновая задача периодической записи и синхронизации счётчиков."""
+
+        interval = interval or settings.TRENDING_SNAPSHOT_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.snapshot()
+            except Exception as err:  # pylint: disable=broad-except
+                print(f"⚠️  Не удалось сохранить снимок трендов: {err}")
+
+    # ------------------------------------------------------------------ #
+    #                          ВНУТРЕННИЕ МЕТОДЫ                         #
+    # ------------------------------------------------------------------ #
+
+    async def _read_shared(self) -> Tuple[Dict[str, float], Optional[datetime]]:
+        """Общие счётчики из MongoDB в масштабе reference и момент последней записи."""
+
+        # Перенос опорного момента (если нужен) – до пересчёта значений
+        self._growth(datetime.utcnow())
+
+        scores: Dict[str, float] = {}
+        last_write: Optional[datetime] = None
+        cursor = TrendingScore.get_motor_collection().find(
+            {}, {"_id": 0, "book_id": 1, "score": 1, "epoch": 1, "updated_at": 1}
+        )
+        async for document in cursor:
+            updated_at = document["updated_at"]
+            book_id = str(document["book_id"])
+            growth = self._growth(document["epoch"])
+            scores[book_id] = scores.get(book_id, 0.0) + document["score"] * growth
+            if last_write is None or updated_at > last_write:
+                last_write = updated_at
+        return {book_id: score for book_id, score in scores.items() if score > 0}, last_write
+
+    async def _sync(self) -> None:
+        """Заменяет счётчики общими значениями с учётом незаписанных приращений."""
+
+        scores, _ = await self._read_shared()
+        await self._load_ratings([book_id for book_id in scores if book_id not in self._ratings])
+        for book_id in self._removed:
+            scores.pop(book_id, None)
+        for book_id, delta in self._pending.items():
+            scores[book_id] = max(scores.get(book_id, 0.0) + delta, 0.0)
+        self._scores = scores
+        self._top_valid = False
+
+    async def _load_ratings(self, book_ids: List[str]) -> None:
+        """Дочитывает рейтинги книг, неизвестных воркеру (созданы в другом воркере).
+
+        Книгам, которых нет в каталоге, ставится нулевой множитель.
+        """
+
+        if not book_ids:
+            return
+        ratings = dict.fromkeys(book_ids, 0.0)
+        cursor = Book.get_motor_collection().find(
+            {"_id": {"$in": [PydanticObjectId(book_id) for book_id in book_ids]}},
+            {"average_rating": 1},
+        )
+        async for document in cursor:
+            ratings[str(document["_id"])] = document.get("average_rating") or 4.0
+        self._ratings.update(ratings)
+
+    async def _write_bootstrap(self) -> None:
+        """Записывает первичные счётчики только для книг, которых нет в коллекции."""
+
+        now = datetime.utcnow()
+        epoch = self.epoch(now)
+        scale = 1.0 / self._growth(epoch)
+        try:
+            await TrendingScore.get_motor_collection().bulk_write(
+                [
+                    UpdateOne(
+                        {"book_id": PydanticObjectId(book_id)},
+                        {"$setOnInsert": {"epoch": epoch, "score": score * scale, "updated_at": now}},
+                        upsert=True,
+                    )
+                    for book_id, score in self._scores.items()
+                ],
+                ordered=False,
+            )
+        except BulkWriteError:
+            # Дубликаты ключа – документы книги одновременно записал другой воркер
+            pass
+
+    def _growth(self, moment: datetime) -> float:
+        """e^{λ(moment − reference)} с переводом на новый опорный момент при переполнении."""
+
+        exponent = self.decay_rate * (moment - self.reference).total_seconds()
+        if exponent > RENORMALIZE_EXPONENT:
+            self._rebase(moment)
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def _rebase(self, reference: datetime) -> None:
+        """Переносит все счётчики на новый опорный момент (O(n), крайне редко)."""
+
+        factor = math.exp(-self.decay_rate * (reference - self.reference).total_seconds())
+        self._scores = {book_id: score * factor for book_id, score in self._scores.items()}
+        self._pending = {book_id: delta * factor for book_id, delta in self._pending.items()}
+        self.reference = reference
+        self._top_valid = False
+
+    def _key(self, book_id: str) -> float:
+        return self._scores.get(book_id, 0.0) * self._ratings.get(book_id, 4.0)
+
+    def _bump(self, book_id: str, delta: float) -> None:
+        self._scores[book_id] = max(self._scores.get(book_id, 0.0) + delta, 0.0)
+        self._pending[book_id] = self._pending.get(book_id, 0.0) + delta
+        self._removed.discard(book_id)
+
+        if not self._top_valid:
+            return
+        if delta < 0:
+            # Понижение может вытолкнуть книгу из top-N – пересчёт при чтении
+            if book_id in self._top_ids:
+                self._top_valid = False
+            return
+
+        key = self._key(book_id)
+        if key <= 0:
+            return
+        if book_id in self._top_ids:
+            self._top.pop(next(i for i, (_, top_id) in enumerate(self._top) if top_id == book_id))
+        elif len(self._top) >= TOP_CACHE_SIZE and key <= -self._top[-1][0]:
+            return
+        bisect.insort(self._top, (-key, book_id))
+        self._top_ids.add(book_id)
+        if len(self._top) > TOP_CACHE_SIZE:
+            _, dropped = self._top.pop()
+            self._top_ids.discard(dropped)
+
+
+trending_stream = TrendingStream()
@@ -0,0 +1,216 @@
+"""
+Инкрементальные профили предпочтений пользователей.
+
+Каждое взаимодействие увеличивает (удаление – уменьшает) взвешенные счётчики
+жанра и автора книги в документе пользователя коллекции user_profiles через
+`$inc`. Любимые жанры и авторы для движка рекомендаций и аналитики поведения
+читаются из профиля одним запросом по user_id вместо сканирования всей
+истории взаимодействий с присоединением книг.
+
+Счётчики учитывают жанр и автора книги на момент взаимодействия. Полная
+пересборка из коллекции interactions (нужна один раз перед включением
+USER_PROFILES_MODE="profiles" и после массовой загрузки данных):
+    python -m app.services.user_profiles
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from beanie import PydanticObjectId
+
+from app.models.book import Book
+from app.models.interaction import Interaction, InteractionType
+from app.models.user_profile import UserProfile
+from app.services.interaction_weights import CF_INTERACTION_TYPES, interaction_weight
+from app.services.lean_data import INTERACTION_RECORD_PROJECTION, InteractionRecord
+
+# Размер пакета вставки при пересборке
+REBUILD_BATCH_SIZE = 1000
+
+# Остаток счётчика после удалений, который считается нулём
+WEIGHT_EPSILON = 1e-9
+
+BOOK_PROFILE_PROJECTION = {"genre": 1, "author": 1}
+
+AnyInteraction = Union[Interaction, InteractionRecord]
+
+
+def encode_key(name: str) -> str:
+    """Экранирует жанр или автора для имени поля MongoDB (точки и ведущий `$`)."""
+
+    name = name.replace(".", "．")
+    return "＄" + name[1:] if name.startswith("$") else name
+
+
+def decode_key(key: str) -> str:
+    """Обратное преобразование к `encode_key`."""
+
+    key = key.replace("．", ".")
+    return "$" + key[1:] if key.startswith("＄") else key
+
+
+def _metadata_value(metadata: Any, field: str, default: float = 0) -> Any:
+    if metadata is None:
+        return default
+    if isinstance(metadata, dict):
+        value = metadata.get(field)
+    else:
+        value = getattr(metadata, field, None)
+    return value or default
+
+
+def behavior_weight(interaction: AnyInteraction) -> float:
+    """Вес взаимодействия в аналитике поведения пользователя."""
+
+    metadata = interaction.metadata
+    interaction_type = interaction.interaction_type
+    if interaction_type == InteractionType.PURCHASE:
+        return max(_metadata_value(metadata, "quantity", 1), 1)
+    if interaction_type == InteractionType.LIKE:
+        return 1.5
+    if interaction_type == InteractionType.ADD_TO_CART:
+        return _metadata_value(metadata, "quantity", 1)
+    if interaction_type == InteractionType.VIEW:
+        duration = _metadata_value(metadata, "duration", 0)
+        return max(min(duration / 120.0, 1.0), 0.2)
+    if interaction_type == InteractionType.REVIEW:
+        rating = _metadata_value(metadata, "rating", 0)
+        return max(float(rating), 1.0)
+    return 1.0
+
+
+def profile_increments(
+    interaction: AnyInteraction,
+    genre: Optional[str],
+    author: Optional[str],
+    removed: bool = False,
+) -> Dict[str, float]:
+    """Изменения счётчиков профиля от одного взаимодействия (путь поля → delta)."""
+
+    if InteractionType(interaction.interaction_type) not in CF_INTERACTION_TYPES:
+        return {}
+
+    sign = -1.0 if removed else 1.0
+    increments: Dict[str, float] = {}
+    weights = (("", interaction_weight(interaction)), ("behavior_", behavior_weight(interaction)))
+    for prefix, weight in weights:
+        if weight <= 0:
+            continue
+        if genre:
+            increments[f"{prefix}genres.{encode_key(genre)}"] = sign * weight
+        if author:
+            increments[f"{prefix}authors.{encode_key(author)}"] = sign * weight
+    return increments
+
+
+async def record_profile_interaction(interaction: Interaction, removed: bool = False) -> None:
+    """Обновляет профиль пользователя (вызывается из обработчиков событий)."""
+
+    book = await Book.get_motor_collection().find_one(
+        {"_id": interaction.book_id}, BOOK_PROFILE_PROJECTION
+    )
+    if book is None:
+        return
+    increments = profile_increments(interaction, book.get("genre"), book.get("author"), removed)
+    if not increments:
+        return
+    await UserProfile.get_motor_collection().update_one(
+        {"user_id": interaction.user_id},
+        {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+def _top_keys(counters: Optional[Dict[str, float]], top_n: int) -> List[str]:
+    positive = [(key, weight) for key, weight in (counters or {}).items() if weight > WEIGHT_EPSILON]
+    positive.sort(key=lambda item: item[1], reverse=True)
+    return [decode_key(key) for key, _ in positive[:top_n]]
+
+
+async def load_profile_favorites(
+    user_id: Union[str, PydanticObjectId], top_n: int = 5, behavior: bool = False
+) -> Tuple[List[str], List[str]]:
+    """Любимые жанры и авторы пользователя по счётчикам профиля.
+
+    Args:
+        behavior: Веса аналитики поведения вместо весов движка рекомендаций
+    """
+
+    prefix = "behavior_" if behavior else ""
+    document = await UserProfile.get_motor_collection().find_one(
+        {"user_id": PydanticObjectId(user_id)},
+        {f"{prefix}genres": 1, f"{prefix}authors": 1},
+    )
+    if document is None:
+        return [], []
+    return (
+        _top_keys(document.get(f"{prefix}genres"), top_n),
+        _top_keys(document.get(f"{prefix}authors"), top_n),
+    )
+
+
+async def rebuild_user_profiles() -> int:
+    """Пересобирает профили по всей коллекции взаимодействий.
+
+    Профили перезаписываются целиком, поэтому повторный запуск идемпотентен.
+    Взаимодействия, записанные во время пересборки, могут быть учтены дважды
+    или потеряны – задачу стоит запускать в период низкой нагрузки.
+    """
+
+    books: Dict[Any, Tuple[Optional[str], Optional[str]]] = {}
+    async for document in Book.get_motor_collection().find({}, BOOK_PROFILE_PROJECTION):
+        books[document["_id"]] = (document.get("genre"), document.get("author"))
+
+    profiles: Dict[Any, Dict[str, Dict[str, float]]] = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(float))
+    )
+    cursor = Interaction.get_motor_collection().find(
+        {"interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]}},
+        INTERACTION_RECORD_PROJECTION,
+    )
+    async for document in cursor:
+        record = InteractionRecord.from_document(document)
+        book = books.get(record.book_id)
+        if book is None:
+            continue
+        for path, delta in profile_increments(record, *book).items():
+            field, key = path.split(".", 1)
+            profiles[record.user_id][field][key] += delta
+
+    collection = UserProfile.get_motor_collection()
+    await collection.delete_many({})
+
+    now = datetime.utcnow()
+    documents: List[Dict[str, Any]] = []
+    for user_id, fields in profiles.items():
+        documents.append(
+            {"user_id": user_id, **{field: dict(counters) for field, counters in fields.items()}, "updated_at": now}
+        )
+        if len(documents) >= REBUILD_BATCH_SIZE:
+            await collection.insert_many(documents, ordered=False)
+            documents = []
+    if documents:
+        await collection.insert_many(documents, ordered=False)
+
+    return len(profiles)
+
+
+async def main():
+    """Полная пересборка профилей пользователей."""
+
+    from app.db.mongodb import close_mongo_connection, connect_to_mongo
+
+    await connect_to_mongo()
+    try:
+        print("🔄 Пересборка профилей пользователей...")
+        written = await rebuild_user_profiles()
+        print(f"✅ Записано профилей: {written}")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
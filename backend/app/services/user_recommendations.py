@@ -0,0 +1,145 @@
+"""
+Материализованные персональные рекомендации.
+
+Ночная пакетная задача считает top-N книг для каждого активного пользователя
+(с CF-взаимодействиями) через пакетный расчёт движка: модель и каталог
+фиксируются один раз, блоки пользователей считаются параллельно в пуле.
+Результат сохраняется в коллекцию user_recommendations, и /for-you
+обслуживает этих пользователей одним индексированным чтением, отфильтровывая
+книги, купленные после расчёта. Живой расчёт остаётся только для
+пользователей, которых нет в коллекции.
+
+Запуск полного пересчёта:
+    python -m app.services.user_recommendations
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import ReplaceOne
+
+from app.core.config import settings
+from app.models.interaction import Interaction
+from app.models.user_recommendations import UserRecommendations
+from app.services.interaction_weights import CF_INTERACTION_TYPES
+from app.services.recommendation_engine import RecommendationEngine
+
+
+def _replace_operation(
+    user_id: str, ranked: Sequence[Tuple[str, float]], generated_at: datetime, now: datetime
+) -> ReplaceOne:
+    object_id = PydanticObjectId(user_id)
+    return ReplaceOne(
+        {"user_id": object_id},
+        {
+            "user_id": object_id,
+            "books": [
+                {"book_id": PydanticObjectId(book_id), "score": score} for book_id, score in ranked
+            ],
+            "generated_at": generated_at,
+            "updated_at": now,
+        },
+        upsert=True,
+    )
+
+
+async def load_active_user_ids() -> List[str]:
+    """ID пользователей, у которых есть CF-взаимодействия."""
+
+    user_ids = await Interaction.get_motor_collection().distinct(
+        "user_id", {"interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]}}
+    )
+    return sorted(str(user_id) for user_id in user_ids)
+
+
+async def rebuild_user_recommendations(
+    engine: RecommendationEngine,
+    user_ids: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    workers: Optional[int] = None,
+    block_size: Optional[int] = None,
+) -> int:
+    """Полностью пересчитывает коллекцию user_recommendations.
+
+    Блоки пользователей считаются параллельно (до `workers` одновременно) по
+    одним и тем же данным пакета и записываются по мере готовности.
+    Пользователи, которых нельзя оценить по модели, в коллекцию не попадают.
+
+    Returns:
+        Число записанных пользователей
+    """
+
+    limit = limit or settings.USER_RECOMMENDATIONS_LIMIT
+    workers = workers or settings.USER_RECOMMENDATIONS_WORKERS or os.cpu_count() or 1
+    block_size = block_size or settings.RECOMMENDATION_BATCH_BLOCK_SIZE
+    if user_ids is None:
+        user_ids = await load_active_user_ids()
+
+    generated_at = datetime.utcnow()
+    state = await engine.prepare_batch()
+    collection = UserRecommendations.get_motor_collection()
+    semaphore = asyncio.Semaphore(workers)
+
+    async def write_block(block: Sequence[str]) -> int:
+        async with semaphore:
+            results = await engine.score_batch_block(state, block, limit)
+            now = datetime.utcnow()
+            operations = [
+                _replace_operation(user_id, ranked, generated_at, now)
+                for user_id, ranked in results.items()
+                if ranked
+            ]
+            if operations:
+                await collection.bulk_write(operations, ordered=False)
+            return len(operations)
+
+    blocks = [user_ids[start:start + block_size] for start in range(0, len(user_ids), block_size)]
+    written = sum(await asyncio.gather(*(write_block(block) for block in blocks)))
+
+    # Удаляем записи пользователей, не вошедших в этот расчёт
+    await collection.delete_many({"updated_at": {"$lt": generated_at}})
+    return written
+
+
+async def main():
+    """Полный пересчёт коллекции user_recommendations."""
+
+    from app.db.mongodb import close_mongo_connection, connect_to_mongo
+    from app.services.als_model import ALSModel, load_als_model
+    from app.services.compute_pool import compute_pool
+    from app.services.interaction_model import InteractionModel
+    from app.services.item_neighbors import ItemNeighborTable, load_item_neighbors
+    from app.services.model_snapshot import open_current
+
+    await connect_to_mongo()
+    compute_pool.start()
+    try:
+        model = InteractionModel()
+        snapshot = open_current() if settings.MODEL_SNAPSHOT_DIR else None
+        if snapshot is not None:
+            await model.load_snapshot(snapshot)
+        else:
+            await model.load()
+        engine = RecommendationEngine(interaction_model=model)
+        if settings.RECOMMENDATION_CF_MODE == "item":
+            engine.item_neighbors = (
+                snapshot and ItemNeighborTable.from_snapshot(snapshot)
+            ) or load_item_neighbors()
+        elif settings.RECOMMENDATION_CF_MODE == "als":
+            engine.als_model = (snapshot and ALSModel.from_snapshot(snapshot)) or load_als_model()
+
+        user_ids = await load_active_user_ids()
+        print(f"🔄 Пересчёт рекомендаций для {len(user_ids)} пользователей...")
+        written = await rebuild_user_recommendations(engine, user_ids)
+        print(f"✅ Записано списков рекомендаций: {written}")
+    finally:
+        compute_pool.shutdown()
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -6,12 +6,23 @@ import asyncio
 import time
 import statistics
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence
 
+from app.core.config import settings
 from app.db.mongodb import connect_to_mongo, close_mongo_connection
 from app.models.user import User
 from app.models.book import Book
 from app.models.interaction import Interaction
+from app.services.als_model import ALSModel
+from app.services.content_index import ContentIndex
+from app.services.interaction_model import InteractionModel
+from app.services.interaction_weights import CF_INTERACTION_TYPES
+from app.services.lean_data import (
+    load_book_records,
+    load_interaction_records,
+    to_object_ids,
+)
+from app.services.ranking import top_indices
 from app.services.recommendation_engine import RecommendationEngine
 
 
@@ -193,6 +204,113 @@ async def benchmark_cold_start(
     return results
 
 
+async def benchmark_data_access(
+    book_ids: List[str],
+    iterations: int = 10
+) -> List[BenchmarkResults]:
+    """Сравнение массовой загрузки через Beanie и через облегчённый слой Motor."""
+    beanie_results = BenchmarkResults("Data Access: Beanie (Interaction + Book)")
+    lean_results = BenchmarkResults("Data Access: Lean Motor (InteractionRecord + BookRecord)")
+
+    print(f"\n⚡ Тестирование слоя доступа к данным ({iterations} итераций)...")
+
+    cf_filter = {"interaction_type": {"$in": [t.value for t in CF_INTERACTION_TYPES]}}
+    object_ids = to_object_ids(book_ids)
+
+    for i in range(iterations):
+        start_time = time.time()
+        try:
+            await Interaction.find(cf_filter).to_list()
+            await Book.find({"_id": {"$in": object_ids}}).to_list()
+            beanie_results.add_result(time.time() - start_time, success=True)
+        except Exception as e:
+            beanie_results.add_result(time.time() - start_time, success=False)
+            print(f"  ✗ Ошибка Beanie на итерации {i + 1}: {e}")
+
+        start_time = time.time()
+        try:
+            await load_interaction_records(cf_filter)
+            await load_book_records(book_ids)
+            lean_results.add_result(time.time() - start_time, success=True)
+        except Exception as e:
+            lean_results.add_result(time.time() - start_time, success=False)
+            print(f"  ✗ Ошибка Lean на итерации {i + 1}: {e}")
+
+    return [beanie_results, lean_results]
+
+
+async def benchmark_ann(
+    user_ids: List[str],
+    book_ids: List[str],
+    probes: Sequence[int] = (1, 2, 4, 8, 16),
+    limit: int = 10,
+) -> List[BenchmarkResults]:
+    """Полнота recall@10 и задержка IVF-индекса против точного поиска.
+
+    Индексы строятся по векторам движка: факторам ALS (запрос – вектор
+    пользователя, /for-you) и признакам контентного индекса (запрос – книга,
+    /similar).
+    """
+    print(f"\n🧭 Тестирование ANN (IVF, n_probe={list(probes)})...")
+
+    model = InteractionModel()
+    await model.load()
+    als = ALSModel.train(model.matrix, model.user_index_map, model.book_ids)
+    als.build_ann()
+    index = ContentIndex()
+    await index.load()
+    index.build_ann()
+    settings.ANN_MODE = "ivf"
+    print(f"  ✓ Списков IVF: ALS {als.ann.n_lists}, контент {index.ann.n_lists}")
+
+    user_vectors = [
+        vector for vector in (als.user_vector(user_id) for user_id in user_ids)
+        if vector is not None
+    ]
+
+    def run(name, queries, exact_search, approximate_search) -> List[BenchmarkResults]:
+        exact_results = BenchmarkResults(f"ANN {name}: точный поиск")
+        expected = []
+        for query in queries:
+            start_time = time.time()
+            expected.append(set(exact_search(query).tolist()))
+            exact_results.add_result(time.time() - start_time)
+
+        results = [exact_results]
+        for n_probe in probes:
+            hits, total = 0, 0
+            probe_results = BenchmarkResults("")
+            for query, relevant in zip(queries, expected):
+                start_time = time.time()
+                found = set(approximate_search(query, n_probe).tolist())
+                probe_results.add_result(time.time() - start_time)
+                hits += len(found & relevant)
+                total += len(relevant)
+            recall = hits / total if total else 1.0
+            probe_results.name = f"ANN {name}: IVF n_probe={n_probe}, recall@{limit}={recall:.3f}"
+            results.append(probe_results)
+        return results
+
+    def exact_for_you(vector):
+        return top_indices(als.item_factors @ vector, limit)
+
+    def ivf_for_you(vector, n_probe):
+        indices, _ = als.ann.search(als.item_factors, vector, limit, n_probe=n_probe)
+        return indices
+
+    def exact_similar(book_id):
+        return top_indices(index.similarity_scores(book_id), limit)
+
+    def ivf_similar(book_id, n_probe):
+        candidates, scores = index.similarity_candidates(book_id, n_probe)
+        return candidates[top_indices(scores, limit)]
+
+    known_books = [book_id for book_id in book_ids if book_id in index.book_index_map]
+    return run("/for-you (ALS)", user_vectors, exact_for_you, ivf_for_you) + run(
+        "/similar (контент)", known_books, exact_similar, ivf_similar
+    )
+
+
 async def get_database_stats() -> Dict[str, Any]:
     """Получает статистику по базе данных."""
     users_count = await User.count()
@@ -250,6 +368,11 @@ async def main():
         results.append(await benchmark_content_based(engine, book_ids, iterations=50))
         results.append(await benchmark_trending(engine, iterations=30))
         results.append(await benchmark_cold_start(engine, user_ids, iterations=30))
+        all_book_ids = [
+            str(book_id) for book_id in await Book.get_motor_collection().distinct("_id")
+        ]
+        results.extend(await benchmark_data_access(all_book_ids, iterations=10))
+        results.extend(await benchmark_ann(user_ids, book_ids))
         
         end_time = datetime.now()
         total_duration = (end_time - start_time).total_seconds()